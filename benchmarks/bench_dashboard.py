@@ -0,0 +1,376 @@
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import tempfile
+import statistics
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir))
+
+from benchmarks.synthetic import generate_dataset, INFECTIONS_FILE_NAME, RECOVERIES_FILE_NAME
+from benchmarks.synthetic import VACCINATIONS_FILE_NAME, POPULATION_FILE_NAME
+from covid_dashboard.app import create_app
+from covid_dashboard.cache import SourceCache
+from covid_dashboard.data import source_loader_options, pyarrow_available
+from covid_dashboard.figures import HOME_DISPLAY_MODES
+from covid_dashboard.metrics import build_metric_cube, build_infection_modes
+from covid_dashboard.snapshot import load_sources, split_provinces
+from covid_dashboard.utils import load_config
+
+
+DEFAULT_BASELINE_PATH = os.path.join(os.path.dirname(__file__), "baseline.json")
+
+PAGE_PATHS = ("/", "/infections/", "/vaccinations/", "/about")
+
+
+# fast stages are repeated until they ran for this long, the best of a few sub-millisecond runs is mostly noise
+MIN_MEASURE_SECONDS = 0.2
+
+
+def measure(stage_function, repeats):
+    # timings without tracemalloc (it slows down allocations considerably), then traced runs for the peak
+    timings = []
+
+    while len(timings) < repeats or (sum(timings) < MIN_MEASURE_SECONDS and len(timings) < 1000):
+        start_time = time.perf_counter()
+        stage_function()
+        timings.append(time.perf_counter() - start_time)
+
+    # the peak of stages with threads (e.g. the parallel source loads) depends on how they interleave, the lowest
+    # one is what the code needs at least
+    peak_memories = []
+
+    for _ in range(repeats):
+        tracemalloc.start()
+        result = stage_function()
+        peak_memories.append(tracemalloc.get_traced_memory()[1])
+        tracemalloc.stop()
+
+    stage_result = {"best": min(timings),
+                    "median": statistics.median(timings),
+                    "peak_memory": min(peak_memories)}
+
+    # callbacks report the size of their response
+    if isinstance(result, bytes):
+        stage_result["response_bytes"] = len(result)
+
+    return stage_result
+
+
+def benchmark_config(data_directory, cache_directory, figure_cache_entries, max_points=None):
+    # the dashboard configuration with every source read from the synthetic files and nothing running in the
+    # background
+    config = load_config()
+    config["cache"]["directory"] = cache_directory
+    config["cache"]["mirror_directory"] = data_directory
+    config["cache"]["max_age"] = "0"
+    config["refresh"]["interval"] = "0"
+    config["figure_cache"]["max_entries"] = str(figure_cache_entries)
+    # repeated callbacks would be answered from the cached response bodies instead of being timed
+    config["responses"]["cache_megabytes"] = "0"
+
+    if max_points is not None:
+        config["downsampling"]["max_points"] = str(max_points)
+
+    return config
+
+
+def callback_body(outputs, inputs, changed_input=0):
+    # the (output key, JSON body) the browser posts to /_dash-update-component, outputs and inputs in the order in
+    # which the callback declares them, changed_input is the one that triggers it
+    changed_id, changed_property, _ = inputs[changed_input]
+
+    if len(outputs) == 1:
+        output_id, output_property = outputs[0]
+        output_key = f"{output_id}.{output_property}"
+        output_specs = {"id": output_id, "property": output_property}
+
+    else:
+        # multi-output callbacks are identified by all of their outputs
+        output_key = "".join(f"..{output_id}.{output_property}." for output_id, output_property in outputs) + "."
+        output_specs = [{"id": output_id, "property": output_property} for output_id, output_property in outputs]
+
+    body = {"output": output_key,
+            "outputs": output_specs,
+            "inputs": [{"id": input_id, "property": input_property, "value": value}
+                       for input_id, input_property, value in inputs],
+            "changedPropIds": [f"{changed_id}.{changed_property}"],
+            "state": []}
+
+    return output_key, body
+
+
+def callback_request(client, outputs, inputs, changed_input=0):
+    output_key, body = callback_body(outputs, inputs, changed_input)
+    response = client.post("/_dash-update-component", json=body)
+
+    if response.status_code != 200:
+        raise RuntimeError(f"Callback for '{output_key}' failed with status {response.status_code}")
+
+    return response.data
+
+
+def loader_stages(config, data_directory, country_names):
+    source_paths = {"population": os.path.join(data_directory, POPULATION_FILE_NAME),
+                    "infections": os.path.join(data_directory, INFECTIONS_FILE_NAME),
+                    "recoveries": os.path.join(data_directory, RECOVERIES_FILE_NAME),
+                    "vaccinations": os.path.join(data_directory, VACCINATIONS_FILE_NAME)}
+
+    stages = {}
+
+    for source_name, source_path in source_paths.items():
+        loader, loader_options = source_loader_options(config, source_name)
+        stages[f"load {source_name}"] = (
+            lambda loader=loader, source_path=source_path, loader_options=loader_options:
+            loader(source_path, country_names, **loader_options))
+
+        if "csv_engine" in loader_options and pyarrow_available():
+            pyarrow_options = {**loader_options, "csv_engine": "pyarrow"}
+            stages[f"load {source_name} (pyarrow)"] = (
+                lambda loader=loader, source_path=source_path, loader_options=pyarrow_options:
+                loader(source_path, country_names, **loader_options))
+
+    return stages
+
+
+def source_cache_stages(config, cache_directory, country_names):
+
+    def load_cold():
+        shutil.rmtree(cache_directory, ignore_errors=True)
+        return load_sources(config, SourceCache.from_config(config), country_names)
+
+    def load_warm():
+        source_cache = SourceCache.from_config(config)
+        source_cache.max_age = float("inf")
+
+        return load_sources(config, source_cache, country_names)
+
+    return {"load sources (cold cache)": load_cold,
+            "load sources (warm cache)": load_warm}
+
+
+def metric_stages(sources, province_tables):
+    # build_metric_cube is what the home page's quick_info used to compute, for every date instead of one
+    stages = {"quick_info (metric cube)": lambda: build_metric_cube(sources["infection_data"],
+                                                                    sources["partial_vaccination_data"],
+                                                                    sources["full_vaccination_data"],
+                                                                    sources["population_data"]),
+              "infection modes": lambda: build_infection_modes(sources["infection_data"])}
+
+    if "infection_data" in province_tables:
+        province_table = province_tables["infection_data"]
+        stages["country totals of the provinces"] = province_table.country_totals
+        stages["province infection modes"] = lambda: build_infection_modes(province_table.frame)
+
+    return stages
+
+
+def callback_stages(client, country_names, dates, selection_size):
+    selected_countries = country_names[:selection_size]
+    date_count = len(dates)
+    zoomed_range = (str(dates[-90]), str(dates[-1]))
+    stages = {}
+
+    for page_path in PAGE_PATHS:
+        stages[f"render_page {page_path}"] = (
+            lambda page_path=page_path: callback_request(client, [("page_content", "children"),
+                                                                 ("data_poll", "disabled")],
+                                                         [("page_url", "pathname", page_path),
+                                                          ("data_poll", "n_intervals", None)]))
+
+    for display_mode in HOME_DISPLAY_MODES:
+        stages[f"render_home_graph {display_mode}"] = (
+            lambda display_mode=display_mode: callback_request(client, [("map_graph", "figure")],
+                                                               [("graph_selector", "value", display_mode),
+                                                                ("date_slider", "value", date_count - 1)]))
+
+    stages["render_home_graph first date"] = (
+        lambda: callback_request(client, [("map_graph", "figure")],
+                                 [("graph_selector", "value", "fully_vaccinated"),
+                                  ("date_slider", "value", 0)]))
+
+    # the display modes of the infections and vaccinations pages are switched in the browser, the server only
+    # sends the base series for a selection or zoom
+    stages["render_infections_series"] = (
+        lambda: callback_request(client, [("infections_series", "data")],
+                                 [("country_selection", "value", selected_countries),
+                                  ("infections_graph", "relayoutData", None),
+                                  ("province_toggle", "value", [])]))
+
+    stages["render_infections_series all countries"] = (
+        lambda: callback_request(client, [("infections_series", "data")],
+                                 [("country_selection", "value", country_names),
+                                  ("infections_graph", "relayoutData", None),
+                                  ("province_toggle", "value", [])]))
+
+    # one trace per province of the selected countries
+    stages["render_infections_series provinces"] = (
+        lambda: callback_request(client, [("infections_series", "data")],
+                                 [("country_selection", "value", selected_countries),
+                                  ("infections_graph", "relayoutData", None),
+                                  ("province_toggle", "value", ["provinces"])],
+                                 changed_input=2))
+
+    # zooming in on the last 90 days
+    stages["render_infections_series zoomed"] = (
+        lambda: callback_request(client, [("infections_series", "data")],
+                                 [("country_selection", "value", selected_countries),
+                                  ("infections_graph", "relayoutData", {"xaxis.range[0]": zoomed_range[0],
+                                                                        "xaxis.range[1]": zoomed_range[1]}),
+                                  ("province_toggle", "value", [])],
+                                 changed_input=1))
+
+    stages["render_vaccine_series"] = (
+        lambda: callback_request(client, [("vaccine_series", "data")],
+                                 [("country_selection", "value", selected_countries),
+                                  ("vaccine_graph", "relayoutData", None)]))
+
+    return stages
+
+
+def compare_with_baseline(results, baseline, tolerance):
+    # stages that got slower (or need more memory) than the baseline by more than the tolerance
+    regressions = []
+
+    if baseline["parameters"] != results["parameters"]:
+        print("Warning: the baseline was recorded with different parameters: "
+              f"{baseline['parameters']} vs. {results['parameters']}")
+
+    print(f"\n{'stage':<45}{'best':>10}{'baseline':>10}{'ratio':>8}{'peak MB':>10}{'baseline':>10}")
+
+    for stage_name, stage_result in results["stages"].items():
+        baseline_result = baseline["stages"].get(stage_name)
+
+        if baseline_result is None:
+            print(f"{stage_name:<45}{stage_result['best']:>10.4f}{'-':>10}{'-':>8}"
+                  f"{stage_result['peak_memory'] / 1e6:>10.1f}{'-':>10}")
+            continue
+
+        time_ratio = stage_result["best"] / baseline_result["best"] if baseline_result["best"] else 1.0
+        memory_ratio = (stage_result["peak_memory"] / baseline_result["peak_memory"]
+                        if baseline_result["peak_memory"] else 1.0)
+
+        print(f"{stage_name:<45}{stage_result['best']:>10.4f}{baseline_result['best']:>10.4f}{time_ratio:>8.2f}"
+              f"{stage_result['peak_memory'] / 1e6:>10.1f}{baseline_result['peak_memory'] / 1e6:>10.1f}")
+
+        if time_ratio > 1 + tolerance:
+            regressions.append(f"{stage_name}: {time_ratio:.2f}x the baseline time")
+
+        if memory_ratio > 1 + tolerance:
+            regressions.append(f"{stage_name}: {memory_ratio:.2f}x the baseline peak memory")
+
+    return regressions
+
+
+def print_results(results):
+    print(f"\n{'stage':<45}{'best':>10}{'median':>10}{'peak MB':>10}{'bytes':>10}")
+
+    for stage_name, stage_result in results["stages"].items():
+        print(f"{stage_name:<45}{stage_result['best']:>10.4f}{stage_result['median']:>10.4f}"
+              f"{stage_result['peak_memory'] / 1e6:>10.1f}{stage_result.get('response_bytes', ''):>10}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the loaders, metrics and callbacks on synthetic data")
+    parser.add_argument("--countries", type=int, default=40)
+    parser.add_argument("--days", type=int, default=800)
+    parser.add_argument("--provinces", type=int, default=3, help="provinces per country that reports provinces")
+    parser.add_argument("--province-share", type=float, default=0.1)
+    parser.add_argument("--population-years", type=int, default=3)
+    parser.add_argument("--selection-size", type=int, default=10,
+                        help="number of countries selected on the infections and vaccinations pages")
+    parser.add_argument("--figure-cache-entries", type=int, default=0,
+                        help="figure cache size during the callback benchmarks, 0 times every figure build")
+    parser.add_argument("--max-points", type=int,
+                        help="point budget per time series trace, defaults to the one in dashboard.cfg")
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--data-directory", help="write the synthetic files to this directory and keep them")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE_PATH)
+    parser.add_argument("--save-baseline", action="store_true", help="store the results as the new baseline")
+    parser.add_argument("--tolerance", type=float, default=0.25,
+                        help="relative slowdown or memory growth that counts as a regression")
+    parser.add_argument("--output", help="also write the results to this JSON file")
+    arguments = parser.parse_args()
+
+    parameters = {"countries": arguments.countries,
+                  "days": arguments.days,
+                  "provinces": arguments.provinces,
+                  "province_share": arguments.province_share,
+                  "population_years": arguments.population_years,
+                  "selection_size": arguments.selection_size,
+                  "figure_cache_entries": arguments.figure_cache_entries,
+                  "max_points": arguments.max_points}
+
+    with tempfile.TemporaryDirectory() as temporary_directory:
+        data_directory = arguments.data_directory or os.path.join(temporary_directory, "data")
+        cache_directory = os.path.join(temporary_directory, "cache")
+
+        start_time = time.perf_counter()
+        country_names = generate_dataset(data_directory, arguments.countries, arguments.days, arguments.provinces,
+                                         arguments.province_share, arguments.population_years)
+        print(f"Generated {len(country_names)} countries x {arguments.days} days in "
+              f"{time.perf_counter() - start_time:.1f}s")
+
+        config = benchmark_config(data_directory, cache_directory, arguments.figure_cache_entries,
+                                  arguments.max_points)
+        stages = {}
+
+        for stage_name, stage_function in loader_stages(config, data_directory, country_names).items():
+            stages[stage_name] = measure(stage_function, arguments.repeats)
+
+        for stage_name, stage_function in source_cache_stages(config, cache_directory, country_names).items():
+            stages[stage_name] = measure(stage_function, arguments.repeats)
+
+        sources, _, _ = load_sources(config, SourceCache.from_config(config), country_names)
+
+        for stage_name, stage_function in metric_stages(*split_provinces(sources)).items():
+            stages[stage_name] = measure(stage_function, arguments.repeats)
+
+        # the app registers its callbacks globally, so it is only created once
+        start_time = time.perf_counter()
+        app = create_app(config=config, supported_countries=country_names)
+        startup_time = time.perf_counter() - start_time
+        stages["create_app (warm cache)"] = {"best": startup_time, "median": startup_time, "peak_memory": 0}
+
+        client = app.server.test_client()
+        dates = app.snapshot_store.current.metric_cube.dates
+
+        for stage_name, stage_function in callback_stages(client, country_names, dates,
+                                                          arguments.selection_size).items():
+            stages[stage_name] = measure(stage_function, arguments.repeats)
+
+    results = {"parameters": parameters, "stages": stages}
+    print_results(results)
+
+    if arguments.output:
+        with open(arguments.output, "w") as output_file:
+            json.dump(results, output_file, indent=4)
+
+    if arguments.save_baseline:
+        with open(arguments.baseline, "w") as baseline_file:
+            json.dump(results, baseline_file, indent=4)
+
+        print(f"\nSaved the baseline to {arguments.baseline}")
+        return
+
+    if not os.path.exists(arguments.baseline):
+        print(f"\nNo baseline at {arguments.baseline}, run with --save-baseline to record one")
+        return
+
+    with open(arguments.baseline, "r") as baseline_file:
+        baseline = json.load(baseline_file)
+
+    regressions = compare_with_baseline(results, baseline, arguments.tolerance)
+
+    if regressions:
+        print("\nRegressions:\n" + "\n".join(regressions))
+        sys.exit(1)
+
+    print("\nNo regressions")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,132 @@
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+from operator import itemgetter
+from functools import partial
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir))
+
+from benchmarks.synthetic import dashboard_country_names, province_rows, write_govex_vaccinations
+from covid_dashboard.data import load_govex_vaccinations
+from covid_dashboard.utils import CONFIG_DIRECTORY, load_country_aliases
+
+
+def format_date_string(date_string, string_delimiter="-"):
+    year, month, day = date_string.split(string_delimiter)
+    reformatted_date = f"{day.zfill(2)}/{month.zfill(2)}/{year[-2:]}"
+
+    return reformatted_date
+
+
+def legacy_load_vaccination_data(vaccinations_url, supported_countries):
+    # the per-country OrderedDict/concat implementation that load_vaccination_data replaced, kept as reference
+
+    vaccination_data = pd.read_csv(vaccinations_url)
+    vaccination_data.loc[vaccination_data.loc[:, "Country_Region"] == "Czechia", "Country_Region"] = 'Czech Republic'
+    vaccination_data.loc[
+        vaccination_data.loc[:, "Country_Region"] == "Moldova", "Country_Region"] = 'Republic of Moldova'
+    vaccination_data.loc[vaccination_data.loc[:, "Country_Region"] == "Russia", "Country_Region"] = 'Russian Federation'
+
+    reduced_vaccination_data = vaccination_data.loc[vaccination_data.loc[:, "Country_Region"].isin(supported_countries)]
+    reduced_vaccination_data = reduced_vaccination_data.groupby(["Country_Region", "Date"])[
+        ["People_partially_vaccinated", "People_fully_vaccinated"]].sum()
+
+    partial_vaccination_data_frames = []
+    full_vaccination_data_frames = []
+
+    for country in supported_countries:
+        country_data = reduced_vaccination_data.loc[reduced_vaccination_data.index.get_level_values(0) == country]
+
+        country_dates = [format_date_string(date) for date in country_data.index.get_level_values(1)]
+
+        partial_vaccinations = country_data.loc[:, "People_partially_vaccinated"].to_numpy()
+        full_vaccinations = country_data.loc[:, "People_fully_vaccinated"].to_numpy()
+
+        country_name = (("Country/Region", pd.Series([country])),)
+        partial_vaccination_data = tuple((date_string, pd.Series([partial_doses])) for date_string, partial_doses in
+                                         zip(country_dates, partial_vaccinations))
+        full_vaccination_data = tuple(
+            (date_string, pd.Series([full_doses])) for date_string, full_doses in zip(country_dates, full_vaccinations))
+
+        partial_vaccinations = OrderedDict(country_name + partial_vaccination_data)
+        country_partial_vaccinations = pd.DataFrame(partial_vaccinations)
+        partial_vaccination_data_frames.append(country_partial_vaccinations)
+
+        full_vaccinations = OrderedDict(country_name + full_vaccination_data)
+        country_full_vaccinations = pd.DataFrame(full_vaccinations)
+        full_vaccination_data_frames.append(country_full_vaccinations)
+
+    partial_vaccination_data = pd.concat(partial_vaccination_data_frames, ignore_index=True)
+    full_vaccination_data = pd.concat(full_vaccination_data_frames, ignore_index=True)
+    sorted_dates = sorted(partial_vaccination_data.columns, key=itemgetter(6, 7, 3, 4, 0, 1))
+
+    partial_vaccination_data = partial_vaccination_data.loc[:, sorted_dates]
+    partial_vaccination_data = partial_vaccination_data.groupby("Country/Region").sum()
+    partial_vaccination_data = partial_vaccination_data.astype(int)
+
+    full_vaccination_data = full_vaccination_data.loc[:, sorted_dates]
+    full_vaccination_data = full_vaccination_data.groupby("Country/Region").sum()
+    full_vaccination_data = full_vaccination_data.astype(int)
+
+    return partial_vaccination_data, full_vaccination_data
+
+
+def time_loader(loader, file_path, supported_countries, repeats):
+    timings = []
+
+    for _ in range(repeats):
+        start_time = time.perf_counter()
+        result = loader(file_path, supported_countries)
+        timings.append(time.perf_counter() - start_time)
+
+    return min(timings), result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare the vectorized vaccination reshaping with the legacy loop")
+    parser.add_argument("--days", type=int, default=800, help="days since the first JHU report (2020-01-22)")
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--global-countries", type=int, default=200,
+                        help="number of countries in the synthetic global file")
+    arguments = parser.parse_args()
+
+    with open(os.path.join(CONFIG_DIRECTORY, "supported_countries.json"), "r") as country_file:
+        supported_countries = json.load(country_file)["countries"]
+
+    global_countries = dashboard_country_names(max(arguments.global_countries, len(supported_countries)))
+
+    scenarios = [("supported countries", supported_countries),
+                 ("all countries", global_countries)]
+
+    with tempfile.TemporaryDirectory() as temporary_directory:
+        file_path = os.path.join(temporary_directory, "time_series_covid19_vaccine_global.csv")
+        write_govex_vaccinations(file_path, province_rows(global_countries, 0, 0), arguments.days,
+                                 np.random.default_rng(0))
+
+        for scenario_name, selected_countries in scenarios:
+
+            legacy_time, legacy_result = time_loader(legacy_load_vaccination_data, file_path, selected_countries,
+                                                     arguments.repeats)
+            vectorized_time, vectorized_result = time_loader(partial(load_govex_vaccinations,
+                                                                     country_aliases=load_country_aliases()),
+                                                             file_path, selected_countries, arguments.repeats)
+
+            for legacy_frame, vectorized_frame in zip(legacy_result, vectorized_result):
+                # the legacy loader labels the dates with dd/mm/yy strings
+                legacy_frame.columns = pd.to_datetime(legacy_frame.columns, format="%d/%m/%y")
+                pd.testing.assert_frame_equal(legacy_frame, vectorized_frame)
+
+            print(f"{scenario_name:>20} ({len(selected_countries)} countries x {arguments.days} days): "
+                  f"legacy {legacy_time:.3f}s, vectorized {vectorized_time:.3f}s, "
+                  f"speedup {legacy_time / vectorized_time:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,554 @@
+import os
+import sys
+import json
+import time
+import random
+import socket
+import argparse
+import tempfile
+import threading
+import statistics
+import subprocess
+import http.client
+import importlib.util
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir))
+
+import pandas as pd
+
+from benchmarks.bench_dashboard import benchmark_config, callback_body
+from benchmarks.synthetic import generate_dataset
+from covid_dashboard.figures import HOME_DISPLAY_MODES
+from covid_dashboard.utils import load_config
+
+
+REPOSITORY_DIRECTORY = os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir))
+
+# read by create_server in the gunicorn workers
+SETTINGS_VARIABLE = "COVID_DASHBOARD_LOAD_TEST"
+
+PERCENTILES = (50, 95, 99)
+
+
+def load_test_config(settings):
+    config = benchmark_config(settings["data_directory"], settings["cache_directory"],
+                              settings["figure_cache_entries"], settings["max_points"])
+    config["shared_snapshot"]["directory"] = settings["shared_directory"]
+    config["shared_snapshot"]["poll_interval"] = "0"
+    # unlike the benchmarks, the load test keeps answering repeated callbacks from the response cache
+    config["responses"]["cache_megabytes"] = load_config()["responses"].get("cache_megabytes", "64")
+
+    return config
+
+
+def create_server():
+    # the gunicorn app of the load test, "benchmarks.load_test:create_server()": the dashboard on the synthetic files,
+    # attached to the snapshot the harness published (or with its own copy of the data with --no-shared)
+    from covid_dashboard.app import create_app
+
+    settings = json.loads(os.environ[SETTINGS_VARIABLE])
+
+    return create_app(attach_shared_snapshot=settings["shared"], config=load_test_config(settings),
+                      supported_countries=settings["country_names"]).server
+
+
+def free_port():
+    with socket.socket() as probe_socket:
+        probe_socket.bind(("127.0.0.1", 0))
+        return probe_socket.getsockname()[1]
+
+
+def start_server(settings, workers, threads, port, working_directory):
+    # gunicorn reads a gunicorn.conf.py from its working directory, the repository's one would publish the real data
+    environment = {**os.environ,
+                   SETTINGS_VARIABLE: json.dumps(settings),
+                   "PYTHONPATH": os.pathsep.join(filter(None, [REPOSITORY_DIRECTORY, os.environ.get("PYTHONPATH")]))}
+
+    return subprocess.Popen([sys.executable, "-m", "gunicorn",
+                             "--bind", f"127.0.0.1:{port}",
+                             "--workers", str(workers),
+                             "--threads", str(threads),
+                             "--timeout", "120",
+                             "--log-level", "warning",
+                             "benchmarks.load_test:create_server()"],
+                            cwd=working_directory, env=environment)
+
+
+def wait_until_ready(server_process, port, timeout):
+    deadline = time.monotonic() + timeout
+
+    while time.monotonic() < deadline:
+        if server_process.poll() is not None:
+            raise RuntimeError(f"The server exited with status {server_process.returncode}")
+
+        try:
+            connection = http.client.HTTPConnection("127.0.0.1", port, timeout=5)
+            connection.request("GET", "/health/ready")
+
+            if connection.getresponse().status == 200:
+                return
+
+        except OSError:
+            pass
+
+        time.sleep(0.2)
+
+    raise RuntimeError(f"The server was not ready after {timeout}s")
+
+
+def worker_pids(server_pid):
+    # the gunicorn workers are the children of the master process
+    child_pids = []
+
+    for entry in os.listdir("/proc"):
+        if not entry.isdigit():
+            continue
+
+        try:
+            with open(f"/proc/{entry}/status", "r") as status_file:
+                for line in status_file:
+                    if line.startswith("PPid:"):
+                        if int(line.split()[1]) == server_pid:
+                            child_pids.append(int(entry))
+
+                        break
+
+        except OSError:
+            continue
+
+    return sorted(child_pids)
+
+
+def process_memory(pid):
+    # (rss, pss) in bytes. The workers map the same published snapshot, so their RSS counts the shared pages in full
+    # and the PSS only their share of them
+    memory = {}
+
+    for file_name in ("smaps_rollup", "status"):
+        try:
+            with open(f"/proc/{pid}/{file_name}", "r") as memory_file:
+                for line in memory_file:
+                    field, _, value = line.partition(":")
+
+                    if field in ("Rss", "VmRSS", "Pss"):
+                        memory.setdefault("Pss" if field == "Pss" else "Rss", int(value.split()[0]) * 1024)
+
+        except OSError:
+            continue
+
+    return memory.get("Rss"), memory.get("Pss")
+
+
+class MemorySampler:
+    # peak RSS and PSS of every worker while the load test runs
+
+    def __init__(self, server_pid, interval=0.5):
+        self.server_pid = server_pid
+        self.interval = interval
+        self.peaks = {}
+
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+        self.sample()
+
+        return self.peaks
+
+    def sample(self):
+        for pid in worker_pids(self.server_pid):
+            rss, pss = process_memory(pid)
+            peak_rss, peak_pss = self.peaks.get(pid, (0, 0))
+            self.peaks[pid] = (max(peak_rss, rss or 0), max(peak_pss, pss or 0))
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.sample()
+
+
+def callback_step(step_name, outputs, inputs, changed_input=0):
+    _, body = callback_body(outputs, inputs, changed_input)
+
+    return step_name, "POST", "/_dash-update-component", json.dumps(body)
+
+
+def page_step(page_path):
+    return callback_step(f"render_page {page_path}", [("page_content", "children"), ("data_poll", "disabled")],
+                         [("page_url", "pathname", page_path), ("data_poll", "n_intervals", None)])
+
+
+def zoomed_range(random_generator, dates):
+    # the relayoutData of dragging a range of 30 to 180 days on the x-axis
+    day_count = min(random_generator.randint(30, 180), len(dates) - 1)
+    start_position = random_generator.randrange(0, len(dates) - day_count)
+
+    return {"xaxis.range[0]": str(dates[start_position]), "xaxis.range[1]": str(dates[start_position + day_count])}
+
+
+def growing_selections(random_generator, country_names, default_country, max_selection):
+    # the values of the country dropdown while a user adds countries one by one, starting with the layout's default
+    selection_size = random_generator.randint(1, max_selection)
+    other_countries = [country for country in country_names if country != default_country]
+    selection = [default_country]
+    selections = [default_country]
+
+    for country in random_generator.sample(other_countries, min(selection_size - 1, len(other_countries))):
+        selection = selection + [country]
+        selections.append(selection)
+
+    return selections
+
+
+def home_steps(random_generator, dates):
+    steps = [page_step("/"),
+             callback_step("render_home_graph", [("map_graph", "figure")],
+                           [("graph_selector", "value", "fully_vaccinated"),
+                            ("date_slider", "value", len(dates) - 1)])]
+
+    display_mode = "fully_vaccinated"
+    date_position = len(dates) - 1
+
+    for _ in range(random_generator.randint(1, 5)):
+        # mostly switching the map mode, now and then dragging the date slider
+        if random_generator.random() < 0.25:
+            date_position = random_generator.randrange(len(dates))
+            changed_input = 1
+
+        else:
+            display_mode = random_generator.choice(HOME_DISPLAY_MODES)
+            changed_input = 0
+
+        steps.append(callback_step("render_home_graph", [("map_graph", "figure")],
+                                   [("graph_selector", "value", display_mode),
+                                    ("date_slider", "value", date_position)], changed_input))
+
+    return steps
+
+
+def infection_steps(random_generator, country_names, default_country, dates, max_selection):
+    steps = [page_step("/infections/")]
+    selection = default_country
+
+    for selection in growing_selections(random_generator, country_names, default_country, max_selection):
+        steps.append(callback_step("render_infections_series", [("infections_series", "data")],
+                                   [("country_selection", "value", selection),
+                                    ("infections_graph", "relayoutData", None),
+                                    ("province_toggle", "value", [])]))
+
+    province_toggle = []
+
+    if random_generator.random() < 0.2:
+        province_toggle = ["provinces"]
+        steps.append(callback_step("render_infections_series provinces", [("infections_series", "data")],
+                                   [("country_selection", "value", selection),
+                                    ("infections_graph", "relayoutData", None),
+                                    ("province_toggle", "value", province_toggle)], 2))
+
+    if random_generator.random() < 0.3:
+        steps.append(callback_step("render_infections_series zoomed", [("infections_series", "data")],
+                                   [("country_selection", "value", selection),
+                                    ("infections_graph", "relayoutData", zoomed_range(random_generator, dates)),
+                                    ("province_toggle", "value", province_toggle)], 1))
+
+    return steps
+
+
+def vaccination_steps(random_generator, country_names, default_country, dates, max_selection):
+    steps = [page_step("/vaccinations/")]
+    selection = default_country
+
+    for selection in growing_selections(random_generator, country_names, default_country, max_selection):
+        steps.append(callback_step("render_vaccine_series", [("vaccine_series", "data")],
+                                   [("country_selection", "value", selection),
+                                    ("vaccine_graph", "relayoutData", None)]))
+
+    if random_generator.random() < 0.3:
+        steps.append(callback_step("render_vaccine_series zoomed", [("vaccine_series", "data")],
+                                   [("country_selection", "value", selection),
+                                    ("vaccine_graph", "relayoutData", zoomed_range(random_generator, dates))], 1))
+
+    return steps
+
+
+def session_steps(random_generator, country_names, dates, max_selection):
+    # one visit: the app shell, then the home, infections and vaccinations pages in a random order and sometimes
+    # the about page. The clientside callbacks (titles, display modes of the graphs) never reach the server
+    default_country = "Austria" if "Austria" in country_names else country_names[0]
+
+    steps = [("index", "GET", "/", None),
+             ("_dash-layout", "GET", "/_dash-layout", None),
+             ("_dash-dependencies", "GET", "/_dash-dependencies", None)]
+
+    page_visits = [lambda: home_steps(random_generator, dates),
+                   lambda: infection_steps(random_generator, country_names, default_country, dates, max_selection),
+                   lambda: vaccination_steps(random_generator, country_names, default_country, dates, max_selection)]
+    random_generator.shuffle(page_visits)
+
+    for page_visit in page_visits:
+        steps += page_visit()
+
+    if random_generator.random() < 0.2:
+        steps.append(page_step("/about"))
+
+    return steps
+
+
+def simulate_user(port, user_number, deadline, arguments, country_names, dates, results, results_lock):
+    # sessions one after the other until the deadline, on one keep-alive connection like a browser tab
+    random_generator = random.Random(arguments.seed * 100_003 + user_number)
+    connection = http.client.HTTPConnection("127.0.0.1", port, timeout=arguments.request_timeout)
+    headers = {"Content-Type": "application/json", "Accept-Encoding": "gzip, deflate, br"}
+
+    samples = []
+    errors = []
+    session_count = 0
+
+    while time.monotonic() < deadline:
+        for step_name, method, path, body in session_steps(random_generator, country_names, dates,
+                                                           arguments.max_selection):
+            if time.monotonic() >= deadline:
+                break
+
+            start_time = time.perf_counter()
+
+            try:
+                connection.request(method, path, body=body, headers=headers)
+                response = connection.getresponse()
+                response_bytes = len(response.read())
+                status = response.status
+
+            except (OSError, http.client.HTTPException) as error:
+                connection.close()
+                errors.append((step_name, repr(error)))
+                continue
+
+            latency = time.perf_counter() - start_time
+
+            # 204 is a callback that raised PreventUpdate
+            if status not in (200, 204, 304):
+                errors.append((step_name, f"status {status}"))
+                continue
+
+            samples.append((step_name, latency, response_bytes))
+
+            if arguments.think_time > 0:
+                time.sleep(random_generator.expovariate(1 / arguments.think_time))
+
+        else:
+            session_count += 1
+
+    connection.close()
+
+    with results_lock:
+        results["samples"] += samples
+        results["errors"] += errors
+        results["sessions"] += session_count
+
+
+def latency_summary(latencies):
+    if len(latencies) < 2:
+        percentiles = {percentile: latencies[0] if latencies else 0.0 for percentile in PERCENTILES}
+
+    else:
+        quantiles = statistics.quantiles(latencies, n=100, method="inclusive")
+        percentiles = {percentile: quantiles[percentile - 1] for percentile in PERCENTILES}
+
+    return {"count": len(latencies), **{f"p{percentile}": value for percentile, value in percentiles.items()}}
+
+
+def run_load_test(settings, workers, threads, concurrency, arguments, working_directory):
+    port = free_port()
+    server_process = start_server(settings, workers, threads, port, working_directory)
+
+    try:
+        wait_until_ready(server_process, port, arguments.startup_timeout)
+
+        connection = http.client.HTTPConnection("127.0.0.1", port)
+        connection.request("GET", "/api/series/metrics")
+        description = json.loads(connection.getresponse().read())
+        connection.close()
+
+        dates = pd.date_range(description["first_date"], description["last_date"])
+        idle_memory = {pid: process_memory(pid) for pid in worker_pids(server_process.pid)}
+
+        memory_sampler = MemorySampler(server_process.pid)
+        memory_sampler.start()
+
+        results = {"samples": [], "errors": [], "sessions": 0}
+        results_lock = threading.Lock()
+
+        start_time = time.perf_counter()
+        deadline = time.monotonic() + arguments.duration
+        users = [threading.Thread(target=simulate_user,
+                                  args=(port, user_number, deadline, arguments, settings["country_names"], dates,
+                                        results, results_lock))
+                 for user_number in range(concurrency)]
+
+        for user in users:
+            user.start()
+
+        for user in users:
+            user.join()
+
+        elapsed_time = time.perf_counter() - start_time
+        peak_memory = memory_sampler.stop()
+
+    finally:
+        server_process.terminate()
+        server_process.wait()
+
+    latencies_by_step = {}
+
+    for step_name, latency, _ in results["samples"]:
+        latencies_by_step.setdefault(step_name, []).append(latency)
+
+    return {"workers": workers,
+            "threads": threads,
+            "concurrency": concurrency,
+            "elapsed": elapsed_time,
+            "requests": len(results["samples"]),
+            "errors": len(results["errors"]),
+            "error_examples": sorted(set(error for _, error in results["errors"]))[:5],
+            "sessions": results["sessions"],
+            "throughput": len(results["samples"]) / elapsed_time,
+            "response_bytes": sum(response_bytes for _, _, response_bytes in results["samples"]),
+            "latency": latency_summary([latency for _, latency, _ in results["samples"]]),
+            "steps": {step_name: latency_summary(latencies)
+                      for step_name, latencies in sorted(latencies_by_step.items())},
+            "memory": {str(pid): {"idle_rss": idle_memory.get(pid, (None, None))[0],
+                                  "idle_pss": idle_memory.get(pid, (None, None))[1],
+                                  "peak_rss": rss,
+                                  "peak_pss": pss}
+                       for pid, (rss, pss) in sorted(peak_memory.items())}}
+
+
+def _megabytes(value):
+    return f"{value / 1e6:.1f}" if value else "-"
+
+
+def print_run(run):
+    print(f"\n{run['workers']} workers x {run['threads']} threads, {run['concurrency']} concurrent users: "
+          f"{run['requests']} requests in {run['elapsed']:.1f}s ({run['throughput']:.1f} requests/s, "
+          f"{run['sessions']} complete sessions, {run['errors']} errors)")
+
+    for error in run["error_examples"]:
+        print(f"  error: {error}")
+
+    print(f"\n{'step':<45}{'count':>8}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+
+    for step_name, summary in [*run["steps"].items(), ("all requests", run["latency"])]:
+        print(f"{step_name:<45}{summary['count']:>8}{summary['p50'] * 1000:>10.1f}{summary['p95'] * 1000:>10.1f}"
+              f"{summary['p99'] * 1000:>10.1f}")
+
+    print(f"\n{'worker':<10}{'idle RSS MB':>14}{'peak RSS MB':>14}{'idle PSS MB':>14}{'peak PSS MB':>14}")
+
+    for pid, memory in run["memory"].items():
+        print(f"{pid:<10}{_megabytes(memory['idle_rss']):>14}{_megabytes(memory['peak_rss']):>14}"
+              f"{_megabytes(memory['idle_pss']):>14}{_megabytes(memory['peak_pss']):>14}")
+
+
+def print_summary(runs):
+    print(f"\n{'workers':>8}{'threads':>8}{'users':>8}{'req/s':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}"
+          f"{'errors':>8}{'PSS MB':>10}")
+
+    for run in runs:
+        total_pss = sum(memory["peak_pss"] or 0 for memory in run["memory"].values())
+
+        print(f"{run['workers']:>8}{run['threads']:>8}{run['concurrency']:>8}{run['throughput']:>10.1f}"
+              f"{run['latency']['p50'] * 1000:>10.1f}{run['latency']['p95'] * 1000:>10.1f}"
+              f"{run['latency']['p99'] * 1000:>10.1f}{run['errors']:>8}{_megabytes(total_pss):>10}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay concurrent user sessions against the dashboard served by "
+                                                 "gunicorn on synthetic data")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4],
+                        help="gunicorn worker counts, every one is tested with every concurrency")
+    parser.add_argument("--threads", type=int, default=1, help="threads per worker (gthread workers above 1)")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[8],
+                        help="numbers of simultaneous users")
+    parser.add_argument("--duration", type=float, default=30, help="seconds per run")
+    parser.add_argument("--think-time", type=float, default=0.0,
+                        help="mean pause of a user between two requests in seconds, 0 for back to back requests")
+    parser.add_argument("--max-selection", type=int, default=8,
+                        help="largest number of countries a user selects on the infections and vaccinations pages")
+    parser.add_argument("--countries", type=int, default=40)
+    parser.add_argument("--days", type=int, default=800)
+    parser.add_argument("--provinces", type=int, default=3, help="provinces per country that reports provinces")
+    parser.add_argument("--province-share", type=float, default=0.1)
+    parser.add_argument("--figure-cache-entries", type=int,
+                        help="figure cache size per worker, defaults to the one in dashboard.cfg")
+    parser.add_argument("--max-points", type=int,
+                        help="point budget per time series trace, defaults to the one in dashboard.cfg")
+    parser.add_argument("--no-shared", action="store_true",
+                        help="every worker loads its own copy of the data instead of mapping a published snapshot")
+    parser.add_argument("--data-directory", help="write the synthetic files to this directory and keep them")
+    parser.add_argument("--seed", type=int, default=0, help="seed of the simulated sessions")
+    parser.add_argument("--request-timeout", type=float, default=60)
+    parser.add_argument("--startup-timeout", type=float, default=120)
+    parser.add_argument("--output", help="also write the results to this JSON file")
+    arguments = parser.parse_args()
+
+    if importlib.util.find_spec("gunicorn") is None:
+        sys.exit("The load test serves the dashboard with gunicorn, install it with `pip install gunicorn`")
+
+    if not os.path.isdir("/proc"):
+        print("Warning: /proc is not available, the memory of the workers is not reported")
+
+    figure_cache_entries = arguments.figure_cache_entries
+
+    if figure_cache_entries is None:
+        figure_cache_entries = load_config()["figure_cache"].getint("max_entries", 256)
+
+    with tempfile.TemporaryDirectory() as temporary_directory:
+        data_directory = arguments.data_directory or os.path.join(temporary_directory, "data")
+
+        start_time = time.perf_counter()
+        country_names = generate_dataset(data_directory, arguments.countries, arguments.days, arguments.provinces,
+                                         arguments.province_share)
+        print(f"Generated {len(country_names)} countries x {arguments.days} days in "
+              f"{time.perf_counter() - start_time:.1f}s")
+
+        settings = {"data_directory": os.path.abspath(data_directory),
+                    "cache_directory": os.path.join(temporary_directory, "cache"),
+                    "shared_directory": os.path.join(temporary_directory, "shared"),
+                    "figure_cache_entries": figure_cache_entries,
+                    "max_points": arguments.max_points,
+                    "shared": not arguments.no_shared,
+                    "country_names": country_names}
+
+        if settings["shared"]:
+            # what gunicorn.conf.py does before the workers start: load the data once and publish it
+            from covid_dashboard.cache import SourceCache
+            from covid_dashboard.shared import publish_snapshot
+            from covid_dashboard.snapshot import SnapshotStore
+
+            config = load_test_config(settings)
+            os.makedirs(settings["shared_directory"], exist_ok=True)
+            snapshot_store = SnapshotStore(config, SourceCache.from_config(config), country_names)
+            publish_snapshot(snapshot_store.current, settings["shared_directory"])
+            snapshot_store.stop()
+
+        runs = []
+
+        for workers in arguments.workers:
+            for concurrency in arguments.concurrency:
+                run = run_load_test(settings, workers, arguments.threads, concurrency, arguments, temporary_directory)
+                print_run(run)
+                runs.append(run)
+
+    print_summary(runs)
+
+    if arguments.output:
+        with open(arguments.output, "w") as output_file:
+            json.dump({"parameters": {key: value for key, value in vars(arguments).items() if key != "output"},
+                       "runs": runs}, output_file, indent=4)
+
+
+if __name__ == "__main__":
+    main()
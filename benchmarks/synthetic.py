@@ -0,0 +1,187 @@
+import os
+import sys
+import json
+import zipfile
+import argparse
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir))
+
+from covid_dashboard.utils import CONFIG_DIRECTORY
+
+
+# Synthetic stand-ins for the upstream files, written in the exact upstream layouts and file names so that a
+# directory of them can be used as the [cache] mirror_directory.
+
+INFECTIONS_FILE_NAME = "time_series_covid19_confirmed_global.csv"
+RECOVERIES_FILE_NAME = "time_series_covid19_recovered_global.csv"
+DEATHS_FILE_NAME = "time_series_covid19_deaths_global.csv"
+VACCINATIONS_FILE_NAME = "time_series_covid19_vaccine_global.csv"
+POPULATION_FILE_NAME = "WPP2022_PopulationBySingleAgeSex_Medium_1950-2021.zip"
+
+FIRST_REPORTED_DATE = "2020-01-22"
+FIRST_VACCINATION_DATE = "2020-12-14"
+
+# supported country names as they are spelled in the JHU/GovEx and in the UN files
+JHU_COUNTRY_NAMES = {"Czech Republic": "Czechia", "Republic of Moldova": "Moldova", "Russian Federation": "Russia"}
+UN_COUNTRY_NAMES = {"Czech Republic": "Czechia"}
+
+UN_COLUMNS = ["SortOrder", "LocID", "Notes", "ISO3_code", "ISO2_code", "SDMX_code", "LocTypeID", "LocTypeName",
+              "ParentID", "Location", "VarID", "Variant", "Time", "MidPeriod", "AgeGrp", "AgeGrpStart", "AgeGrpSpan",
+              "PopMale", "PopFemale", "PopTotal"]
+
+
+def dashboard_country_names(country_count):
+    # the supported countries first, then made up ones up to the requested count
+    with open(os.path.join(CONFIG_DIRECTORY, "supported_countries.json"), "r") as country_file:
+        supported_countries = json.load(country_file)["countries"]
+
+    extra_countries = [f"Country {number:03d}" for number in range(max(country_count - len(supported_countries), 0))]
+
+    return (supported_countries + extra_countries)[:country_count]
+
+
+def province_rows(country_names, provinces_per_country, province_share):
+    # (country, province) pairs: like France or the United Kingdom, every n-th country reports a mainland row
+    # without a province plus a few provinces
+    province_interval = max(int(round(1 / province_share)), 1) if province_share > 0 else None
+    rows = []
+
+    for country_position, country in enumerate(country_names):
+        rows.append((country, np.nan))
+
+        if province_interval is not None and country_position % province_interval == 0:
+            rows.extend((country, f"{country} Province {number}") for number in range(provinces_per_country))
+
+    return rows
+
+
+def write_jhu_time_series(file_path, rows, day_count, daily_scale, random_generator):
+    dates = pd.date_range(FIRST_REPORTED_DATE, periods=day_count)
+    date_columns = [f"{date.month}/{date.day}/{date.strftime('%y')}" for date in dates]
+
+    daily_values = random_generator.integers(0, daily_scale, size=(len(rows), day_count))
+
+    time_series = pd.DataFrame(np.cumsum(daily_values, axis=1), columns=date_columns)
+    time_series.insert(0, "Province/State", [province for _, province in rows])
+    time_series.insert(1, "Country/Region", [JHU_COUNTRY_NAMES.get(country, country) for country, _ in rows])
+    time_series.insert(2, "Lat", random_generator.uniform(-60, 70, len(rows)).round(4))
+    time_series.insert(3, "Long", random_generator.uniform(-180, 180, len(rows)).round(4))
+
+    time_series.to_csv(file_path, index=False)
+
+
+def write_govex_vaccinations(file_path, rows, day_count, random_generator, missing_share=0.03):
+    first_reported_date = pd.Timestamp(FIRST_REPORTED_DATE)
+    vaccination_dates = pd.date_range(FIRST_VACCINATION_DATE,
+                                      first_reported_date + pd.Timedelta(days=day_count - 1))
+
+    if len(vaccination_dates) == 0:
+        vaccination_dates = pd.date_range(first_reported_date, periods=day_count)
+
+    date_strings = vaccination_dates.strftime("%Y-%m-%d").to_numpy()
+    frames = []
+
+    for row_number, (country, province) in enumerate(rows):
+        reported_days = np.flatnonzero(random_generator.random(len(date_strings)) >= missing_share)
+        partial_vaccinations = np.cumsum(random_generator.integers(0, 5_000, len(reported_days)))
+        full_vaccinations = partial_vaccinations // 2
+
+        frames.append(pd.DataFrame({"Country_Region": JHU_COUNTRY_NAMES.get(country, country),
+                                    "Date": date_strings[reported_days],
+                                    "Doses_admin": partial_vaccinations + full_vaccinations,
+                                    "People_partially_vaccinated": partial_vaccinations,
+                                    "People_fully_vaccinated": full_vaccinations,
+                                    "Report_Date_String": date_strings[reported_days],
+                                    "UID": row_number,
+                                    "Province_State": province}))
+
+    pd.concat(frames, ignore_index=True).to_csv(file_path, index=False)
+
+
+def write_un_population(file_path, country_names, years, random_generator, age_groups=101):
+    frames = []
+
+    for location_id, country in enumerate(country_names):
+        year_count = len(years)
+        row_count = year_count * age_groups
+
+        population_male = random_generator.uniform(0, 60, row_count).round(3)
+        population_female = random_generator.uniform(0, 60, row_count).round(3)
+
+        frames.append(pd.DataFrame({"SortOrder": location_id,
+                                    "LocID": location_id,
+                                    "Notes": np.nan,
+                                    "ISO3_code": "XXX",
+                                    "ISO2_code": "XX",
+                                    "SDMX_code": location_id,
+                                    "LocTypeID": 4,
+                                    "LocTypeName": "Country/Area",
+                                    "ParentID": 900,
+                                    "Location": UN_COUNTRY_NAMES.get(country, country),
+                                    "VarID": 2,
+                                    "Variant": "Medium",
+                                    "Time": np.repeat(years, age_groups),
+                                    "MidPeriod": np.repeat(years, age_groups) + 0.5,
+                                    "AgeGrp": np.tile(np.arange(age_groups), year_count).astype(str),
+                                    "AgeGrpStart": np.tile(np.arange(age_groups), year_count),
+                                    "AgeGrpSpan": 1,
+                                    "PopMale": population_male,
+                                    "PopFemale": population_female,
+                                    "PopTotal": population_male + population_female}, columns=UN_COLUMNS))
+
+    csv_name = os.path.splitext(os.path.basename(file_path))[0] + ".csv"
+
+    with zipfile.ZipFile(file_path, "w", zipfile.ZIP_DEFLATED) as population_archive:
+        with population_archive.open(csv_name, "w") as csv_file:
+            # written frame by frame to keep the generator's own memory use flat
+            for frame_number, frame in enumerate(frames):
+                csv_file.write(frame.to_csv(index=False, header=frame_number == 0).encode("utf-8"))
+
+
+def generate_dataset(output_directory, country_count=40, day_count=800, provinces_per_country=3,
+                     province_share=0.1, population_years=3, seed=0):
+    os.makedirs(output_directory, exist_ok=True)
+    random_generator = np.random.default_rng(seed)
+
+    country_names = dashboard_country_names(country_count)
+    rows = province_rows(country_names, provinces_per_country, province_share)
+
+    write_jhu_time_series(os.path.join(output_directory, INFECTIONS_FILE_NAME), rows, day_count, 2_000,
+                          random_generator)
+    write_jhu_time_series(os.path.join(output_directory, RECOVERIES_FILE_NAME), rows, day_count, 1_500,
+                          random_generator)
+    write_jhu_time_series(os.path.join(output_directory, DEATHS_FILE_NAME), rows, day_count, 40,
+                          random_generator)
+    write_govex_vaccinations(os.path.join(output_directory, VACCINATIONS_FILE_NAME), rows, day_count,
+                             random_generator)
+    write_un_population(os.path.join(output_directory, POPULATION_FILE_NAME), country_names,
+                        np.arange(2022 - population_years, 2022), random_generator)
+
+    return country_names
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Write synthetic JHU, GovEx and UN files in the upstream formats")
+    parser.add_argument("output_directory")
+    parser.add_argument("--countries", type=int, default=40)
+    parser.add_argument("--days", type=int, default=800)
+    parser.add_argument("--provinces", type=int, default=3, help="provinces per country that reports provinces")
+    parser.add_argument("--province-share", type=float, default=0.1,
+                        help="share of the countries that report provinces")
+    parser.add_argument("--population-years", type=int, default=3,
+                        help="number of years (ending in 2021) in the population archive")
+    parser.add_argument("--seed", type=int, default=0)
+    arguments = parser.parse_args()
+
+    country_names = generate_dataset(arguments.output_directory, arguments.countries, arguments.days,
+                                     arguments.provinces, arguments.province_share, arguments.population_years,
+                                     arguments.seed)
+
+    print(f"Wrote {len(country_names)} countries x {arguments.days} days to {arguments.output_directory}")
+
+
+if __name__ == "__main__":
+    main()
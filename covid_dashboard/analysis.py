@@ -0,0 +1,197 @@
+import os
+import sys
+import json
+import argparse
+
+import numpy as np
+import pandas as pd
+from numpy.lib.stride_tricks import sliding_window_view
+
+from covid_dashboard.cache import SourceCache
+from covid_dashboard.dates import shared_calendar, align_to_calendar
+from covid_dashboard.metrics import trailing_window_sums
+from covid_dashboard.snapshot import load_source
+from covid_dashboard.utils import CONFIG_DIRECTORY, load_config, load_country_aliases
+
+
+# the cumulative JHU time series the analysis works with, indicator name -> source section in dashboard.cfg
+TIME_SERIES_SOURCES = {"cases": "infections",
+                       "deaths": "deaths",
+                       "recoveries": "recoveries"}
+
+CORRELATION_METHODS = ("pearson", "spearman", "kendall")
+
+
+def load_happiness_data(happiness_path):
+    happiness_data = pd.read_csv(happiness_path)
+    happiness_data = happiness_data.drop(columns=["Overall rank"], errors="ignore")
+    happiness_data = happiness_data.set_index("Country or region")
+
+    # the report has its own spelling of some country names
+    happiness_data = happiness_data.rename(index=load_country_aliases())
+    happiness_data.index.name = "Country/Region"
+
+    return happiness_data
+
+
+def load_time_series(config, source_cache, countries, indicator_names=tuple(TIME_SERIES_SOURCES)):
+    # the cumulative counts of every indicator on one shared calendar. The frames are cached under their own
+    # names, the analysis usually covers other countries than the dashboard and would otherwise evict its frames
+    time_series = {}
+
+    for indicator_name in indicator_names:
+        source_name = TIME_SERIES_SOURCES[indicator_name]
+        time_series[indicator_name] = load_source(config, source_cache, countries, source_name,
+                                                  cache_name=f"analysis_{source_name}")
+
+    calendar = shared_calendar(time_series.values())
+    countries = sorted(set.intersection(*(set(frame.index) for frame in time_series.values())))
+
+    return {indicator_name: align_to_calendar(frame.loc[countries], calendar)
+            for indicator_name, frame in time_series.items()}
+
+
+def daily_values(cumulative_data):
+    # day over day increase of all countries at once, the first day has no increase
+    values = cumulative_data.to_numpy(dtype=np.float64)
+    daily = np.full(values.shape, np.nan)
+    daily[:, 1:] = values[:, 1:] - values[:, :-1]
+
+    return daily
+
+
+def average_daily_increase(cumulative_data):
+    # mean of the daily increases of every country in one pass over the matrix
+    return pd.Series(np.nanmean(daily_values(cumulative_data)[:, 1:], axis=1), index=cumulative_data.index)
+
+
+def country_indicators(time_series, extra_indicators=None):
+    # one row per country, one column per indicator
+    indicators = pd.DataFrame({f"average_daily_{indicator_name}": average_daily_increase(cumulative_data)
+                               for indicator_name, cumulative_data in time_series.items()})
+
+    if extra_indicators is not None:
+        indicators = indicators.join(extra_indicators.select_dtypes(include="number"), how="inner")
+
+    return indicators
+
+
+def pairwise_correlations(indicators, method="pearson"):
+    return indicators.corr(method=method)
+
+
+def rolling_correlations(first_data, second_data, window):
+    # Pearson correlation of the daily increases of two indicators over the trailing `window` days, for every
+    # country and date at once on (country x window start x day) views. The deviations are taken from each
+    # window's own mean, cumulative sums of squared daily counts run out of float64 precision. Dates without a
+    # full window are NaN.
+    first_windows = sliding_window_view(daily_values(first_data)[:, 1:], window, axis=1)
+    second_windows = sliding_window_view(daily_values(second_data)[:, 1:], window, axis=1)
+
+    first_deviations = first_windows - first_windows.mean(axis=2, keepdims=True)
+    second_deviations = second_windows - second_windows.mean(axis=2, keepdims=True)
+
+    covariances = (first_deviations * second_deviations).sum(axis=2)
+    variances = (first_deviations ** 2).sum(axis=2) * (second_deviations ** 2).sum(axis=2)
+
+    correlations = np.full(first_data.shape, np.nan)
+
+    # a constant window has no correlation
+    with np.errstate(invalid="ignore", divide="ignore"):
+        correlations[:, window:] = np.where(variances > 0, covariances / np.sqrt(variances), np.nan)
+
+    return pd.DataFrame(np.clip(correlations, -1.0, 1.0), index=first_data.index, columns=first_data.columns)
+
+
+def cross_country_correlations(first_values, second_values):
+    # Pearson correlation across the countries for every date. Both are (country x date) arrays or frames, a
+    # per-country indicator (e.g. a happiness score) broadcasts over the dates when given as a column
+    first_values = np.asarray(first_values, dtype=np.float64)
+    second_values = np.broadcast_to(np.asarray(second_values, dtype=np.float64), first_values.shape)
+
+    valid_values = ~(np.isnan(first_values) | np.isnan(second_values))
+    country_counts = valid_values.sum(axis=0)
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        first_means = np.where(valid_values, first_values, 0.0).sum(axis=0) / country_counts
+        second_means = np.where(valid_values, second_values, 0.0).sum(axis=0) / country_counts
+
+        first_deviations = np.where(valid_values, first_values - first_means, 0.0)
+        second_deviations = np.where(valid_values, second_values - second_means, 0.0)
+
+        correlations = ((first_deviations * second_deviations).sum(axis=0) /
+                        np.sqrt((first_deviations ** 2).sum(axis=0) * (second_deviations ** 2).sum(axis=0)))
+
+    return np.clip(correlations, -1.0, 1.0)
+
+
+def analysis_countries(happiness_data=None):
+    if happiness_data is not None:
+        return list(happiness_data.index)
+
+    with open(os.path.join(CONFIG_DIRECTORY, "supported_countries.json"), "r") as country_file:
+        return json.load(country_file)["countries"]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Correlate per-country COVID-19 aggregates with each other and "
+                                                 "with other indicators")
+    parser.add_argument("--happiness", help="World Happiness Report CSV whose indicators are joined to the "
+                                            "COVID-19 aggregates (without it the supported countries of the "
+                                            "dashboard are analyzed)")
+    parser.add_argument("--method", choices=CORRELATION_METHODS, default="pearson")
+    parser.add_argument("--rolling", nargs=2, metavar=("FIRST", "SECOND"), choices=tuple(TIME_SERIES_SOURCES),
+                        help="rolling-window correlation of the daily increases of two indicators per country")
+    parser.add_argument("--across", action="store_true",
+                        help="with --rolling, correlate the rolling-window increases across the countries per date "
+                             "instead of per country")
+    parser.add_argument("--window", type=int, default=28, help="days of the rolling window")
+    parser.add_argument("--output", help="CSV file for the correlation matrix (or the rolling correlations)")
+    arguments = parser.parse_args()
+
+    if arguments.window < 2:
+        sys.exit("--window needs at least 2 days")
+
+    config = load_config()
+    source_cache = SourceCache.from_config(config)
+
+    happiness_data = load_happiness_data(arguments.happiness) if arguments.happiness else None
+    time_series = load_time_series(config, source_cache, analysis_countries(happiness_data))
+    source_cache.close()
+
+    if arguments.rolling:
+        first_name, second_name = arguments.rolling
+
+        if arguments.across:
+            first_sums, second_sums = (trailing_window_sums(np.nan_to_num(daily_values(time_series[indicator_name])),
+                                                            arguments.window)
+                                       for indicator_name in (first_name, second_name))
+            dates = time_series[first_name].columns
+            result = pd.Series(cross_country_correlations(first_sums, second_sums), index=dates.strftime("%Y-%m-%d"),
+                               name="correlation").iloc[arguments.window:]
+
+            print(f"{arguments.window} day {first_name} and {second_name} correlated across "
+                  f"{len(time_series[first_name])} countries:")
+            print(result.dropna().tail(14).to_string())
+
+        else:
+            result = rolling_correlations(time_series[first_name], time_series[second_name], arguments.window)
+            result.columns = result.columns.strftime("%Y-%m-%d")
+
+            print(f"Latest {arguments.window} day correlation of daily {first_name} and daily {second_name}:")
+            print(result.iloc[:, -1].dropna().sort_values().to_string())
+
+    else:
+        indicators = country_indicators(time_series, happiness_data)
+        result = pairwise_correlations(indicators, arguments.method)
+
+        print(f"{arguments.method.capitalize()} correlations across {len(indicators)} countries:")
+        print(result.round(3).to_string())
+
+    if arguments.output:
+        result.to_csv(arguments.output)
+        print(f"Wrote {arguments.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,464 @@
+import json
+import atexit
+import os
+import time
+
+import dash
+import flask
+from dash import html, dcc, callback, clientside_callback, ctx, ClientsideFunction, Input, Output, State, Patch
+from dash.exceptions import PreventUpdate
+import dash_bootstrap_components as dbc
+
+from covid_dashboard.cache import SourceCache
+from covid_dashboard.snapshot import SnapshotStore
+from covid_dashboard.shared import SharedSnapshotStore, shared_directory_from_config
+from covid_dashboard.figures import FigureCache, build_home_figure, home_map_values, infection_series, vaccine_series
+from covid_dashboard.figures import figure_template, normalize_country_selection, order_traces
+from covid_dashboard.instrumentation import instrumentation
+from covid_dashboard.dates import date_range_positions
+from covid_dashboard.downsampling import DOWNSAMPLING_METHODS, visible_date_range
+from covid_dashboard.geometry import load_map_geometry, serialize_geometry
+from covid_dashboard.memory import memory_report
+from covid_dashboard.responses import ResponsePipeline
+from covid_dashboard.data import pyarrow_available
+from covid_dashboard.series import ARROW_MIMETYPE, parse_series_query, series_arrow, series_etag, series_json
+from covid_dashboard.series import series_store
+from covid_dashboard.layouts import create_home_layout, create_about_layout, create_loading_layout
+from covid_dashboard.layouts import create_infections_layout, create_vaccination_layout
+from covid_dashboard.utils import CONFIG_DIRECTORY, load_config
+
+
+def create_app(attach_shared_snapshot=False, config=None, supported_countries=None, lazy=None):
+
+    app = dash.Dash(__name__,
+                    external_stylesheets=[dbc.themes.BOOTSTRAP])
+
+    # the data pages show a loading state until the first snapshot is there, data_poll re-renders them once it is
+    # and is disabled in the same response
+    @callback([Output(component_id="page_content", component_property="children"),
+               Output(component_id="data_poll", component_property="disabled")],
+              [Input(component_id="page_url", component_property="pathname"),
+               Input(component_id="data_poll", component_property="n_intervals")])
+    def render_page(pathname, poll_count):
+        snapshot = snapshot_store.current
+
+        if pathname in ("/", "/infections/", "/vaccinations/") and snapshot is None:
+            if ctx.triggered_id == "data_poll":
+                raise PreventUpdate
+
+            return create_loading_layout(), False
+
+        if pathname == "/":
+            metric_cube = snapshot.metric_cube
+            base_map_figure = build_home_figure(metric_cube, map_geometry_url).to_plotly_json()
+
+            return create_home_layout(dates=metric_cube.dates, map_figure=base_map_figure), True
+
+        elif pathname == "/infections/":
+            return create_infections_layout(country_names=supported_countries,
+                                            provinces_available="infection_data" in snapshot.province_tables), True
+
+        elif pathname == "/vaccinations/":
+            return create_vaccination_layout(country_names=supported_countries), True
+
+        elif pathname == "/about":
+            return create_about_layout(), True
+
+        else:
+            return "<h1>Test</h1>", True
+
+    the_navbar = dbc.Navbar(
+        dbc.Container([
+            html.A(dbc.Row([
+                # dbc.Col(html.Img(src=PAGE_LOGO, height="30px")),
+                dbc.Col(dbc.NavbarBrand("Covid Dashboard", className="ms-2"))
+            ],
+             align="center0",
+             className="g-0"),
+                   href="/",
+                   style={"textDecoration": "none"}),
+            dbc.NavbarToggler(id="navbar-toggler"),
+            dbc.Nav([
+                dbc.NavItem(dbc.NavLink("Home", href="/")),
+                dbc.NavItem(dbc.NavLink("Infections", href="/infections/")),
+                dbc.NavItem(dbc.NavLink("Vaccinations", href="/vaccinations/")),
+                dbc.NavItem(dbc.NavLink("About", href="/about")),
+            ])
+        ]),
+        color="dark",
+        dark=True
+
+    )
+
+    # the_navbar = html.Div([
+    #            dcc.Location(id="navbar_id"),
+
+    #            html.Div(dcc.Link("Home", href="/"), className="nav_bar_box"),
+    #            html.Div(dcc.Link("Infections", href="/infections/"), className="nav_bar_box"),
+    #            html.Div(dcc.Link("Vaccinations", href="/vaccinations/"), className="nav_bar_box"),
+    #            html.Div(dcc.Link("About", href="/about"), className="nav_bar_box"),
+
+    #        ], id="page_navbar")
+
+    def serve_layout():
+        # evaluated on every page load, pages opened after the data is loaded never poll
+        the_top = html.Div([
+                    dcc.Location(id="page_url", refresh=False),
+                    dcc.Interval(id="data_poll", interval=page_poll_interval * 1000,
+                                 disabled=snapshot_store.ready),
+                    # the plotly template of the figures built in the browser, sent once per page load
+                    dcc.Store(id="figure_template", data=figure_template()),
+                    the_navbar
+        ],
+         id="top_bar_content",
+         className="content_box")
+
+        page_content = html.Div(id="page_content",
+                                className="content_box")
+
+        return html.Div([the_top,
+                         page_content],
+                        style={"height": "90vh",
+                               "width": "100vw"})
+
+
+    # HOME PAGE
+
+    # both can be overridden, e.g. by the benchmarks to run against synthetic data
+    if config is None:
+        config = load_config()
+
+    if supported_countries is None:
+        with open(os.path.join(CONFIG_DIRECTORY, "supported_countries.json"), "r") as country_file:
+            contents = json.load(country_file)
+
+        supported_countries = contents["countries"]
+
+    # before the first snapshot is loaded, so that its loader stages are already timed
+    instrumentation.configure(config)
+
+    # lazy: serve right away and load the first snapshot in the background, the data pages show a loading state
+    # and /health/ready answers 503 until it is there
+    if lazy is None:
+        lazy = config["startup"].getboolean("lazy", False)
+
+    page_poll_interval = config["startup"].getfloat("page_poll_interval", 2)
+
+    # callbacks read snapshot_store.current once and only use that snapshot, the background refresh swaps in new
+    # ones as the sources are updated
+    if attach_shared_snapshot:
+        # multi-worker deployments (see wsgi.py): map the snapshot published by covid_dashboard.publish
+        snapshot_store = SharedSnapshotStore(config, shared_directory_from_config(config), lazy=lazy)
+
+    else:
+        snapshot_store = SnapshotStore(config, SourceCache.from_config(config), supported_countries, lazy=lazy)
+
+    snapshot_store.start()
+    # stops the refresh and the parse processes of the source cache when the server exits
+    atexit.register(snapshot_store.stop)
+
+    app.snapshot_store = snapshot_store
+    app.layout = serve_layout
+
+    # the browser fetches the geometry once from its own (HTTP cached) route instead of with every map figure
+    map_geometry = load_map_geometry(config, supported_countries)
+    map_geometry_bytes, map_geometry_etag = serialize_geometry(map_geometry)
+    map_geometry_url = f"/map/geometry.json?v={map_geometry_etag}"
+
+    # cached figures and series are only valid for the data version they were built from
+    figure_cache = FigureCache.from_config(config)
+    response_pipeline = ResponsePipeline.from_config(config)
+
+    # time series with more dates than this are downsampled, zooming in requests the detail of the visible range
+    max_points = config["downsampling"].getint("max_points", 0)
+    downsampling_method = config["downsampling"].get("method", "minmax")
+
+    if downsampling_method not in DOWNSAMPLING_METHODS:
+        raise ValueError(f"Unknown downsampling method '{downsampling_method}'")
+
+    def requested_date_positions(graph_id, relayout_data, dates):
+        # None for the full date range, PreventUpdate for relayout events that do not change the x-axis
+        date_range = visible_date_range(relayout_data)
+
+        if date_range is None:
+            if ctx.triggered_id == graph_id:
+                raise PreventUpdate
+
+            return None
+
+        if date_range == (None, None):
+            return None
+
+        return date_range_positions(dates, *date_range)
+
+    # pure UI transforms run in the browser (assets/clientside.js): the home title is the label of the selected
+    # mode, the graphs are drawn from the base series stores, so switching their display mode costs no request
+    clientside_callback(ClientsideFunction(namespace="covid_dashboard", function_name="home_title"),
+                        Output(component_id="graph_title", component_property="children"),
+                        Input(component_id="graph_selector", component_property="value"),
+                        State(component_id="graph_selector", component_property="options"))
+
+    clientside_callback(ClientsideFunction(namespace="covid_dashboard", function_name="infections_figure"),
+                        Output(component_id="infections_graph", component_property="figure"),
+                        [Input(component_id="infections_series", component_property="data"),
+                         Input(component_id="mode_selection", component_property="value")],
+                        State(component_id="figure_template", component_property="data"))
+
+    clientside_callback(ClientsideFunction(namespace="covid_dashboard", function_name="vaccine_figure"),
+                        Output(component_id="vaccine_graph", component_property="figure"),
+                        [Input(component_id="vaccine_series", component_property="data"),
+                         Input(component_id="mode_selection", component_property="value")],
+                        State(component_id="figure_template", component_property="data"))
+
+    @callback(Output(component_id="map_graph", component_property="figure"),
+              [Input(component_id="graph_selector", component_property="value"),
+               Input(component_id="date_slider", component_property="value")])
+    def render_home_graph(display_mode, date_position):
+        metric_cube = snapshot_store.current.metric_cube
+
+        if date_position is None:
+            date_position = len(metric_cube.dates) - 1
+
+        # the geometry and layout are already in the browser, only the values and the hover text change
+        values_for_graph, hover_template = home_map_values(metric_cube, display_mode, date_position)
+
+        map_patch = Patch()
+        map_patch["data"][0]["z"] = values_for_graph.tolist()
+        map_patch["data"][0]["hovertemplate"] = hover_template
+
+        return map_patch
+
+    # INFECTIONS PAGE
+
+    @callback(Output(component_id="infections_series", component_property="data"),
+              [Input(component_id="country_selection", component_property="value"),
+               Input(component_id="infections_graph", component_property="relayoutData"),
+               Input(component_id="province_toggle", component_property="value")])
+    def render_infections_series(selected_countries, relayout_data, province_toggle):
+        snapshot = snapshot_store.current
+        selected_countries = normalize_country_selection(selected_countries)
+        sorted_countries = sorted(set(selected_countries))
+        date_positions = requested_date_positions("infections_graph", relayout_data,
+                                                  snapshot.infection_data.columns)
+
+        province_table = snapshot.province_tables.get("infection_data") if province_toggle else None
+
+        series = figure_cache.get_or_build(("infections", tuple(sorted_countries), date_positions,
+                                            province_table is not None),
+                                           snapshot.data_version,
+                                           lambda: infection_series(snapshot.infection_modes,
+                                                                    sorted_countries,
+                                                                    date_positions,
+                                                                    max_points,
+                                                                    downsampling_method,
+                                                                    province_table,
+                                                                    snapshot.province_infection_modes))
+
+        return order_traces(series, selected_countries)
+
+    # VACCINATIONS PAGE
+
+    @callback(Output(component_id="vaccine_series", component_property="data"),
+              [Input(component_id="country_selection", component_property="value"),
+               Input(component_id="vaccine_graph", component_property="relayoutData")])
+    def render_vaccine_series(selected_countries, relayout_data):
+        snapshot = snapshot_store.current
+        selected_countries = normalize_country_selection(selected_countries)
+        sorted_countries = sorted(set(selected_countries))
+        date_positions = requested_date_positions("vaccine_graph", relayout_data,
+                                                  snapshot.full_vaccination_data.columns)
+
+        series = figure_cache.get_or_build(("vaccinations", tuple(sorted_countries), date_positions),
+                                           snapshot.data_version,
+                                           lambda: vaccine_series(snapshot.partial_vaccination_data,
+                                                                  snapshot.full_vaccination_data,
+                                                                  snapshot.population_data,
+                                                                  sorted_countries,
+                                                                  date_positions,
+                                                                  max_points,
+                                                                  downsampling_method))
+
+        return order_traces(series, selected_countries)
+
+    @app.server.route("/map/geometry.json")
+    def serve_map_geometry():
+        response = flask.Response(map_geometry_bytes, mimetype="application/geo+json")
+        response.set_etag(map_geometry_etag)
+        response.cache_control.public = True
+        response.cache_control.max_age = 86_400
+
+        return response.make_conditional(flask.request)
+
+    @app.server.route("/stats/figure-cache")
+    def figure_cache_stats():
+        return flask.jsonify(figure_cache.stats())
+
+    @app.server.route("/stats/responses")
+    def response_stats():
+        return flask.jsonify(response_pipeline.stats())
+
+    @app.server.route("/stats/memory")
+    def snapshot_memory_stats():
+        snapshot = snapshot_store.current
+
+        if snapshot is None:
+            return flask.jsonify({"status": "loading"}), 503
+
+        return flask.jsonify(memory_report(snapshot))
+
+    # read-only access to every series of the snapshot for other services, e.g.
+    # /api/series?metric=seven_day_incidence&countries=Austria,Germany&from=2021-01-01&to=2021-06-30&format=json
+    @app.server.route("/api/series")
+    def serve_series():
+        snapshot = snapshot_store.current
+
+        if snapshot is None:
+            return flask.jsonify({"status": "loading"}), 503
+
+        try:
+            query = parse_series_query(flask.request.args)
+
+        except ValueError as error:
+            return flask.jsonify({"error": str(error)}), 400
+
+        if query["output_format"] == "arrow" and not pyarrow_available():
+            return flask.jsonify({"error": "Arrow output needs the pyarrow package"}), 406
+
+        etag = series_etag(snapshot.data_version, query)
+
+        # compressed responses carry the ETag as a weak one
+        if flask.request.if_none_match.contains_weak(etag):
+            response = flask.Response(status=304)
+
+        else:
+            try:
+                dates, countries, values = series_store(snapshot).query(query["metric_name"], query["countries"],
+                                                                        query["start_date"], query["end_date"])
+
+            except KeyError as error:
+                return flask.jsonify({"error": error.args[0]}), 400
+
+            if query["output_format"] == "arrow":
+                response = flask.Response(series_arrow(query["metric_name"], dates, countries, values),
+                                          mimetype=ARROW_MIMETYPE)
+
+            else:
+                response = flask.Response(series_json(query["metric_name"], dates, countries, values),
+                                          mimetype="application/json")
+
+        response.set_etag(etag)
+        # clients may keep the response but have to revalidate it, the data changes with every refresh
+        response.cache_control.public = True
+        response.cache_control.no_cache = True
+
+        return response
+
+    @app.server.route("/api/series/metrics")
+    def serve_series_metrics():
+        snapshot = snapshot_store.current
+
+        if snapshot is None:
+            return flask.jsonify({"status": "loading"}), 503
+
+        return flask.jsonify(series_store(snapshot).describe())
+
+    # liveness: the process serves requests. readiness: it also has data, load balancers should only route to
+    # workers that are ready
+    @app.server.route("/health/live")
+    def liveness():
+        return flask.jsonify({"status": "alive"})
+
+    @app.server.route("/health/ready")
+    def readiness():
+        snapshot = snapshot_store.current
+
+        if snapshot is None:
+            last_error = snapshot_store.last_error
+
+            return flask.jsonify({"status": "loading",
+                                  "error": repr(last_error) if last_error is not None else None}), 503
+
+        if snapshot.missing_sources:
+            # the pages are served, but with stand-ins for the sources that could not be loaded yet
+            return flask.jsonify({"status": "degraded",
+                                  "data_version": snapshot.data_version,
+                                  "missing_sources": snapshot.missing_sources}), 503
+
+        return flask.jsonify({"status": "ready",
+                              "data_version": snapshot.data_version,
+                              "snapshot_age_seconds": time.time() - snapshot.created_at})
+
+    if instrumentation.enabled:
+        # all callbacks are served by the same route, they are told apart by the output they update
+        callback_names = {"..page_content.children...data_poll.disabled..": "render_page",
+                          "map_graph.figure": "render_home_graph",
+                          "infections_series.data": "render_infections_series",
+                          "vaccine_series.data": "render_vaccine_series"}
+
+        @app.server.before_request
+        def start_request_timer():
+            flask.g.request_start_time = time.perf_counter()
+
+        @app.server.after_request
+        def record_callback(response):
+            if flask.request.path.endswith("/_dash-update-component") and not response.direct_passthrough:
+                output = (flask.request.get_json(silent=True) or {}).get("output", "")
+                callback_name = callback_names.get(output, output)
+
+                instrumentation.observe("callback_seconds", time.perf_counter() - flask.g.request_start_time,
+                                        callback=callback_name)
+                instrumentation.observe("callback_response_bytes", len(response.get_data()),
+                                        callback=callback_name)
+
+            return response
+
+        @app.server.route("/metrics")
+        def serve_metrics():
+            snapshot = snapshot_store.current
+            cache_stats = figure_cache.stats()
+            response_stats = response_pipeline.stats()
+
+            current_values = [("snapshot_ready", "gauge", "Whether the data snapshot has been loaded",
+                               int(snapshot is not None))]
+
+            if snapshot is not None:
+                current_values += [("snapshot_age_seconds", "gauge",
+                                    "Seconds since the served data snapshot was built",
+                                    time.time() - snapshot.created_at),
+                                   ("snapshot_created_timestamp_seconds", "gauge",
+                                    "Unix time at which the served data snapshot was built", snapshot.created_at),
+                                   ("snapshot_bytes", "gauge", "Memory used by the frames of the served data snapshot",
+                                    memory_report(snapshot)["total_bytes"])]
+
+            current_values += [("figure_cache_entries", "gauge", "Figures in the figure cache",
+                                cache_stats["entries"]),
+                               ("figure_cache_hits_total", "counter", "Figure cache hits", cache_stats["hits"]),
+                               ("figure_cache_misses_total", "counter", "Figure cache misses",
+                                cache_stats["misses"]),
+                               ("figure_cache_evictions_total", "counter", "Figures evicted from the figure cache",
+                                cache_stats["evictions"]),
+                               ("response_cache_hits_total", "counter",
+                                "Callback requests answered with a cached response body", response_stats["hits"]),
+                               ("response_cache_misses_total", "counter", "Callback requests that ran the callback",
+                                response_stats["misses"]),
+                               ("response_not_modified_total", "counter", "Callback requests answered with a 304",
+                                response_stats["not_modified"]),
+                               ("response_cache_bytes", "gauge", "Bytes of the cached response bodies",
+                                response_stats["bytes"])]
+
+            return flask.Response(instrumentation.render(current_values),
+                                  mimetype="text/plain; version=0.0.4")
+
+    def current_data_version():
+        snapshot = snapshot_store.current
+
+        return snapshot.data_version if snapshot is not None else None
+
+    # compression of all responses, ETags and cached bodies of repeated callbacks (see [responses]), installed last
+    # so that the instrumentation sees the compressed sizes
+    response_pipeline.install(app.server, current_data_version)
+
+    return app
+    # app.run_server(debug=True)
+
+
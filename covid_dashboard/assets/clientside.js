@@ -0,0 +1,256 @@
+// Clientside callbacks (see create_app): the server sends the base series of a page once per selection or zoom,
+// switching the display mode, the rolling window or between counts and percentages is computed here. Long ranges
+// arrive already downsampled, as the points that the server kept of every display mode (see infection_series).
+
+(function () {
+
+    // ports of minmax_indices and lttb_indices in downsampling.py
+    function minmaxIndices(values, maxPoints) {
+        var pointCount = values.length;
+
+        if (pointCount <= maxPoints || maxPoints < 4) {
+            return null;
+        }
+
+        var bucketCount = Math.floor((maxPoints - 2) / 2);
+        var positions = [0, pointCount - 1];
+
+        for (var bucket = 0; bucket < bucketCount; bucket++) {
+            var start = Math.floor(bucket * pointCount / bucketCount);
+            var end = Math.floor((bucket + 1) * pointCount / bucketCount);
+            var minimumPosition = start;
+            var maximumPosition = start;
+
+            for (var position = start; position < end; position++) {
+                if (values[position] < values[minimumPosition]) {
+                    minimumPosition = position;
+                }
+
+                if (values[position] >= values[maximumPosition]) {
+                    maximumPosition = position;
+                }
+            }
+
+            positions.push(minimumPosition, maximumPosition);
+        }
+
+        positions.sort(function (first, second) { return first - second; });
+
+        return positions.filter(function (position, index) { return index === 0 || position !== positions[index - 1]; });
+    }
+
+    function lttbIndices(values, maxPoints) {
+        var pointCount = values.length;
+
+        if (pointCount <= maxPoints || maxPoints < 3) {
+            return null;
+        }
+
+        var bucketEdges = [];
+
+        for (var edge = 0; edge < maxPoints - 1; edge++) {
+            bucketEdges.push(Math.floor(1 + edge * (pointCount - 2) / (maxPoints - 2)));
+        }
+
+        var positions = [0];
+        var previousPosition = 0;
+
+        for (var bucket = 0; bucket < maxPoints - 2; bucket++) {
+            var start = bucketEdges[bucket];
+            var end = bucketEdges[bucket + 1];
+            var nextEnd = bucket + 2 < bucketEdges.length ? bucketEdges[bucket + 2] : pointCount;
+
+            var averagePosition = 0;
+            var averageValue = 0;
+
+            for (var position = end; position < nextEnd; position++) {
+                averagePosition += position;
+                averageValue += values[position];
+            }
+
+            averagePosition /= nextEnd - end;
+            averageValue /= nextEnd - end;
+
+            var largestArea = -1;
+            var selectedPosition = start;
+
+            for (position = start; position < end; position++) {
+                var area = Math.abs((previousPosition - averagePosition) * (values[position] - values[previousPosition]) -
+                                    (previousPosition - position) * (averageValue - values[previousPosition]));
+
+                if (area > largestArea) {
+                    largestArea = area;
+                    selectedPosition = position;
+                }
+            }
+
+            positions.push(selectedPosition);
+            previousPosition = selectedPosition;
+        }
+
+        positions.push(pointCount - 1);
+
+        return positions;
+    }
+
+    function downsampledScatter(dates, values, trace, series) {
+        var positions = null;
+
+        if (series.max_points) {
+            positions = series.downsampling_method === "lttb" ? lttbIndices(values, series.max_points)
+                                                               : minmaxIndices(values, series.max_points);
+        }
+
+        var scatter = {type: "scatter",
+                       mode: "lines",
+                       name: trace.name,
+                       x: positions ? positions.map(function (position) { return dates[position]; }) : dates,
+                       y: positions ? positions.map(function (position) { return values[position]; }) : values};
+
+        if (trace.legendgroup !== undefined) {
+            scatter.legendgroup = trace.legendgroup;
+        }
+
+        return scatter;
+    }
+
+    function offsetDates(firstDate, offsets) {
+        // the points of a downsampled series are offsets in days from its first date
+        var firstTime = Date.parse(firstDate);
+
+        return offsets.map(function (offset) {
+            return new Date(firstTime + offset * 86400000).toISOString().slice(0, 10);
+        });
+    }
+
+    function infectionValues(trace, series, displayMode) {
+        // the daily counts start `lookback` dates before the visible ones, so every rolling window is complete
+        var daily = trace.daily;
+        var lookback = series.lookback;
+        var values = [];
+        var position;
+
+        if (displayMode === "total") {
+            var total = trace.first_total;
+
+            for (position = 0; position < daily.length; position++) {
+                total += position > 0 ? daily[position] : 0;
+
+                if (position >= lookback) {
+                    values.push(total);
+                }
+            }
+
+            return values;
+        }
+
+        if (displayMode === "daily") {
+            return daily.slice(lookback);
+        }
+
+        var windowLength = series.windows[displayMode];
+
+        if (windowLength === undefined) {
+            throw new Error("Unknown display mode '" + displayMode + "'");
+        }
+
+        var windowSum = 0;
+
+        for (position = 0; position < daily.length; position++) {
+            windowSum += daily[position] - (position >= windowLength ? daily[position - windowLength] : 0);
+
+            if (position >= lookback) {
+                // the first date of the calendar has no daily count, windows that include it have no average
+                values.push(series.first_position + position < windowLength ? 0 : windowSum / windowLength);
+            }
+        }
+
+        return values;
+    }
+
+    window.dash_clientside = Object.assign({}, window.dash_clientside, {
+        covid_dashboard: {
+
+            // the title of the home page is the label of the selected display mode
+            home_title: function (displayMode, options) {
+                var selectedOption = (options || []).find(function (option) { return option.value === displayMode; });
+
+                return selectedOption ? selectedOption.label : "";
+            },
+
+            infections_figure: function (series, displayMode, template) {
+                if (!series) {
+                    return window.dash_clientside.no_update;
+                }
+
+                // a cleared dropdown shows the daily counts, like every mode but "total" did before
+                displayMode = displayMode || "daily";
+
+                var visibleDates = series.dates ? series.dates.slice(series.lookback) : null;
+                var data = series.data.map(function (trace) {
+                    if (!trace.modes) {
+                        return downsampledScatter(visibleDates, infectionValues(trace, series, displayMode), trace,
+                                                  series);
+                    }
+
+                    var points = trace.modes[displayMode];
+
+                    if (points === undefined) {
+                        throw new Error("Unknown display mode '" + displayMode + "'");
+                    }
+
+                    // the averages are sent as the sums over their window
+                    var windowLength = series.windows[displayMode] || 1;
+
+                    return downsampledScatter(offsetDates(series.first_date, points[0]),
+                                              points[1].map(function (value) { return value / windowLength; }),
+                                              trace, series);
+                });
+
+                // uirevision keeps the user's zoom when the figure is replaced with the detail of the zoomed in range
+                return {data: data,
+                        layout: {template: template,
+                                 xaxis: {type: "date", tickmode: "auto", nticks: 10},
+                                 uirevision: displayMode}};
+            },
+
+            vaccine_figure: function (series, displayMode, template) {
+                if (!series) {
+                    return window.dash_clientside.no_update;
+                }
+
+                var percentage = displayMode.indexOf("percentage") !== -1;
+
+                if (displayMode.indexOf("full") === -1 && displayMode.indexOf("partial") === -1) {
+                    throw new Error("Unknown display mode '" + displayMode + "'");
+                }
+
+                var field = displayMode.indexOf("full") !== -1 ? "full" : "partial";
+                var data = series.data.map(function (trace) {
+                    var dates = trace.modes ? offsetDates(series.first_date, trace.modes[field][0]) : series.dates;
+                    var values = trace.modes ? trace.modes[field][1] : trace[field];
+
+                    if (percentage) {
+                        // no population while its source is missing, the server side figures show 0 as well
+                        values = values.map(function (value) {
+                            return trace.population === null ? 0 : 100 * value / trace.population;
+                        });
+                    }
+
+                    return downsampledScatter(dates, values, trace, series);
+                });
+
+                var layout = {template: template,
+                              xaxis: {type: "date", tickmode: "auto", nticks: 10},
+                              uirevision: displayMode};
+
+                if (percentage) {
+                    layout.yaxis = {range: [0, 100], title: {text: "% of population"}};
+                }
+
+                return {data: data, layout: layout};
+            }
+        }
+    });
+
+})();
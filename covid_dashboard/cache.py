@@ -0,0 +1,350 @@
+import os
+import json
+import time
+import shutil
+import hashlib
+from concurrent.futures import ProcessPoolExecutor
+from email.utils import formatdate
+from urllib.error import HTTPError
+from urllib.parse import urlparse, unquote
+from urllib.request import Request, urlopen, url2pathname
+
+import numpy as np
+import pandas as pd
+
+from covid_dashboard.instrumentation import instrumentation
+from covid_dashboard.utils import resolve_path
+
+
+CACHE_FORMAT_VERSION = 2
+VALIDATOR_KEYS = ("etag", "last_modified", "size")
+
+
+# Every source is stored as an uncompressed .npz archive (one 2D array per dtype block plus the row and column
+# labels) next to a .json file with the HTTP validators and the hash of the raw download. Within max_age seconds
+# the cached frames are returned without touching the network, afterwards the source is revalidated and only
+# parsed again if its content actually changed.
+class SourceCache:
+
+    def __init__(self, cache_directory, max_age=0, mirror_directory=None, enabled=True, keep_downloads=False,
+                 parse_processes=0, fetch_timeout=60):
+        self.cache_directory = cache_directory
+        self.max_age = max_age
+        self.mirror_directory = mirror_directory
+        self.enabled = enabled
+        self.keep_downloads = keep_downloads
+        # seconds an upstream may take to connect or to send the next bytes, so a hung one fails the load instead of
+        # blocking the startup or the refresh thread
+        self.fetch_timeout = fetch_timeout
+
+        # optionally parse in worker processes, so several sources can be parsed at the same time
+        self.parse_executor = ProcessPoolExecutor(max_workers=parse_processes) if parse_processes > 0 else None
+
+        # cache key and content hash of every source loaded through this cache, see data_version
+        self.loaded_versions = {}
+
+        os.makedirs(self.cache_directory, exist_ok=True)
+
+    @classmethod
+    def from_config(cls, config):
+        cache_config = config["cache"]
+
+        return cls(cache_directory=resolve_path(cache_config.get("directory", "cache")),
+                   max_age=cache_config.getfloat("max_age", 0),
+                   mirror_directory=resolve_path(cache_config.get("mirror_directory", "")),
+                   enabled=cache_config.getboolean("enabled", True),
+                   keep_downloads=cache_config.getboolean("keep_downloads", False),
+                   parse_processes=config["loading"].getint("parse_processes", 0),
+                   fetch_timeout=cache_config.getfloat("fetch_timeout", 60))
+
+    def load(self, name, source_url, loader, supported_countries, force_revalidate=False, **loader_options):
+        metadata = self._read_metadata(name) if self.enabled else None
+        cache_key = _cache_key(loader, supported_countries, loader_options)
+        kept_source_path = os.path.join(self.cache_directory, f"{name}.source")
+
+        frames_are_current = metadata is not None and metadata.get("cache_key") == cache_key
+
+        if frames_are_current and not force_revalidate and time.time() - metadata["fetched_at"] < self.max_age:
+            self.loaded_versions[name] = (cache_key, metadata["content_hash"])
+            return self._read_frames(name, metadata)
+
+        # validators are only worth sending if a 304 leaves us with something to use: the cached frames, or the
+        # kept download when the loader options (e.g. the population year) changed
+        source_is_reusable = frames_are_current or (metadata is not None and os.path.exists(kept_source_path))
+        download_path = os.path.join(self.cache_directory, f"{name}.download")
+
+        try:
+            with instrumentation.timer("loader_stage_seconds", source=name, stage="download"):
+                source_path, validators = self._fetch(source_url, metadata if source_is_reusable else None,
+                                                      download_path)
+
+        except OSError as error:
+            if not frames_are_current:
+                raise
+
+            print(f"Could not revalidate '{name}' ({error}), using cached data")
+            self.loaded_versions[name] = (cache_key, metadata["content_hash"])
+            return self._read_frames(name, metadata)
+
+        if source_path is None:
+            # 304 or unchanged local file
+            if frames_are_current:
+                metadata["fetched_at"] = time.time()
+                self._write_metadata(name, metadata)
+                self.loaded_versions[name] = (cache_key, metadata["content_hash"])
+
+                return self._read_frames(name, metadata)
+
+            source_path = self._local_path(source_url) or kept_source_path
+            validators = {key: metadata[key] for key in VALIDATOR_KEYS if key in metadata}
+
+        try:
+            content_hash = _hash_file(source_path)
+
+            if frames_are_current and metadata["content_hash"] == content_hash:
+                frames = self._read_frames(name, metadata)
+
+            else:
+                frames = self._parse(loader, source_path, supported_countries, loader_options)
+
+        except Exception as error:
+            # e.g. a truncated download or a changed upstream format, the last good frames are better than none
+            if not frames_are_current:
+                raise
+
+            print(f"Could not parse '{name}' ({error!r}), using cached data")
+            self.loaded_versions[name] = (cache_key, metadata["content_hash"])
+            return self._read_frames(name, metadata)
+
+        finally:
+            if os.path.exists(download_path):
+                if self.keep_downloads:
+                    os.replace(download_path, kept_source_path)
+
+                else:
+                    os.remove(download_path)
+
+        metadata = {"format_version": CACHE_FORMAT_VERSION,
+                    "cache_key": cache_key,
+                    "source_url": source_url,
+                    "content_hash": content_hash,
+                    "fetched_at": time.time(),
+                    **validators}
+
+        if self.enabled:
+            self._write_frames(name, frames, metadata)
+
+        self.loaded_versions[name] = (cache_key, content_hash)
+
+        return frames
+
+    def _parse(self, loader, source_path, supported_countries, loader_options):
+        if self.parse_executor is None:
+            return loader(source_path, supported_countries, **loader_options)
+
+        return self.parse_executor.submit(loader, source_path, supported_countries, **loader_options).result()
+
+    def close(self):
+        # shuts the parse processes down, later loads parse in the calling thread
+        parse_executor, self.parse_executor = self.parse_executor, None
+
+        if parse_executor is not None:
+            parse_executor.shutdown(wait=True, cancel_futures=True)
+
+    def data_version(self):
+        # changes whenever any of the loaded sources changed (or was loaded with different options)
+        version_source = json.dumps(sorted(self.loaded_versions.items()))
+
+        return hashlib.sha256(version_source.encode("utf-8")).hexdigest()[:16]
+
+    def _fetch(self, source_url, metadata, download_path):
+        metadata = metadata or {}
+        local_path = self._local_path(source_url)
+
+        if local_path is not None:
+            file_stats = os.stat(local_path)
+            last_modified = formatdate(file_stats.st_mtime, usegmt=True)
+            size = file_stats.st_size
+
+            if metadata.get("last_modified") == last_modified and metadata.get("size") == size:
+                return None, {}
+
+            return local_path, {"last_modified": last_modified, "size": size}
+
+        request = Request(source_url)
+
+        if metadata.get("etag"):
+            request.add_header("If-None-Match", metadata["etag"])
+
+        if metadata.get("last_modified"):
+            request.add_header("If-Modified-Since", metadata["last_modified"])
+
+        try:
+            response = urlopen(request, timeout=self.fetch_timeout)
+
+        except HTTPError as error:
+            if error.code == 304:
+                return None, {}
+
+            raise
+
+        with response, open(download_path, "wb") as download_file:
+            shutil.copyfileobj(response, download_file, length=1 << 20)
+
+        return download_path, {"etag": response.headers.get("ETag"),
+                               "last_modified": response.headers.get("Last-Modified")}
+
+    def _local_path(self, source_url):
+        parsed_url = urlparse(source_url)
+
+        if self.mirror_directory is not None:
+            return os.path.join(self.mirror_directory, os.path.basename(unquote(parsed_url.path)))
+
+        if parsed_url.scheme == "file":
+            return url2pathname(parsed_url.path)
+
+        if parsed_url.scheme in ("http", "https", "ftp"):
+            return None
+
+        return source_url
+
+    def _read_metadata(self, name):
+        metadata_path = os.path.join(self.cache_directory, f"{name}.json")
+        frames_path = os.path.join(self.cache_directory, f"{name}.npz")
+
+        if not (os.path.exists(metadata_path) and os.path.exists(frames_path)):
+            return None
+
+        with open(metadata_path, "r") as metadata_file:
+            metadata = json.load(metadata_file)
+
+        if metadata.get("format_version") != CACHE_FORMAT_VERSION:
+            return None
+
+        return metadata
+
+    def _write_metadata(self, name, metadata):
+        metadata_path = os.path.join(self.cache_directory, f"{name}.json")
+
+        with open(metadata_path + ".tmp", "w") as metadata_file:
+            json.dump(metadata, metadata_file, indent=4)
+
+        os.replace(metadata_path + ".tmp", metadata_path)
+
+    def _read_frames(self, name, metadata):
+        with np.load(os.path.join(self.cache_directory, f"{name}.npz"), allow_pickle=False) as arrays:
+            frames = tuple(arrays_to_frame(arrays, f"frame{frame_number}_", frame_metadata)
+                           for frame_number, frame_metadata in enumerate(metadata["frames"]))
+
+        return frames if metadata["is_tuple"] else frames[0]
+
+    def _write_frames(self, name, frames, metadata):
+        is_tuple = isinstance(frames, tuple)
+        frame_list = frames if is_tuple else (frames,)
+
+        arrays = {}
+        metadata["is_tuple"] = is_tuple
+        metadata["frames"] = []
+
+        for frame_number, frame in enumerate(frame_list):
+            frame_arrays, frame_metadata = frame_to_arrays(frame, f"frame{frame_number}_")
+            arrays.update(frame_arrays)
+            metadata["frames"].append(frame_metadata)
+
+        frames_path = os.path.join(self.cache_directory, f"{name}.npz")
+
+        # np.savez appends .npz to names without it
+        with open(frames_path + ".tmp", "wb") as frames_file:
+            np.savez(frames_file, **arrays)
+
+        os.replace(frames_path + ".tmp", frames_path)
+        self._write_metadata(name, metadata)
+
+
+def _cache_key(loader, supported_countries, loader_options):
+    key_source = json.dumps([loader.__module__, loader.__name__, sorted(supported_countries), loader_options],
+                            sort_keys=True)
+
+    return hashlib.sha256(key_source.encode("utf-8")).hexdigest()
+
+
+def _hash_file(file_path):
+    file_hash = hashlib.sha256()
+
+    with open(file_path, "rb") as source_file:
+        for chunk in iter(lambda: source_file.read(1 << 20), b""):
+            file_hash.update(chunk)
+
+    return file_hash.hexdigest()
+
+
+def _label_array(labels):
+    label_values = labels.to_numpy()
+
+    if label_values.dtype == object:
+        label_values = label_values.astype(str)
+
+    # dates of frames parsed in another process keep their dtype metadata through the pickle round trip, which
+    # np.savez warns about and does not store
+    if label_values.dtype.metadata is not None:
+        label_values = label_values.astype(np.dtype(label_values.dtype.str))
+
+    return label_values
+
+
+def frame_to_arrays(frame, prefix):
+    arrays = {f"{prefix}columns": _label_array(frame.columns)}
+
+    # a (country, province) index is stored as one label array per level
+    if isinstance(frame.index, pd.MultiIndex):
+        for level_number in range(frame.index.nlevels):
+            arrays[f"{prefix}index{level_number}"] = _label_array(frame.index.get_level_values(level_number))
+
+    else:
+        arrays[f"{prefix}index"] = _label_array(frame.index)
+
+    blocks = {}
+
+    for position, dtype in enumerate(frame.dtypes):
+        blocks.setdefault(dtype, []).append(position)
+
+    for block_number, (dtype, positions) in enumerate(blocks.items()):
+        arrays[f"{prefix}block{block_number}_positions"] = np.array(positions)
+        arrays[f"{prefix}block{block_number}_values"] = frame.iloc[:, positions].to_numpy(dtype=dtype)
+
+    frame_metadata = {"index_name": frame.index.name,
+                      "columns_name": frame.columns.name,
+                      "block_count": len(blocks)}
+
+    if isinstance(frame.index, pd.MultiIndex):
+        frame_metadata["index_names"] = list(frame.index.names)
+
+    return arrays, frame_metadata
+
+
+def arrays_to_frame(arrays, prefix, frame_metadata):
+    if "index_names" in frame_metadata:
+        index = pd.MultiIndex.from_arrays([arrays[f"{prefix}index{level_number}"]
+                                           for level_number in range(len(frame_metadata["index_names"]))],
+                                          names=frame_metadata["index_names"])
+
+    else:
+        index = pd.Index(arrays[f"{prefix}index"], name=frame_metadata["index_name"])
+    columns = pd.Index(arrays[f"{prefix}columns"], name=frame_metadata["columns_name"])
+
+    if frame_metadata["block_count"] == 1:
+        return pd.DataFrame(arrays[f"{prefix}block0_values"], index=index, columns=columns)
+
+    column_data = [None] * len(columns)
+
+    for block_number in range(frame_metadata["block_count"]):
+        positions = arrays[f"{prefix}block{block_number}_positions"]
+        values = arrays[f"{prefix}block{block_number}_values"]
+
+        for block_position, position in enumerate(positions):
+            column_data[position] = values[:, block_position]
+
+    frame = pd.DataFrame(dict(zip(range(len(columns)), column_data)), index=index)
+    frame.columns = columns
+
+    return frame
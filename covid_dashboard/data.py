@@ -1,144 +1,218 @@
-import os
-from operator import itemgetter
-from collections import OrderedDict
-from io import BytesIO
+import csv
 from zipfile import ZipFile
-from urllib.request import urlopen
 
+import numpy as np
 import pandas as pd
 
-from covid_dashboard.utils import change_date_format_to_dmy, format_date_string
+from covid_dashboard.instrumentation import instrumentation
+from covid_dashboard.utils import load_country_aliases
 
 
-def load_population_data(population_url, supported_countries):
+# labels of the JHU time series files, every other column is a date
+JHU_LABEL_COLUMNS = ("Province/State", "Country/Region", "Lat", "Long")
 
-    target_filepath = os.path.join(os.path.dirname(__file__),
-                                   "config",
-                                   "populations_of_supported_countries.csv")
+GOVEX_COUNT_COLUMNS = ("People_partially_vaccinated", "People_fully_vaccinated")
 
-    # print(target_filepath)
+CSV_ENGINES = ("c", "pyarrow")
 
-    if os.path.exists(target_filepath):
-        return pd.read_csv(target_filepath, index_col="Location")
+# index levels of the province rows of a JHU time series
+PROVINCE_INDEX_NAMES = ("Country/Region", "Province/State")
 
-    else:
-        print("Population .csv not found, downloading and parsing data. This may take some time")
 
-        resp = urlopen(population_url)
+def parse_population_data(population_source, supported_countries, year=2021, variant="Medium",
+                          chunk_size=250_000, country_aliases=None):
 
-        with ZipFile(BytesIO(resp.read())) as zipfile:
+    # the UN data uses different names for some of the supported countries
+    country_aliases = country_aliases or {}
+    supported_countries = set(supported_countries)
+    supported_locations = supported_countries | {un_name for un_name, country in country_aliases.items()
+                                                 if country in supported_countries}
 
-            csv_file_list = [filename for filename in zipfile.namelist() if ".csv" in filename]
+    with ZipFile(population_source) as zipfile:
 
-            if len(csv_file_list) != 1:
-                raise FileNotFoundError("Problem with .csv file in zip archive!")
+        csv_file_list = [filename for filename in zipfile.namelist() if ".csv" in filename]
 
-            csv_file_name = csv_file_list[0]
+        if len(csv_file_list) != 1:
+            raise FileNotFoundError("Problem with .csv file in zip archive!")
 
-            with zipfile.open(csv_file_name) as csv_data_file:
-                population_data = pd.read_csv(csv_data_file)
+        csv_file_name = csv_file_list[0]
 
-        reduced_popuation_data = population_data[
-            (population_data["Time"] == 2021) & (population_data["Variant"] == "Medium")]
-        reduced_popuation_data = reduced_popuation_data.groupby("Location").sum()
-        reduced_popuation_data.rename(index={"Czechia": "Czech Republic"},
-                                      inplace=True)
+        # the archive member is decompressed and parsed chunk by chunk, only the rows of the requested year,
+        # variant and countries are kept so peak memory stays bounded by the chunk size (the pyarrow engine
+        # cannot read in chunks, so this source always uses the C parser)
+        with zipfile.open(csv_file_name) as csv_data_file, instrumentation.timer("loader_stage_seconds",
+                                                                                 source="population",
+                                                                                 stage="parse"):
+            csv_chunks = pd.read_csv(csv_data_file,
+                                     usecols=["Location", "Variant", "Time", "PopMale", "PopFemale", "PopTotal"],
+                                     dtype={"Location": str, "Variant": str, "Time": "int64",
+                                            "PopMale": float, "PopFemale": float, "PopTotal": float},
+                                     chunksize=chunk_size)
 
-        supported_population_data = reduced_popuation_data.loc[reduced_popuation_data.index.isin(supported_countries)]
-        supported_population_data.loc[:, "PopTotal"] = pd.Series(supported_population_data.loc[:, "PopTotal"] * 1000, dtype=int)
+            population_data = pd.concat([chunk.loc[(chunk["Time"] == year) &
+                                                   (chunk["Variant"] == variant) &
+                                                   chunk["Location"].isin(supported_locations)]
+                                         for chunk in csv_chunks])
 
-        # drop all other columns except for those three
-        supported_population_data = supported_population_data.loc[:, ["PopMale", "PopFemale", "PopTotal"]]
+    with instrumentation.timer("loader_stage_seconds", source="population", stage="rename_filter"):
+        population_data["Location"] = apply_country_aliases(population_data["Location"], country_aliases)
 
-        # save .csv to avoid download and computational load on next run
-        supported_population_data.to_csv(target_filepath)
+    with instrumentation.timer("loader_stage_seconds", source="population", stage="groupby"):
+        reduced_popuation_data = population_data.groupby("Location")[["PopMale", "PopFemale", "PopTotal"]].sum()
 
-        return supported_population_data
+    supported_population_data = reduced_popuation_data.copy()
+    supported_population_data["PopTotal"] = (supported_population_data["PopTotal"] * 1000).astype(int)
 
+    return supported_population_data
 
-def load_infection_data(infections_url, supported_countries):
 
-    infection_data = pd.read_csv(infections_url)
-    infection_data.drop(columns=["Lat", "Long"], inplace=True)
-    grouped_infection_data = infection_data.groupby("Country/Region").sum()
-    grouped_infection_data.rename({"Moldova": "Republic of Moldova",
-                                   "Russia": "Russian Federation",
-                                   "Czechia": "Czech Republic"},
-                                  inplace=True)
-    infection_data = grouped_infection_data.loc[grouped_infection_data.index.isin(supported_countries)]
+def apply_country_aliases(countries, country_aliases):
+    # renames the distinct names once instead of comparing every row against every alias
+    if not country_aliases:
+        return countries
 
-    sorted_infection_dates = sorted([change_date_format_to_dmy(date) for date in infection_data.columns],
-                                    key=itemgetter(6, 7, 3, 4, 0, 1))
-    infection_data.columns = sorted_infection_dates
+    codes, unique_countries = pd.factorize(countries, use_na_sentinel=False)
+    renamed_countries = np.array([country_aliases.get(country, country) for country in unique_countries], dtype=object)
 
-    return infection_data
+    return pd.Series(renamed_countries[codes], index=countries.index, name=countries.name)
 
 
-def load_recovery_data(recoveries_url, supported_countries):
+def load_jhu_time_series(source_path, supported_countries, source_name="jhu", country_aliases=None,
+                         csv_engine="c", count_dtype="int64", keep_provinces=False):
+    # confirmed cases, recoveries and deaths all come in this format: one row per country or province with the
+    # cumulative count of every day as a column. keep_provinces returns the province rows with a
+    # (country, province) index sorted by country instead of the country sums, see ProvinceTable
 
-    recovery_data = pd.read_csv(recoveries_url)
-    recovery_data.drop(columns=["Lat", "Long"], inplace=True)
-    grouped_recovery_data = recovery_data.groupby("Country/Region").sum()
-    grouped_recovery_data.rename({"Moldova": "Republic of Moldova",
-                                  "Russia": "Russian Federation",
-                                  "Czechia": "Czech Republic"},
-                                 inplace=True)
-    recovery_data = grouped_recovery_data.loc[grouped_recovery_data.index.isin(supported_countries)]
+    with instrumentation.timer("loader_stage_seconds", source=source_name, stage="parse"):
+        # the header alone tells which columns are dates, so the coordinates are never read. The C parser
+        # handles a dtype per column of these ~1000 column files slower than inferring them, so the counts only
+        # get a declared schema with pyarrow and are converted after the aggregation otherwise
+        with open(source_path, "r", newline="") as source_file:
+            date_columns = [column for column in next(csv.reader(source_file)) if column not in JHU_LABEL_COLUMNS]
 
-    sorted_recovery_dates = sorted([change_date_format_to_dmy(date) for date in recovery_data.columns],
-                                   key=itemgetter(6, 7, 3, 4, 0, 1))
+        label_columns = ["Province/State", "Country/Region"] if keep_provinces else ["Country/Region"]
+        column_dtypes = {**dict.fromkeys(label_columns, str), **dict.fromkeys(date_columns, count_dtype)}
 
-    recovery_data.columns = sorted_recovery_dates
+        time_series_data = pd.read_csv(source_path,
+                                       usecols=label_columns + date_columns,
+                                       dtype=column_dtypes if csv_engine == "pyarrow" else None,
+                                       engine=csv_engine)
 
-    return recovery_data
+    with instrumentation.timer("loader_stage_seconds", source=source_name, stage="rename_filter"):
+        # rows of unsupported countries are dropped before the provinces are summed up
+        countries = apply_country_aliases(time_series_data.pop("Country/Region"), country_aliases)
+        supported_rows = countries.isin(supported_countries).to_numpy()
 
+    with instrumentation.timer("loader_stage_seconds", source=source_name, stage="groupby"):
+        if keep_provinces:
+            # the row of a country itself (e.g. mainland France next to its overseas regions) has no province
+            provinces = time_series_data.pop("Province/State").loc[supported_rows].fillna(value="")
+            time_series_data = time_series_data.loc[supported_rows]
+            time_series_data.index = pd.MultiIndex.from_arrays([countries.loc[supported_rows], provinces],
+                                                               names=PROVINCE_INDEX_NAMES)
+            time_series_data = time_series_data.sort_index(level=[0, 1])
 
-def load_vaccination_data(vaccinations_url, supported_countries):
+        else:
+            time_series_data = time_series_data.loc[supported_rows].groupby(countries.loc[supported_rows]).sum()
 
-    vaccination_data = pd.read_csv(vaccinations_url)
-    vaccination_data.loc[vaccination_data.loc[:, "Country_Region"] == "Czechia", "Country_Region"] = 'Czech Republic'
-    vaccination_data.loc[
-        vaccination_data.loc[:, "Country_Region"] == "Moldova", "Country_Region"] = 'Republic of Moldova'
-    vaccination_data.loc[vaccination_data.loc[:, "Country_Region"] == "Russia", "Country_Region"] = 'Russian Federation'
+        time_series_data = time_series_data.astype(count_dtype, copy=False)
 
-    reduced_vaccination_data = vaccination_data.loc[vaccination_data.loc[:, "Country_Region"].isin(supported_countries)]
-    reduced_vaccination_data = reduced_vaccination_data.groupby(["Country_Region", "Date"]).sum()
+    with instrumentation.timer("loader_stage_seconds", source=source_name, stage="date_parse"):
+        # the JHU columns are m/d/yy dates, parsed once into a DatetimeIndex in chronological order
+        time_series_data.columns = pd.to_datetime(time_series_data.columns, format="%m/%d/%y")
+        time_series_data = time_series_data.sort_index(axis=1)
 
-    partial_vaccination_data_frames = []
-    full_vaccination_data_frames = []
+    return time_series_data
 
-    for country in supported_countries:
-        country_data = reduced_vaccination_data.loc[reduced_vaccination_data.index.get_level_values(0) == country]
 
-        country_dates = [format_date_string(date) for date in country_data.index.get_level_values(1)]
+def load_govex_vaccinations(source_path, supported_countries, country_aliases=None, csv_engine="c"):
 
-        partial_vaccinations = country_data.loc[:, "People_partially_vaccinated"].to_numpy()
-        full_vaccinations = country_data.loc[:, "People_fully_vaccinated"].to_numpy()
+    with instrumentation.timer("loader_stage_seconds", source="vaccinations", stage="parse"):
+        # the counts have gaps, so they are parsed as floats
+        vaccination_data = pd.read_csv(source_path,
+                                       usecols=["Country_Region", "Date", *GOVEX_COUNT_COLUMNS],
+                                       dtype={"Country_Region": str, "Date": str,
+                                              **dict.fromkeys(GOVEX_COUNT_COLUMNS, "float64")},
+                                       engine=csv_engine)
 
-        country_name = (("Country/Region", pd.Series([country])),)
-        partial_vaccination_data = tuple((date_string, pd.Series([partial_doses])) for date_string, partial_doses in
-                                         zip(country_dates, partial_vaccinations))
-        full_vaccination_data = tuple(
-            (date_string, pd.Series([full_doses])) for date_string, full_doses in zip(country_dates, full_vaccinations))
+    with instrumentation.timer("loader_stage_seconds", source="vaccinations", stage="rename_filter"):
+        vaccination_data["Country_Region"] = apply_country_aliases(vaccination_data["Country_Region"], country_aliases)
 
-        partial_vaccinations = OrderedDict(country_name + partial_vaccination_data)
-        country_partial_vaccinations = pd.DataFrame(partial_vaccinations)
-        partial_vaccination_data_frames.append(country_partial_vaccinations)
+        reduced_vaccination_data = vaccination_data.loc[
+            vaccination_data.loc[:, "Country_Region"].isin(supported_countries)]
 
-        full_vaccinations = OrderedDict(country_name + full_vaccination_data)
-        country_full_vaccinations = pd.DataFrame(full_vaccinations)
-        full_vaccination_data_frames.append(country_full_vaccinations)
+    with instrumentation.timer("loader_stage_seconds", source="vaccinations", stage="groupby"):
+        # one (country x date) matrix per vaccination status in a single groupby/unstack, ISO dates sort
+        # chronologically
+        vaccination_matrix = reduced_vaccination_data.groupby(["Country_Region", "Date"]).sum()
+        vaccination_matrix = vaccination_matrix.unstack("Date", fill_value=0)
 
-    partial_vaccination_data = pd.concat(partial_vaccination_data_frames, ignore_index=True)
-    full_vaccination_data = pd.concat(full_vaccination_data_frames, ignore_index=True)
-    sorted_dates = sorted(partial_vaccination_data.columns, key=itemgetter(6, 7, 3, 4, 0, 1))
+        # countries without any reported vaccinations still get a row of zeros
+        vaccination_matrix = vaccination_matrix.reindex(sorted(set(supported_countries)), fill_value=0)
+        vaccination_matrix = vaccination_matrix.fillna(value=0).astype(int)
+        vaccination_matrix.index.name = "Country/Region"
 
-    partial_vaccination_data = partial_vaccination_data.loc[:, sorted_dates]
-    partial_vaccination_data = partial_vaccination_data.groupby("Country/Region").sum()
-    partial_vaccination_data = partial_vaccination_data.astype(int)
+        partial_vaccination_data = vaccination_matrix.loc[:, "People_partially_vaccinated"]
+        full_vaccination_data = vaccination_matrix.loc[:, "People_fully_vaccinated"]
 
-    full_vaccination_data = full_vaccination_data.loc[:, sorted_dates]
-    full_vaccination_data = full_vaccination_data.groupby("Country/Region").sum()
-    full_vaccination_data = full_vaccination_data.astype(int)
+    with instrumentation.timer("loader_stage_seconds", source="vaccinations", stage="date_parse"):
+        vaccination_dates = pd.to_datetime(partial_vaccination_data.columns, format="%Y-%m-%d").rename(None)
+        partial_vaccination_data.columns = vaccination_dates
+        full_vaccination_data.columns = vaccination_dates
 
     return partial_vaccination_data, full_vaccination_data
+
+
+# the `format` of a source section in dashboard.cfg -> its loader, a new source in one of these formats only
+# needs a config section
+SOURCE_FORMATS = {"un_population": parse_population_data,
+                  "jhu_time_series": load_jhu_time_series,
+                  "govex_vaccinations": load_govex_vaccinations}
+
+
+def source_loader_options(config, source_name):
+    # keyword arguments of the loader of a source, they are part of the cache key so a config change re-parses
+    source_config = config[source_name]
+    source_format = source_config["format"]
+
+    if source_format not in SOURCE_FORMATS:
+        raise ValueError(f"Unknown format '{source_format}' of data source '{source_name}'")
+
+    loader_options = {"country_aliases": load_country_aliases()}
+
+    if source_format == "un_population":
+        loader_options["year"] = source_config.getint("year", 2021)
+
+    else:
+        loader_options["csv_engine"] = csv_engine_from_config(config)
+
+    if source_format == "jhu_time_series":
+        loader_options["source_name"] = source_name
+        loader_options["count_dtype"] = source_config.get("count_dtype", "int64")
+        loader_options["keep_provinces"] = source_config.getboolean("provinces", False)
+
+    return SOURCE_FORMATS[source_format], loader_options
+
+
+def csv_engine_from_config(config):
+    csv_engine = config["loading"].get("csv_engine", "c")
+
+    if csv_engine not in CSV_ENGINES:
+        raise ValueError(f"Unknown csv_engine '{csv_engine}', expected one of {', '.join(CSV_ENGINES)}")
+
+    if csv_engine == "pyarrow" and not pyarrow_available():
+        print("pyarrow is not available, parsing the sources with the C engine")
+        return "c"
+
+    return csv_engine
+
+
+def pyarrow_available():
+    # installed is not enough, e.g. a pyarrow built against another numpy fails on import
+    try:
+        import pyarrow
+
+    except ImportError:
+        return False
+
+    return True
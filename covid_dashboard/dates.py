@@ -0,0 +1,54 @@
+import numpy as np
+import pandas as pd
+
+
+DISPLAY_DATE_FORMAT = "%d/%m/%y"
+# plotly puts ISO dates on a date axis, they are formatted once per figure rather than serialized per trace
+ISO_DATE_FORMAT = "%Y-%m-%d"
+
+
+# All frames share one daily calendar (a sorted DatetimeIndex without gaps), so a date range is the same pair of
+# column positions in every frame and can be found by binary search. The calendar ends at the last date that every
+# frame reports: past the end of a source its counts would only be carried forward, and the daily increases of the
+# latest dates (the default date of the map) would be 0.
+def shared_calendar(frames):
+    first_date = min(frame.columns[0] for frame in frames)
+    last_date = min(frame.columns[-1] for frame in frames)
+
+    return pd.date_range(first_date, last_date, freq="D")
+
+
+def align_to_calendar(frame, calendar):
+    # the sources are cumulative counts: zero before the first report, the latest report is carried forward over
+    # missing days and after the last report
+    aligned_frame = frame.reindex(columns=calendar).ffill(axis=1).fillna(value=0)
+
+    return aligned_frame.astype(frame.dtypes.iloc[0])
+
+
+def date_range_positions(dates, start_date=None, end_date=None):
+    # [start, end) positions of the dates from start_date up to and including end_date
+    date_values = dates.to_numpy(dtype="datetime64[ns]")
+
+    start_position = 0 if start_date is None else np.searchsorted(date_values,
+                                                                  pd.Timestamp(start_date).to_datetime64(),
+                                                                  side="left")
+    end_position = len(date_values) if end_date is None else np.searchsorted(date_values,
+                                                                             pd.Timestamp(end_date).to_datetime64(),
+                                                                             side="right")
+
+    return int(start_position), int(end_position)
+
+
+def to_day_ordinals(dates):
+    # int32 days since 1970-01-01
+    return dates.to_numpy(dtype="datetime64[ns]").astype("datetime64[D]").astype(np.int32)
+
+
+def from_day_ordinals(day_ordinals):
+    return pd.DatetimeIndex(np.asarray(day_ordinals, dtype=np.int64).astype("datetime64[D]").astype("datetime64[ns]"))
+
+
+def format_dates(dates, date_format=DISPLAY_DATE_FORMAT):
+    # an array rather than a list, plotly validates lists element by element
+    return dates.strftime(date_format).to_numpy()
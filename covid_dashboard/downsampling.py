@@ -0,0 +1,93 @@
+import numpy as np
+import pandas as pd
+
+
+DOWNSAMPLING_METHODS = ("minmax", "lttb")
+
+
+def minmax_indices(values, max_points):
+    # the positions of the minimum and the maximum of every bucket plus the first and the last point, peaks
+    # survive which is what matters for infection curves
+    point_count = len(values)
+
+    if point_count <= max_points or max_points < 4:
+        return np.arange(point_count)
+
+    bucket_count = (max_points - 2) // 2
+    bucket_edges = np.linspace(0, point_count, bucket_count + 1).astype(int)
+    bucket_ids = np.repeat(np.arange(bucket_count), np.diff(bucket_edges))
+
+    # sorted by bucket and then by value, so every bucket starts with its minimum and ends with its maximum
+    order = np.lexsort((values, bucket_ids))
+    minimum_positions = order[bucket_edges[:-1]]
+    maximum_positions = order[bucket_edges[1:] - 1]
+
+    return np.unique(np.concatenate([[0, point_count - 1], minimum_positions, maximum_positions]))
+
+
+def lttb_indices(values, max_points):
+    # Largest-Triangle-Three-Buckets: per bucket the point that spans the largest triangle with the previously
+    # selected point and the average of the next bucket
+    point_count = len(values)
+
+    if point_count <= max_points or max_points < 3:
+        return np.arange(point_count)
+
+    positions = np.arange(point_count, dtype=float)
+    bucket_edges = np.linspace(1, point_count - 1, max_points - 1).astype(int)
+
+    selected_positions = np.empty(max_points, dtype=np.int64)
+    selected_positions[0] = 0
+    selected_positions[-1] = point_count - 1
+    previous_position = 0
+
+    for bucket in range(max_points - 2):
+        start, end = bucket_edges[bucket], bucket_edges[bucket + 1]
+        next_start = end
+        next_end = bucket_edges[bucket + 2] if bucket + 2 < len(bucket_edges) else point_count
+
+        average_position = positions[next_start:next_end].mean()
+        average_value = values[next_start:next_end].mean()
+
+        areas = np.abs((positions[previous_position] - average_position) *
+                       (values[start:end] - values[previous_position]) -
+                       (positions[previous_position] - positions[start:end]) *
+                       (average_value - values[previous_position]))
+
+        previous_position = start + int(np.argmax(areas))
+        selected_positions[bucket + 1] = previous_position
+
+    return selected_positions
+
+
+def downsample_indices(values, max_points, method="minmax"):
+    if not max_points:
+        return np.arange(len(values))
+
+    if method == "minmax":
+        return minmax_indices(values, max_points)
+
+    elif method == "lttb":
+        return lttb_indices(values, max_points)
+
+    else:
+        raise ValueError(f"Unknown downsampling method '{method}'")
+
+
+def visible_date_range(relayout_data):
+    # the x-axis range of a graph's relayoutData: (start, end) after zooming or panning, (None, None) after a
+    # reset, None if the event did not touch the x-axis
+    if not relayout_data:
+        return None
+
+    if relayout_data.get("xaxis.autorange"):
+        return None, None
+
+    if "xaxis.range[0]" in relayout_data and "xaxis.range[1]" in relayout_data:
+        return pd.Timestamp(relayout_data["xaxis.range[0]"]), pd.Timestamp(relayout_data["xaxis.range[1]"])
+
+    if "xaxis.range" in relayout_data:
+        range_start, range_end = relayout_data["xaxis.range"]
+        return pd.Timestamp(range_start), pd.Timestamp(range_end)
+
+    return None
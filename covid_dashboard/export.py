@@ -0,0 +1,309 @@
+import os
+import re
+import sys
+import html
+import json
+import time
+import hashlib
+import argparse
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+import plotly.io as pio
+from plotly.offline import get_plotlyjs
+
+from covid_dashboard.cache import SourceCache
+from covid_dashboard.figures import HOME_DISPLAY_MODES, INFECTION_DISPLAY_MODES, VACCINE_DISPLAY_MODES
+from covid_dashboard.figures import build_home_figure, build_infections_figure, build_vaccine_figure
+from covid_dashboard.figures import home_map_values
+from covid_dashboard.geometry import load_map_geometry, serialize_geometry
+from covid_dashboard.shared import attach_snapshot, shared_directory_from_config
+from covid_dashboard.snapshot import SnapshotStore
+from covid_dashboard.utils import CONFIG_DIRECTORY, load_config, resolve_path
+
+
+# part of every fingerprint, bump it when the exported files change for the same data
+EXPORT_FORMAT_VERSION = 1
+
+EXPORT_FORMATS = ("json", "html")
+
+# how plotly.js is referenced by the HTML files: a copy next to them, the plotly CDN, or inlined into every file
+PLOTLYJS_MODES = ("directory", "cdn", "inline")
+
+MANIFEST_NAME = "manifest.json"
+
+# views per task, fewer round trips to the worker processes than one task per view
+VIEWS_PER_TASK = 16
+
+
+def view_file_name(name):
+    return re.sub(r"[^A-Za-z0-9_-]+", "_", name).strip("_")
+
+
+def list_views(snapshot):
+    # (page, display mode, country) of every view, the home map shows all countries
+    views = [("home", display_mode, None) for display_mode in HOME_DISPLAY_MODES]
+
+    views += [("infections", display_mode, country)
+              for display_mode in INFECTION_DISPLAY_MODES
+              for country in snapshot.infection_modes[display_mode].index]
+
+    views += [("vaccinations", display_mode, country)
+              for display_mode in VACCINE_DISPLAY_MODES
+              for country in snapshot.full_vaccination_data.index]
+
+    return views
+
+
+def view_key(view):
+    page, display_mode, country = view
+
+    return "/".join([page, display_mode] + ([view_file_name(country)] if country is not None else []))
+
+
+def _hash_arrays(*arrays):
+    view_hash = hashlib.sha256()
+
+    for array in arrays:
+        view_hash.update(np.ascontiguousarray(array).tobytes())
+
+    return view_hash
+
+
+def view_fingerprints(snapshot, views, render_options):
+    # a hash of exactly the data a view shows plus the render options, a view is only rendered again when it changes
+    options_source = json.dumps([EXPORT_FORMAT_VERSION, render_options], sort_keys=True).encode("utf-8")
+
+    metric_cube = snapshot.metric_cube
+    day_ordinals = metric_cube.dates.to_numpy(dtype="datetime64[D]").astype(np.int64)
+
+    # the vaccination figures all start at the first date on which any country reported vaccinations
+    partial_vaccinations = snapshot.partial_vaccination_data.to_numpy()
+    first_vaccination_position = int(np.argmax((partial_vaccinations > 0).any(axis=0)))
+
+    fingerprints = {}
+
+    for view in views:
+        page, display_mode, country = view
+
+        if page == "home":
+            # the exported maps show the latest date
+            values, _ = home_map_values(metric_cube, display_mode, None)
+            view_hash = _hash_arrays(values, np.asarray([str(name) for name in metric_cube.countries], dtype="U"),
+                                     day_ordinals[-1:])
+
+        elif page == "infections":
+            view_hash = _hash_arrays(snapshot.infection_modes[display_mode].loc[country].to_numpy(), day_ordinals)
+
+        else:
+            vaccination_data = (snapshot.full_vaccination_data if "full" in display_mode
+                                else snapshot.partial_vaccination_data)
+            view_hash = _hash_arrays(vaccination_data.loc[country].to_numpy(), day_ordinals,
+                                     np.asarray([first_vaccination_position]),
+                                     np.asarray([snapshot.population_data.loc[country, "PopTotal"]]))
+
+        view_hash.update(options_source)
+        view_hash.update(page.encode("utf-8") + display_mode.encode("utf-8"))
+        fingerprints[view_key(view)] = view_hash.hexdigest()
+
+    return fingerprints
+
+
+# set in every worker process by _init_worker, so the snapshot is sent once per process instead of once per task
+_worker_state = {}
+
+
+def _init_worker(snapshot, map_geometry, output_directory, render_options):
+    _worker_state.update(snapshot=snapshot,
+                         map_geometry=map_geometry,
+                         output_directory=output_directory,
+                         render_options=render_options)
+
+
+def build_view_figure(snapshot, map_geometry, view, render_options):
+    # the figure builders of the pages, a country page shows the one country. The map is a go.Figure, the others
+    # are plain dicts
+    page, display_mode, country = view
+
+    if page == "home":
+        return build_home_figure(snapshot.metric_cube, map_geometry, display_mode)
+
+    elif page == "infections":
+        return build_infections_figure(snapshot.infection_modes, [country], display_mode, None,
+                                       render_options["max_points"], render_options["downsampling_method"])
+
+    else:
+        return build_vaccine_figure(snapshot.partial_vaccination_data, snapshot.full_vaccination_data,
+                                    snapshot.population_data, [country], display_mode, None,
+                                    render_options["max_points"], render_options["downsampling_method"])
+
+
+def render_views(views):
+    snapshot = _worker_state["snapshot"]
+    output_directory = _worker_state["output_directory"]
+    render_options = _worker_state["render_options"]
+
+    rendered_files = {}
+
+    for view in views:
+        page, display_mode, country = view
+        figure = build_view_figure(snapshot, _worker_state["map_geometry"], view, render_options)
+
+        file_stem = os.path.join(output_directory, *view_key(view).split("/"))
+        os.makedirs(os.path.dirname(file_stem), exist_ok=True)
+        files = []
+
+        if "json" in render_options["formats"]:
+            _write_atomically(f"{file_stem}.json", pio.to_json(figure, validate=False))
+            files.append(f"{view_key(view)}.json")
+
+        if "html" in render_options["formats"]:
+            title = html.escape(f"{country} - {display_mode}" if country is not None else display_mode)
+            include_plotlyjs = True if render_options["plotlyjs"] == "inline" else render_options["plotlyjs"]
+            html_page = pio.to_html(figure, include_plotlyjs=include_plotlyjs, full_html=True, validate=False,
+                                    config={"responsive": True})
+            _write_atomically(f"{file_stem}.html", html_page.replace("<head>", f"<head><title>{title}</title>", 1))
+            files.append(f"{view_key(view)}.html")
+
+        rendered_files[view_key(view)] = files
+
+    return rendered_files
+
+
+def _write_atomically(file_path, contents):
+    # readers (e.g. a CDN sync running at the same time) never see half written files
+    temporary_path = f"{file_path}.tmp"
+
+    with open(temporary_path, "w", encoding="utf-8") as output_file:
+        output_file.write(contents)
+
+    os.replace(temporary_path, file_path)
+
+
+def _read_manifest(output_directory):
+    try:
+        with open(os.path.join(output_directory, MANIFEST_NAME), "r") as manifest_file:
+            return json.load(manifest_file)
+
+    except (OSError, ValueError):
+        return {"views": {}}
+
+
+def export_views(snapshot, map_geometry, output_directory, render_options, processes=0, force=False):
+    # renders every view whose fingerprint changed since the last export, returns (rendered, unchanged) counts
+    os.makedirs(output_directory, exist_ok=True)
+
+    views = list_views(snapshot)
+    fingerprints = view_fingerprints(snapshot, views, render_options)
+    previous_views = _read_manifest(output_directory)["views"]
+
+    changed_views = [view for view in views
+                     if force or
+                     previous_views.get(view_key(view), {}).get("fingerprint") != fingerprints[view_key(view)]]
+
+    exported_views = {key: previous_view for key, previous_view in previous_views.items() if key in fingerprints}
+    processes = processes or os.cpu_count() or 1
+
+    print(f"{len(changed_views)} of {len(views)} views changed, rendering them with {processes} processes")
+
+    if render_options["plotlyjs"] == "directory" and "html" in render_options["formats"]:
+        # the HTML files refer to plotly.min.js in their own directory
+        for page_directory in {view_key(view).rsplit("/", 1)[0] for view in changed_views}:
+            plotlyjs_path = os.path.join(output_directory, *page_directory.split("/"), "plotly.min.js")
+
+            if not os.path.exists(plotlyjs_path):
+                os.makedirs(os.path.dirname(plotlyjs_path), exist_ok=True)
+                _write_atomically(plotlyjs_path, get_plotlyjs())
+
+    tasks = [changed_views[position:position + VIEWS_PER_TASK]
+             for position in range(0, len(changed_views), VIEWS_PER_TASK)]
+
+    start_time = time.perf_counter()
+    rendered_count = 0
+    last_report_time = 0.0
+
+    with ProcessPoolExecutor(max_workers=processes, initializer=_init_worker,
+                             initargs=(snapshot, map_geometry, output_directory, render_options)) as executor:
+        for task_future in as_completed([executor.submit(render_views, task_views) for task_views in tasks]):
+            for key, files in task_future.result().items():
+                exported_views[key] = {"fingerprint": fingerprints[key], "files": files}
+                rendered_count += 1
+
+            elapsed_time = time.perf_counter() - start_time
+
+            if elapsed_time - last_report_time >= 1 or rendered_count == len(changed_views):
+                last_report_time = elapsed_time
+                print(f"Rendered {rendered_count}/{len(changed_views)} views "
+                      f"({rendered_count / max(elapsed_time, 1e-9):.1f} views/s)")
+
+    # files of views that no longer exist, e.g. of a country that was removed
+    current_files = {file_name for exported_view in exported_views.values() for file_name in exported_view["files"]}
+
+    for previous_view in previous_views.values():
+        for file_name in previous_view["files"]:
+            if file_name not in current_files:
+                try:
+                    os.remove(os.path.join(output_directory, *file_name.split("/")))
+
+                except FileNotFoundError:
+                    pass
+
+    _write_atomically(os.path.join(output_directory, MANIFEST_NAME),
+                      json.dumps({"data_version": snapshot.data_version,
+                                  "exported_at": time.time(),
+                                  "views": exported_views}, indent=1, sort_keys=True))
+
+    return len(changed_views), len(views) - len(changed_views)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export every view of the dashboard as static figure JSON and HTML")
+    parser.add_argument("output_directory", nargs="?",
+                        help="where the views are written, [export] directory by default")
+    parser.add_argument("--processes", type=int, help="worker processes, [export] processes by default")
+    parser.add_argument("--formats", nargs="+", choices=EXPORT_FORMATS, help="[export] formats by default")
+    parser.add_argument("--plotlyjs", choices=PLOTLYJS_MODES, help="[export] plotlyjs by default")
+    parser.add_argument("--shared", action="store_true",
+                        help="export the snapshot published by covid_dashboard.publish instead of loading the data")
+    parser.add_argument("--force", action="store_true", help="render every view, also the unchanged ones")
+    arguments = parser.parse_args()
+
+    config = load_config()
+    export_config = config["export"]
+
+    with open(os.path.join(CONFIG_DIRECTORY, "supported_countries.json"), "r") as country_file:
+        supported_countries = json.load(country_file)["countries"]
+
+    if arguments.shared:
+        snapshot = attach_snapshot(shared_directory_from_config(config))
+
+    else:
+        snapshot_store = SnapshotStore(config, SourceCache.from_config(config), supported_countries)
+        snapshot = snapshot_store.current
+        snapshot_store.stop()
+
+    map_geometry = load_map_geometry(config, supported_countries)
+
+    render_options = {"formats": sorted(arguments.formats or export_config.get("formats", "json html").split()),
+                      "plotlyjs": arguments.plotlyjs or export_config.get("plotlyjs", "directory"),
+                      "max_points": config["downsampling"].getint("max_points", 0),
+                      "downsampling_method": config["downsampling"].get("method", "minmax"),
+                      # the maps embed the outlines, a change of the [map] settings re-renders them
+                      "map_geometry": serialize_geometry(map_geometry)[1]}
+
+    if render_options["plotlyjs"] not in PLOTLYJS_MODES:
+        sys.exit(f"Unknown plotlyjs mode '{render_options['plotlyjs']}'")
+
+    output_directory = arguments.output_directory or resolve_path(export_config.get("directory", "export"))
+    processes = arguments.processes if arguments.processes is not None else export_config.getint("processes", 0)
+
+    start_time = time.perf_counter()
+    rendered_count, unchanged_count = export_views(snapshot, map_geometry, output_directory, render_options,
+                                                   processes=processes, force=arguments.force)
+
+    print(f"Exported data version {snapshot.data_version} to {output_directory} in "
+          f"{time.perf_counter() - start_time:.1f}s ({rendered_count} rendered, {unchanged_count} unchanged)")
+
+
+if __name__ == "__main__":
+    main()
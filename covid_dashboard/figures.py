@@ -0,0 +1,491 @@
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import plotly.graph_objects as go
+import plotly.io as pio
+
+from covid_dashboard.dates import ISO_DATE_FORMAT, format_dates
+from covid_dashboard.downsampling import downsample_indices
+from covid_dashboard.metrics import INFECTION_MODE_WINDOWS
+
+
+# the display modes offered by the dropdowns of the pages
+HOME_DISPLAY_MODES = ("fully_vaccinated", "partially_vaccinated", "three_day_incidence", "seven_day_incidence",
+                      "fourteen_day_incidence", "three_day_avg", "seven_day_avg", "fourteen_day_avg")
+INFECTION_DISPLAY_MODES = ("total", "daily", "3_day_average", "7_day_average", "14_day_average")
+VACCINE_DISPLAY_MODES = ("partial", "partial_percentage", "full", "full_percentage")
+
+
+def normalize_country_selection(selected_countries):
+
+    if selected_countries is None:
+        return []
+
+    if isinstance(selected_countries, str):
+        return [selected_countries]
+
+    if not isinstance(selected_countries, (list, tuple)):
+        raise TypeError("Parameter 'selected_countries' is of unsupported type")
+
+    return list(selected_countries)
+
+
+def home_map_values(metric_cube, display_mode, date_position):
+
+    if display_mode == "fully_vaccinated":
+        metric_name = "full_vaccination_percentage"
+        hover_template_extra_text = "<b>%{z}%</b> of population fully vaccinated"
+
+    elif display_mode == "partially_vaccinated":
+        metric_name = "partial_vaccination_percentage"
+        hover_template_extra_text = "<b>%{z}%</b> of population partially vaccinated"
+
+    elif display_mode == "three_day_avg":
+        metric_name = "three_day_avg_infections"
+        hover_template_extra_text = "On average <b>%{z}</b> new cases over the last <b>3 days</b>"
+
+    elif display_mode == "seven_day_avg":
+        metric_name = "seven_day_avg_infections"
+        hover_template_extra_text = "On average <b>%{z}</b> new cases over the last <b>7 days</b>"
+
+    elif display_mode == "fourteen_day_avg":
+        metric_name = "fourteen_day_avg_infections"
+        hover_template_extra_text = "On average <b>%{z}</b> new cases over the last <b>14 days</b>"
+
+    elif display_mode == "three_day_incidence":
+        metric_name = "three_day_incidence"
+        hover_template_extra_text = "<b>%{z}</b> new cases over the last <b>3 days</b>"
+
+    elif display_mode == "seven_day_incidence":
+        metric_name = "seven_day_incidence"
+        hover_template_extra_text = "<b>%{z}</b> new cases over the last <b>7 days</b>"
+
+    elif display_mode == "fourteen_day_incidence":
+        metric_name = "fourteen_day_incidence"
+        hover_template_extra_text = "<b>%{z}</b> new cases over the last <b>14 days</b>"
+
+    else:
+        raise ValueError(f"Unknown display mode: '{display_mode}'")
+
+    if date_position is None:
+        date_position = len(metric_cube.dates) - 1
+
+    values_for_graph = metric_cube.metric_values(metric_name, date_position)
+
+    # a compact (float32) cube would be sent as e.g. 12.340000152587891 instead of 12.34
+    if values_for_graph.dtype != np.float64:
+        values_for_graph = np.round(values_for_graph.astype(np.float64), 2)
+    hover_template = "<b>%{location}</b><br>" + f"<extra>{hover_template_extra_text}</extra>"
+
+    return values_for_graph, hover_template
+
+
+def build_home_figure(metric_cube, map_geometry, display_mode=None, date_position=None):
+    # map_geometry is either the GeoJSON itself or the URL the browser loads it from, without a display mode
+    # the trace has no values yet and is filled in by patches from the map callback
+    if display_mode is None:
+        values_for_graph, hover_template = [], None
+
+    else:
+        values_for_graph, hover_template = home_map_values(metric_cube, display_mode, date_position)
+
+    fig = go.Figure()
+
+    map_trace = go.Choroplethmapbox(geojson=map_geometry,
+                                    locations=metric_cube.countries,
+                                    featureidkey="properties.name_long",
+                                    z=values_for_graph,
+                                    colorscale="blues",
+                                    marker_opacity=0.6,
+                                    hovertemplate=hover_template)
+
+    fig.add_trace(map_trace)
+
+    fig.update_layout(title={"text": "Test 123"},
+                      mapbox_style="carto-positron",
+                      mapbox_zoom=2.9,
+                      mapbox_center={"lat": 57.20756956834978,
+                                     "lon": 11.988806419969213},
+                      margin={"r": 0,
+                              "t": 0,
+                              "l": 0,
+                              "b": 0})
+
+    fig.update_geos(
+        fitbounds="locations",
+        resolution=50,
+        visible=False,
+        showframe=False,
+        projection={"type": "mercator"},
+    )
+
+    return fig
+
+
+def visible_positions(dates, date_positions, first_position=0):
+    # the requested [start, end) positions plus one date on either side, so the lines run to the edges of the view
+    start_position, end_position = date_positions if date_positions is not None else (0, len(dates))
+
+    return max(start_position - 1, first_position), min(end_position + 1, len(dates))
+
+
+def selected_rows(frame, selected_countries):
+    # the row positions of the selected countries, their values are taken with one fancy index instead of a .loc
+    # per country
+    row_positions = frame.index.get_indexer(selected_countries)
+
+    if (row_positions < 0).any():
+        unknown_countries = [str(country) for country, row in zip(selected_countries, row_positions) if row < 0]
+        raise KeyError(f"Unknown countries: {', '.join(unknown_countries)}")
+
+    return row_positions
+
+
+def selected_traces(selected_countries, province_table=None):
+    # (names, legend groups, country rows, province rows, province trace mask) of the traces of the selection, in
+    # selection order. Countries with provinces in the province_table get one trace per province instead of their
+    # total, the rows of a country's provinces are one slice of the province frames
+    names = []
+    legend_groups = []
+    countries = []
+    province_rows = []
+    province_traces = []
+
+    for current_country in selected_countries:
+
+        if province_table is not None and province_table.has_provinces(current_country):
+            country_rows = province_table.country_rows(current_country)
+            province_rows.append(np.arange(country_rows.start, country_rows.stop))
+
+            for province in province_table.country_provinces(current_country):
+                names.append(f"{current_country}: {province}" if province else current_country)
+                legend_groups.append(current_country)
+                province_traces.append(True)
+
+            continue
+
+        names.append(current_country)
+        legend_groups.append(None)
+        countries.append(current_country)
+        province_traces.append(False)
+
+    province_rows = np.concatenate(province_rows) if province_rows else np.empty(0, dtype=np.intp)
+
+    return names, legend_groups, countries, province_rows, np.asarray(province_traces, dtype=bool)
+
+
+def trace_values(country_frame, province_frame, traces, start_position, end_position):
+    # (trace x date) values of the traces from selected_traces, one fancy index per frame
+    _, _, countries, province_rows, province_traces = traces
+    values = np.empty((len(province_traces), end_position - start_position), dtype=float)
+
+    values[~province_traces] = country_frame.to_numpy()[selected_rows(country_frame, countries),
+                                                        start_position:end_position]
+
+    if province_traces.any():
+        values[province_traces] = province_frame.to_numpy()[province_rows, start_position:end_position]
+
+    return values
+
+
+def scatter_traces(x_axis_dates, values, names, max_points, downsampling_method, legend_groups=None):
+    # one line per row of values, as plain dicts: the figures are sent as JSON, building them through the
+    # validating plotly constructors costs more than the figure itself
+    traces = []
+
+    for position, row_values in enumerate(values):
+        kept_positions = downsample_indices(row_values, max_points, downsampling_method)
+        trace = {"type": "scatter", "mode": "lines", "name": names[position]}
+
+        if len(kept_positions) < len(row_values):
+            trace.update(x=x_axis_dates[kept_positions], y=row_values[kept_positions])
+
+        else:
+            trace.update(x=x_axis_dates, y=row_values)
+
+        if legend_groups is not None and legend_groups[position] is not None:
+            trace["legendgroup"] = legend_groups[position]
+
+        traces.append(trace)
+
+    return traces
+
+
+_figure_templates = {}
+
+
+def figure_template():
+    # go.Figure applies the default template itself, the plain dict figures carry it so they look the same
+    template_name = pio.templates.default
+
+    if template_name not in _figure_templates:
+        _figure_templates[template_name] = pio.templates[template_name].to_plotly_json() if template_name else {}
+
+    return _figure_templates[template_name]
+
+
+def build_infections_figure(infection_modes, selected_countries, display_mode, date_positions=None, max_points=0,
+                            downsampling_method="minmax", province_table=None, province_modes=None):
+    # date_positions restricts the traces to the dates of a zoomed in view, traces with more than max_points dates
+    # are downsampled. With a province_table (and the province_modes on its rows) countries that have provinces
+    # get one trace per province instead of their total
+    if display_mode not in infection_modes:
+        raise ValueError(f"Unknown display mode '{display_mode}'")
+
+    mode_data = infection_modes[display_mode]
+    start_position, end_position = visible_positions(mode_data.columns, date_positions)
+    x_axis_dates = format_dates(mode_data.columns[start_position:end_position], ISO_DATE_FORMAT)
+
+    traces = selected_traces(selected_countries, province_table)
+    names, legend_groups = traces[:2]
+    values = trace_values(mode_data, province_modes[display_mode] if province_modes else None, traces,
+                          start_position, end_position)
+
+    # uirevision keeps the user's zoom when the figure is replaced with the detail of the zoomed in range
+    return {"data": scatter_traces(x_axis_dates, values, names, max_points, downsampling_method, legend_groups),
+            "layout": {"template": figure_template(),
+                       "xaxis": {"type": "date",
+                                 "tickmode": "auto",
+                                 "nticks": 10},
+                       "uirevision": display_mode}}
+
+
+def build_vaccine_figure(partial_vaccination_data, full_vaccination_data, population_data,
+                         selected_countries, display_mode, date_positions=None, max_points=0,
+                         downsampling_method="minmax"):
+
+    if "full" in display_mode:
+        vaccination_data = full_vaccination_data
+
+    elif "partial" in display_mode:
+        vaccination_data = partial_vaccination_data
+
+    else:
+        raise ValueError(f"Unknown display mode '{display_mode}'")
+
+    # the frames are on the shared calendar, which starts long before the first vaccinations
+    first_position = int(np.argmax((partial_vaccination_data.to_numpy() > 0).any(axis=0)))
+    start_position, end_position = visible_positions(full_vaccination_data.columns, date_positions, first_position)
+    x_axis_dates = format_dates(full_vaccination_data.columns[start_position:end_position], ISO_DATE_FORMAT)
+
+    values = vaccination_data.to_numpy(dtype=float)[selected_rows(vaccination_data, selected_countries),
+                                                    start_position:end_position]
+
+    if "percentage" in display_mode:
+        populations = population_data["PopTotal"].to_numpy(dtype=float)[selected_rows(population_data,
+                                                                                       selected_countries)]
+        values = 100 * values / populations[:, None]
+
+    values[np.isnan(values)] = 0.0
+
+    layout = {"template": figure_template(),
+              "xaxis": {"type": "date",
+                        "tickmode": "auto",
+                        "nticks": 10},
+              "uirevision": display_mode}
+
+    if "percentage" in display_mode:
+        layout["yaxis"] = {"range": [0, 100],
+                           "title": {"text": "% of population"}}
+
+    return {"data": scatter_traces(x_axis_dates, values, list(selected_countries), max_points, downsampling_method),
+            "layout": layout}
+
+
+def downsampled_modes(mode_values, mode_scales, max_points, downsampling_method):
+    # the points that the downsampling keeps of every (trace x date) array in mode_values, per trace
+    # [{display mode: [date offsets, values]}]. The values are sent as whole numbers, multiplied by their mode's
+    # scale (the length of a rolling window), and divided again in the browser
+    modes = [{} for _ in next(iter(mode_values.values()))]
+
+    for display_mode, values in mode_values.items():
+        for position, row_values in enumerate(values):
+            kept_positions = downsample_indices(row_values, max_points, downsampling_method)
+            modes[position][display_mode] = [kept_positions.tolist(),
+                                             np.rint(row_values[kept_positions] * mode_scales.get(display_mode, 1))
+                                             .astype(np.int64).tolist()]
+
+    return modes
+
+
+def infection_series(infection_modes, selected_countries, date_positions=None, max_points=0,
+                     downsampling_method="minmax", province_table=None, province_modes=None):
+    # the base series of the infections page for the clientside infections_figure (assets/clientside.js), which
+    # computes every display mode from the daily counts. They start up to LOOKBACK_DAYS - 1 dates before the
+    # visible ones so that the rolling windows of the first visible date are complete. Once the daily counts would
+    # be longer than the downsampled points of all display modes, every mode is downsampled here instead, so the
+    # payload stays bounded however long the range is
+    daily_infections = infection_modes["daily"]
+
+    start_position, end_position = visible_positions(daily_infections.columns, date_positions)
+    first_position = max(start_position - (max(INFECTION_MODE_WINDOWS.values()) - 1), 0)
+
+    traces = selected_traces(selected_countries, province_table)
+    names, legend_groups = traces[:2]
+
+    # a downsampled point is a date offset and a value
+    downsampled = max_points and end_position - first_position > 2 * len(INFECTION_DISPLAY_MODES) * max_points
+
+    if downsampled:
+        modes = downsampled_modes({display_mode: trace_values(infection_modes[display_mode],
+                                                              province_modes[display_mode] if province_modes else None,
+                                                              traces, start_position, end_position)
+                                   for display_mode in INFECTION_DISPLAY_MODES},
+                                  INFECTION_MODE_WINDOWS, max_points, downsampling_method)
+
+    else:
+        # the daily counts are whole numbers, also when the modes are stored as floats
+        daily_values = np.rint(trace_values(daily_infections, province_modes["daily"] if province_modes else None,
+                                            traces, first_position, end_position)).astype(np.int64).tolist()
+        first_totals = trace_values(infection_modes["total"], province_modes["total"] if province_modes else None,
+                                    traces, first_position, first_position + 1)[:, 0].astype(np.int64).tolist()
+
+    data = []
+
+    for position, name in enumerate(names):
+        trace = {"name": name}
+
+        if legend_groups[position] is not None:
+            trace["legendgroup"] = legend_groups[position]
+
+        if downsampled:
+            data.append({**trace, "modes": modes[position]})
+
+        else:
+            data.append({**trace, "daily": daily_values[position], "first_total": first_totals[position]})
+
+    if downsampled:
+        return {"first_date": daily_infections.columns[start_position].strftime(ISO_DATE_FORMAT),
+                "windows": INFECTION_MODE_WINDOWS,
+                "data": data}
+
+    return {"dates": format_dates(daily_infections.columns[first_position:end_position], ISO_DATE_FORMAT).tolist(),
+            "first_position": first_position,
+            "lookback": start_position - first_position,
+            "windows": INFECTION_MODE_WINDOWS,
+            "max_points": max_points,
+            "downsampling_method": downsampling_method,
+            "data": data}
+
+
+def vaccine_series(partial_vaccination_data, full_vaccination_data, population_data, selected_countries,
+                   date_positions=None, max_points=0, downsampling_method="minmax"):
+    # the base series of the vaccinations page for the clientside vaccine_figure, the percentages are the counts
+    # scaled by the population of each country. Like infection_series, ranges with more than twice max_points
+    # dates send the downsampled counts instead, the percentages keep the points of the counts
+    first_position = int(np.argmax((partial_vaccination_data.to_numpy() > 0).any(axis=0)))
+    start_position, end_position = visible_positions(full_vaccination_data.columns, date_positions, first_position)
+
+    downsampled = max_points and end_position - start_position > 2 * max_points
+    counts = {}
+
+    for field_name, vaccination_data in (("partial", partial_vaccination_data), ("full", full_vaccination_data)):
+        values = vaccination_data.to_numpy()[selected_rows(vaccination_data, selected_countries),
+                                             start_position:end_position]
+
+        if np.issubdtype(values.dtype, np.floating):
+            values = np.nan_to_num(values, nan=0.0)
+
+        counts[field_name] = values.astype(np.int64)
+
+    populations = population_data["PopTotal"].to_numpy()[selected_rows(population_data, selected_countries)]
+
+    if downsampled:
+        modes = downsampled_modes(counts, {}, max_points, downsampling_method)
+        series = {"first_date": full_vaccination_data.columns[start_position].strftime(ISO_DATE_FORMAT)}
+
+    else:
+        series = {"dates": format_dates(full_vaccination_data.columns[start_position:end_position],
+                                        ISO_DATE_FORMAT).tolist(),
+                  "max_points": max_points,
+                  "downsampling_method": downsampling_method}
+
+    data = []
+
+    for position, current_country in enumerate(selected_countries):
+        trace = {"name": current_country}
+
+        if downsampled:
+            trace["modes"] = modes[position]
+
+        else:
+            trace.update(partial=counts["partial"][position].tolist(), full=counts["full"][position].tolist())
+
+        # null while the population source is missing
+        trace["population"] = None if np.isnan(populations[position]) else int(populations[position])
+        data.append(trace)
+
+    return {**series, "data": data}
+
+
+def order_traces(figure, selected_countries):
+    # cached figures are built for the sorted selection, restore the order in which the countries were picked. The
+    # province traces of a country share its legendgroup
+    traces_by_country = {}
+
+    for trace in figure["data"]:
+        traces_by_country.setdefault(trace.get("legendgroup", trace["name"]), []).append(trace)
+
+    return {**figure, "data": [trace for country in selected_countries for trace in traces_by_country[country]]}
+
+
+# Bounded LRU cache of plotly figure dicts. Entries belong to one data version, as soon as a callback asks with a
+# different version the whole cache is dropped.
+class FigureCache:
+
+    def __init__(self, max_entries=256):
+        self.max_entries = max_entries
+        self.data_version = None
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_config(cls, config):
+        return cls(max_entries=config["figure_cache"].getint("max_entries", 256))
+
+    def get_or_build(self, key, data_version, build_figure):
+
+        with self._lock:
+            if data_version != self.data_version:
+                self._entries.clear()
+                self.data_version = data_version
+
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+
+                return self._entries[key]
+
+            self.misses += 1
+
+        # built outside of the lock, two concurrent misses for the same key just build the figure twice
+        figure = build_figure()
+
+        with self._lock:
+            if data_version == self.data_version and self.max_entries > 0:
+                self._entries[key] = figure
+
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+                    self.evictions += 1
+
+        return figure
+
+    def stats(self):
+
+        with self._lock:
+            lookups = self.hits + self.misses
+
+            return {"entries": len(self._entries),
+                    "max_entries": self.max_entries,
+                    "hits": self.hits,
+                    "misses": self.misses,
+                    "evictions": self.evictions,
+                    "hit_rate": self.hits / lookups if lookups else 0.0,
+                    "data_version": self.data_version}
@@ -0,0 +1,106 @@
+import os
+import json
+import hashlib
+
+import numpy as np
+
+from covid_dashboard.utils import CONFIG_DIRECTORY
+
+
+def simplify_ring(ring, tolerance):
+    # iterative Douglas-Peucker on one closed ring, keeps the ring as is if it would collapse
+    points = np.asarray(ring, dtype=float)
+
+    if len(points) <= 4 or tolerance <= 0:
+        return ring
+
+    keep = np.zeros(len(points), dtype=bool)
+    keep[0] = keep[-1] = True
+    segments = [(0, len(points) - 1)]
+
+    while segments:
+        start, end = segments.pop()
+
+        if end - start < 2:
+            continue
+
+        inner_points = points[start + 1:end]
+        segment = points[end] - points[start]
+        segment_length = np.hypot(segment[0], segment[1])
+        offsets = inner_points - points[start]
+
+        if segment_length == 0:
+            distances = np.hypot(offsets[:, 0], offsets[:, 1])
+
+        else:
+            distances = np.abs(segment[0] * offsets[:, 1] - segment[1] * offsets[:, 0]) / segment_length
+
+        farthest = int(np.argmax(distances))
+
+        if distances[farthest] > tolerance:
+            split = start + 1 + farthest
+            keep[split] = True
+            segments.append((start, split))
+            segments.append((split, end))
+
+    if keep.sum() < 4:
+        return ring
+
+    return points[keep].tolist()
+
+
+def simplify_geometry(map_geometry, country_names=None, tolerance=0.0, precision=None):
+    # lighter copy of the map GeoJSON: only the given countries, simplified rings and rounded coordinates
+    features = []
+
+    for feature in map_geometry["features"]:
+        if country_names is not None and feature["properties"]["name_long"] not in country_names:
+            continue
+
+        geometry = feature["geometry"]
+        polygons = geometry["coordinates"] if geometry["type"] == "MultiPolygon" else [geometry["coordinates"]]
+
+        simplified_polygons = []
+
+        for polygon in polygons:
+            simplified_polygon = []
+
+            for ring in polygon:
+                simplified_ring = simplify_ring(ring, tolerance)
+
+                if precision is not None:
+                    simplified_ring = np.round(np.asarray(simplified_ring, dtype=float), precision).tolist()
+
+                simplified_polygon.append(simplified_ring)
+
+            simplified_polygons.append(simplified_polygon)
+
+        # the map only needs the property that the traces are matched on
+        features.append({"type": "Feature",
+                         "properties": {"name_long": feature["properties"]["name_long"]},
+                         "geometry": {"type": geometry["type"],
+                                      "coordinates": simplified_polygons if geometry["type"] == "MultiPolygon"
+                                      else simplified_polygons[0]}})
+
+    return {"type": "FeatureCollection", "features": features}
+
+
+def serialize_geometry(map_geometry):
+    geometry_bytes = json.dumps(map_geometry, separators=(",", ":")).encode("utf-8")
+
+    return geometry_bytes, hashlib.sha256(geometry_bytes).hexdigest()[:16]
+
+
+def load_map_geometry(config, supported_countries):
+    # the country outlines as configured in the [map] section, shared by the dashboard and the static export
+    with open(os.path.join(CONFIG_DIRECTORY, "map.geojson"), "r") as geo_data:
+        map_geometry = json.load(geo_data)
+
+    map_config = config["map"]
+    coordinate_precision = map_config.get("coordinate_precision", "")
+
+    return simplify_geometry(map_geometry,
+                             country_names=set(supported_countries)
+                             if map_config.getboolean("supported_countries_only", True) else None,
+                             tolerance=map_config.getfloat("simplify_tolerance", 0.0),
+                             precision=int(coordinate_precision) if coordinate_precision else None)
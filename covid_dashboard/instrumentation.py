@@ -0,0 +1,140 @@
+import sys
+import json
+import time
+import threading
+from contextlib import contextmanager
+
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+SIZE_BUCKETS = (1_000, 10_000, 100_000, 250_000, 1_000_000, 2_500_000, 10_000_000)
+
+METRIC_PREFIX = "covid_dashboard_"
+
+
+class Histogram:
+
+    def __init__(self, name, description, label_names, buckets):
+        self.name = name
+        self.description = description
+        self.label_names = label_names
+        self.buckets = buckets
+
+        # label values -> [per bucket counts..., +Inf count], sum
+        self._bucket_counts = {}
+        self._sums = {}
+
+    def observe(self, value, label_values):
+        if label_values not in self._bucket_counts:
+            self._bucket_counts[label_values] = [0] * (len(self.buckets) + 1)
+            self._sums[label_values] = 0.0
+
+        bucket_counts = self._bucket_counts[label_values]
+
+        for position, upper_bound in enumerate(self.buckets):
+            if value <= upper_bound:
+                bucket_counts[position] += 1
+
+        bucket_counts[-1] += 1
+        self._sums[label_values] += value
+
+    def render(self):
+        metric_name = METRIC_PREFIX + self.name
+        lines = [f"# HELP {metric_name} {self.description}",
+                 f"# TYPE {metric_name} histogram"]
+
+        for label_values, bucket_counts in sorted(self._bucket_counts.items()):
+            labels = [f'{label_name}="{_escape_label(label_value)}"'
+                      for label_name, label_value in zip(self.label_names, label_values)]
+
+            for upper_bound, count in zip(self.buckets + ("+Inf",), bucket_counts):
+                bucket_labels = ",".join(labels + [f'le="{upper_bound}"'])
+                lines.append(f"{metric_name}_bucket{{{bucket_labels}}} {count}")
+
+            label_text = "{" + ",".join(labels) + "}" if labels else ""
+            lines.append(f"{metric_name}_sum{label_text} {self._sums[label_values]}")
+            lines.append(f"{metric_name}_count{label_text} {bucket_counts[-1]}")
+
+        return lines
+
+
+# Opt-in timings of the loaders, the snapshot build and the callbacks (see [instrumentation] in dashboard.cfg).
+# Disabled, every timer is a no-op. The histograms are exposed in the Prometheus text format on /metrics, the
+# structured log mode additionally prints every observation as one JSON line.
+class Instrumentation:
+
+    def __init__(self):
+        self.enabled = False
+        self.structured_log = False
+
+        self.histograms = {"loader_stage_seconds": Histogram("loader_stage_seconds",
+                                                             "Duration of the stages of loading a data source",
+                                                             ("source", "stage"), LATENCY_BUCKETS),
+                           "build_seconds": Histogram("build_seconds",
+                                                      "Duration of computing the metrics of a snapshot",
+                                                      ("step",), LATENCY_BUCKETS),
+                           "callback_seconds": Histogram("callback_seconds",
+                                                         "Latency of the Dash callbacks including serialization",
+                                                         ("callback",), LATENCY_BUCKETS),
+                           "callback_response_bytes": Histogram("callback_response_bytes",
+                                                                "Size of the serialized callback responses",
+                                                                ("callback",), SIZE_BUCKETS)}
+
+        self._lock = threading.Lock()
+
+    def configure(self, config):
+        instrumentation_config = config["instrumentation"]
+
+        self.enabled = instrumentation_config.getboolean("enabled", False)
+        self.structured_log = instrumentation_config.getboolean("structured_log", False)
+
+    def observe(self, metric_name, value, **labels):
+        if not self.enabled:
+            return
+
+        histogram = self.histograms[metric_name]
+
+        with self._lock:
+            histogram.observe(value, tuple(str(labels[label_name]) for label_name in histogram.label_names))
+
+            if self.structured_log:
+                # one write per line, print() would let lines of concurrent loader threads run into each other
+                sys.stdout.write(json.dumps({"timestamp": time.time(), "metric": metric_name, "value": value,
+                                             **labels}) + "\n")
+                sys.stdout.flush()
+
+    @contextmanager
+    def timer(self, metric_name, **labels):
+        if not self.enabled:
+            yield
+            return
+
+        start_time = time.perf_counter()
+
+        try:
+            yield
+
+        finally:
+            self.observe(metric_name, time.perf_counter() - start_time, **labels)
+
+    def render(self, current_values=()):
+        # current_values are (name, type, description, value) of gauges and counters that are read when scraped
+        lines = []
+
+        with self._lock:
+            for histogram in self.histograms.values():
+                lines.extend(histogram.render())
+
+        for metric_name, metric_type, description, value in current_values:
+            lines.extend([f"# HELP {METRIC_PREFIX}{metric_name} {description}",
+                          f"# TYPE {METRIC_PREFIX}{metric_name} {metric_type}",
+                          f"{METRIC_PREFIX}{metric_name} {value}"])
+
+        return "\n".join(lines) + "\n"
+
+
+def _escape_label(label_value):
+    return label_value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+# one registry per process, the loaders and callbacks all report to it
+instrumentation = Instrumentation()
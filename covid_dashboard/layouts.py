@@ -3,31 +3,11 @@ import configparser
 
 from dash import html
 from dash import dcc
-import plotly.graph_objects as go
-
-
-def create_home_layout():
-    empty_map = go.Choroplethmapbox()
-    empty_figure = go.Figure()
-
-    empty_figure.add_trace(empty_map)
-    empty_figure.update_layout(title={"text": "Test 123"},
-                               mapbox_style="carto-positron",
-                               mapbox_zoom=2.0,
-                               mapbox_center={"lat": 57.20756956834978,
-                                              "lon": 11.988806419969213},
-                               margin={"r": 0,
-                                       "t": 0,
-                                       "l": 0,
-                                       "b": 0})
-
-    empty_figure.update_geos(
-        fitbounds="locations",
-        resolution=50,
-        visible=False,
-        showframe=False,
-        projection={"type": "mercator"},
-    )
+
+from covid_dashboard.dates import DISPLAY_DATE_FORMAT
+
+
+def create_home_layout(dates, map_figure):
 
     layout = [html.H2(id="graph_title"),
               dcc.Dropdown(options=[{"label": "Full Vaccinations", "value": "fully_vaccinated"},
@@ -43,12 +23,19 @@ def create_home_layout():
                                     {"label": "Fourteen day average of daily infections", "value": "fourteen_day_avg"}],
                            value="fully_vaccinated",
                            id="graph_selector"),
-              dcc.Graph(id="map_graph")]
+              dcc.Graph(figure=map_figure, id="map_graph"),
+              dcc.Slider(min=0,
+                         max=len(dates) - 1,
+                         step=1,
+                         value=len(dates) - 1,
+                         marks={position: dates[position].strftime(DISPLAY_DATE_FORMAT)
+                                for position in range(0, len(dates), max(len(dates) // 8, 1))},
+                         id="date_slider")]
 
     return layout
 
 
-def create_infections_layout(country_names):
+def create_infections_layout(country_names, provinces_available=False):
 
     layout = [html.H2("Infections", id="graph_title"),
               dcc.Dropdown(options=[{"label": country, "value": country} for country in country_names],
@@ -63,6 +50,13 @@ def create_infections_layout(country_names):
                                     {"label": "14-day average of daily infections", "value": "14_day_average"}],
                            value="daily",
                            id="mode_selection"),
+              # only shown when the infections are loaded with their provinces
+              dcc.Checklist(options=[{"label": " Show provinces", "value": "provinces"}],
+                            value=[],
+                            id="province_toggle",
+                            style={} if provinces_available else {"display": "none"}),
+              # the base series, the graph is drawn from them in the browser
+              dcc.Store(id="infections_series"),
               dcc.Graph(id="infections_graph")]
     return layout
 
@@ -81,11 +75,20 @@ def create_vaccination_layout(country_names):
                                     {"label": "Full Vaccinations (% of population)", "value": "full_percentage"}],
                            value="full_percentage",
                            id="mode_selection"),
+              dcc.Store(id="vaccine_series"),
               dcc.Graph(id="vaccine_graph")]
 
     return layout
 
 
+def create_loading_layout():
+
+    layout = [html.H2("Loading"),
+              html.P("The latest data is being downloaded and processed, this page updates as soon as it is ready.")]
+
+    return layout
+
+
 def create_about_layout():
     config_directory = os.path.join(os.path.dirname(__file__),
                                     "config")
@@ -0,0 +1,95 @@
+import numpy as np
+import pandas as pd
+
+
+COUNT_DTYPES = (np.int32, np.uint32)
+
+# dtype of the metric cube and of the derived infection modes in compact mode
+COMPACT_FLOAT_DTYPE = np.float32
+
+
+def compact_counts(frame):
+    # the smallest of int32/uint32 that holds every count, frames that need more keep their dtype
+    values = frame.to_numpy()
+
+    if not np.issubdtype(values.dtype, np.integer) or values.size == 0:
+        return frame
+
+    minimum_value, maximum_value = values.min(), values.max()
+
+    for dtype in COUNT_DTYPES:
+        dtype_info = np.iinfo(dtype)
+
+        if dtype_info.min <= minimum_value and maximum_value <= dtype_info.max:
+            return frame.astype(dtype)
+
+    return frame
+
+
+def compact_labels(frame):
+    # the country names are repeated in every frame, as categoricals they are stored once per frame as codes
+    compact_frame = frame.copy(deep=False)
+    compact_frame.index = pd.CategoricalIndex(frame.index, name=frame.index.name)
+
+    return compact_frame
+
+
+def compact_sources(sources):
+    compact_sources = {}
+
+    for field_name, frame in sources.items():
+        if field_name == "population_data":
+            compact_frame = frame.copy(deep=False)
+            compact_frame["PopTotal"] = compact_counts(frame[["PopTotal"]])["PopTotal"]
+
+        else:
+            compact_frame = compact_counts(frame)
+
+        compact_sources[field_name] = compact_labels(compact_frame)
+
+    return compact_sources
+
+
+def _object_bytes(value):
+    if isinstance(value, pd.DataFrame):
+        return int(value.memory_usage(index=True, deep=True).sum()) + int(value.columns.memory_usage(deep=True))
+
+    return int(value.nbytes)
+
+
+def memory_report(snapshot):
+    # bytes per frame of a snapshot (memory mapped arrays of a shared snapshot are counted as well, even though
+    # they are shared between the workers)
+    objects = {"population_data": snapshot.population_data,
+               "infection_data": snapshot.infection_data,
+               "recovery_data": snapshot.recovery_data,
+               "partial_vaccination_data": snapshot.partial_vaccination_data,
+               "full_vaccination_data": snapshot.full_vaccination_data,
+               "metric_cube": snapshot.metric_cube.values}
+    objects.update({f"infection_modes.{display_mode}": mode_data
+                    for display_mode, mode_data in snapshot.infection_modes.items()})
+    objects.update({f"provinces.{field_name}": province_table.frame
+                    for field_name, province_table in snapshot.province_tables.items()})
+    objects.update({f"province_infection_modes.{display_mode}": mode_data
+                    for display_mode, mode_data in snapshot.province_infection_modes.items()})
+
+    report = {}
+    counted_ids = set()
+
+    for object_name, value in objects.items():
+        if isinstance(value, pd.DataFrame):
+            dtypes = sorted({str(dtype) for dtype in value.dtypes})
+
+        else:
+            dtypes = [str(value.dtype)]
+
+        # frames that are shared between fields (e.g. the total infections) are only counted once
+        shared = id(value) in counted_ids
+        counted_ids.add(id(value))
+
+        report[object_name] = {"shape": list(value.shape),
+                               "dtypes": dtypes,
+                               "bytes": 0 if shared else _object_bytes(value)}
+
+    return {"frames": report,
+            "total_bytes": sum(frame_report["bytes"] for frame_report in report.values())}
@@ -0,0 +1,141 @@
+import numpy as np
+import pandas as pd
+
+
+AVERAGE_WINDOWS = {"three_day": 3, "seven_day": 7, "fourteen_day": 14}
+
+INFECTION_MODE_WINDOWS = {"3_day_average": 3, "7_day_average": 7, "14_day_average": 14}
+
+METRIC_NAMES = ("three_day_avg_infections",
+                "seven_day_avg_infections",
+                "fourteen_day_avg_infections",
+                "three_day_incidence",
+                "seven_day_incidence",
+                "fourteen_day_incidence",
+                "partial_vaccination_percentage",
+                "full_vaccination_percentage")
+
+
+# Dense (date x country x metric) array, so the metrics of all countries on one date are a single contiguous
+# block that can be handed to a figure without any pandas work.
+class MetricCube:
+
+    def __init__(self, values, dates, countries, metric_names=METRIC_NAMES):
+        self.values = values
+        self.dates = dates
+        self.countries = countries
+        self.metric_names = metric_names
+
+        self._metric_positions = {metric_name: position for position, metric_name in enumerate(metric_names)}
+
+    def metric_values(self, metric_name, date_position=-1):
+        return self.values[date_position, :, self._metric_positions[metric_name]]
+
+    def to_frame(self, date_position=-1):
+        return pd.DataFrame(self.values[date_position],
+                            index=pd.Index(self.countries, name="Country/Region"),
+                            columns=list(self.metric_names))
+
+
+def trailing_window_sums(daily_values, window):
+    # sums over the last `window` days for every date (fewer at the start of the series), computed from one
+    # cumulative sum along the date axis
+    cumulative_values = np.zeros((daily_values.shape[0], daily_values.shape[1] + 1))
+    np.cumsum(daily_values, axis=1, out=cumulative_values[:, 1:])
+
+    window_starts = np.maximum(np.arange(daily_values.shape[1]) + 1 - window, 0)
+
+    return cumulative_values[:, 1:] - cumulative_values[:, window_starts]
+
+
+def total_infection_mode(infection_data):
+    # the frames of a snapshot are gap free, so the totals can share the infection data instead of copying it
+    return infection_data if not infection_data.isna().to_numpy().any() else infection_data.fillna(value=0)
+
+
+def build_infection_modes(infection_data, dtype=None):
+    # every display mode of the infections page for all countries at once, the callback only picks rows. dtype
+    # (e.g. float32) is the dtype of the derived modes
+    daily_infections = infection_data.diff(axis=1)
+
+    infection_modes = {"total": total_infection_mode(infection_data),
+                       "daily": daily_infections.fillna(value=0.0)}
+
+    # rolling along the date axis of the transposed matrix runs over all countries in one pass
+    transposed_daily_infections = daily_infections.T
+
+    for display_mode, window in INFECTION_MODE_WINDOWS.items():
+        infection_modes[display_mode] = transposed_daily_infections.rolling(window=window).mean().T.fillna(value=0.0)
+
+    if dtype is not None:
+        for display_mode in infection_modes:
+            if display_mode != "total":
+                infection_modes[display_mode] = infection_modes[display_mode].astype(dtype, copy=False)
+
+    return infection_modes
+
+
+def build_metric_cube(infection_data, partial_vaccination_data, full_vaccination_data, population_data,
+                      dtype=np.float64):
+
+    countries = infection_data.index
+    dates = infection_data.columns
+
+    population = population_data.loc[:, "PopTotal"].reindex(countries).to_numpy(dtype=float)[:, np.newaxis]
+
+    daily_infections = infection_data.diff(axis=1).fillna(value=0).to_numpy(dtype=float)
+    days_in_window = np.arange(1, len(dates) + 1)
+
+    # every metric is written straight into the cube, so at most one (country x date) intermediate is alive
+    cube_values = np.empty((len(dates), len(countries), len(METRIC_NAMES)), dtype=dtype)
+    metric_positions = {metric_name: position for position, metric_name in enumerate(METRIC_NAMES)}
+
+    for window_name, window in AVERAGE_WINDOWS.items():
+        window_sums = trailing_window_sums(daily_infections, window)
+
+        cube_values[:, :, metric_positions[f"{window_name}_avg_infections"]] = np.round(
+            window_sums / np.minimum(days_in_window, window), 2).T
+        cube_values[:, :, metric_positions[f"{window_name}_incidence"]] = np.round(
+            window_sums * 100_000 / population, 2).T
+
+    del daily_infections, window_sums
+
+    # the snapshot's frames already share one calendar, the latest report is only carried forward for frames that
+    # were not aligned onto it
+    for metric_name, vaccination_data in (("partial_vaccination_percentage", partial_vaccination_data),
+                                          ("full_vaccination_percentage", full_vaccination_data)):
+        aligned_vaccinations = vaccination_data.reindex(countries).fillna(value=0)
+        aligned_vaccinations = aligned_vaccinations.reindex(columns=dates, method="ffill").fillna(value=0)
+
+        cube_values[:, :, metric_positions[metric_name]] = np.round(
+            aligned_vaccinations.to_numpy(dtype=float) * 100 / population, 2).T
+
+    return MetricCube(cube_values, dates, list(countries))
+
+
+# number of earlier dates needed to recompute the windowed metrics of a new date
+LOOKBACK_DAYS = max(max(AVERAGE_WINDOWS.values()), max(INFECTION_MODE_WINDOWS.values()))
+
+
+def extend_infection_modes(previous_infection_modes, infection_data, first_new_position):
+    # recompute only the appended dates (plus their lookback) and append them to the previous matrices, the totals
+    # share the extended infection data like in build_infection_modes
+    tail_infection_modes = build_infection_modes(infection_data.iloc[:, first_new_position - LOOKBACK_DAYS:],
+                                                 dtype=previous_infection_modes["daily"].dtypes.iloc[0])
+
+    return {display_mode: total_infection_mode(infection_data) if display_mode == "total"
+            else pd.concat([previous_infection_modes[display_mode],
+                            tail_infection_modes[display_mode].iloc[:, LOOKBACK_DAYS:]], axis=1)
+            for display_mode in previous_infection_modes}
+
+
+def extend_metric_cube(previous_metric_cube, infection_data, partial_vaccination_data, full_vaccination_data,
+                       population_data, first_new_position):
+    tail_metric_cube = build_metric_cube(infection_data.iloc[:, first_new_position - LOOKBACK_DAYS:],
+                                         partial_vaccination_data, full_vaccination_data, population_data,
+                                         dtype=previous_metric_cube.values.dtype)
+
+    cube_values = np.concatenate([previous_metric_cube.values, tail_metric_cube.values[LOOKBACK_DAYS:]], axis=0)
+
+    return MetricCube(cube_values, infection_data.columns, previous_metric_cube.countries,
+                      previous_metric_cube.metric_names)
@@ -0,0 +1,47 @@
+import numpy as np
+import pandas as pd
+
+
+# Province level (country, province) x date rows of a source, sorted by country so that every country is one
+# contiguous block of rows: offsets[i]:offsets[i + 1] are the rows of countries[i] (CSR style). The provinces of a
+# country are a row slice of any frame with these rows (e.g. each infection mode) and the country totals are one
+# np.add.reduceat over the blocks instead of a groupby.
+class ProvinceTable:
+
+    def __init__(self, frame):
+        self.frame = frame
+
+        country_labels = frame.index.get_level_values(0).to_numpy(dtype=str)
+        block_starts = np.flatnonzero(np.r_[True, country_labels[1:] != country_labels[:-1]])
+
+        self.countries = country_labels[block_starts].tolist()
+        self.offsets = np.append(block_starts, len(country_labels))
+        self.provinces = frame.index.get_level_values(1).to_numpy(dtype=str)
+
+        self._country_positions = {country: position for position, country in enumerate(self.countries)}
+
+    def country_totals(self):
+        # one row per country, the same frame the country level loader builds with a groupby
+        values = self.frame.to_numpy()
+        totals = np.add.reduceat(values, self.offsets[:-1], axis=0) if len(values) else values
+
+        return pd.DataFrame(totals.astype(values.dtype, copy=False),
+                            index=pd.Index(self.countries, name=self.frame.index.names[0]),
+                            columns=self.frame.columns)
+
+    def country_rows(self, country):
+        position = self._country_positions[country]
+
+        return slice(self.offsets[position], self.offsets[position + 1])
+
+    def has_provinces(self, country):
+        # countries with a single row without a province name look the same on both levels
+        if country not in self._country_positions:
+            return False
+
+        rows = self.country_rows(country)
+
+        return rows.stop - rows.start > 1 or self.provinces[rows.start] != ""
+
+    def country_provinces(self, country):
+        return self.provinces[self.country_rows(country)].tolist()
@@ -0,0 +1,59 @@
+import os
+import sys
+import json
+import time
+import argparse
+
+from covid_dashboard.cache import SourceCache
+from covid_dashboard.instrumentation import instrumentation
+from covid_dashboard.shared import publish_snapshot, shared_directory_from_config
+from covid_dashboard.snapshot import SnapshotStore
+from covid_dashboard.utils import CONFIG_DIRECTORY, load_config
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load the dashboard data once and publish it for the workers")
+    parser.add_argument("--watch", action="store_true",
+                        help="keep running and republish whenever the background refresh finds new data")
+    arguments = parser.parse_args()
+
+    config = load_config()
+    # the loader and build timings of the published snapshots only show up in the structured log
+    instrumentation.configure(config)
+
+    shared_directory = shared_directory_from_config(config)
+    os.makedirs(shared_directory, exist_ok=True)
+
+    with open(os.path.join(CONFIG_DIRECTORY, "supported_countries.json"), "r") as country_file:
+        supported_countries = json.load(country_file)["countries"]
+
+    snapshot_store = SnapshotStore(config, SourceCache.from_config(config), supported_countries)
+    publish_snapshot(snapshot_store.current, shared_directory)
+    print(f"Published data version {snapshot_store.current.data_version} to {shared_directory}")
+
+    if not arguments.watch:
+        snapshot_store.stop()
+        return
+
+    if snapshot_store.refresh_interval <= 0:
+        snapshot_store.stop()
+        sys.exit("--watch needs a [refresh] interval above 0")
+
+    try:
+        while True:
+            time.sleep(snapshot_store.refresh_interval)
+
+            try:
+                if snapshot_store.refresh():
+                    publish_snapshot(snapshot_store.current, shared_directory)
+                    print(f"Published data version {snapshot_store.current.data_version} to {shared_directory}")
+
+            except Exception as error:
+                print(f"Data refresh failed: {error!r}")
+
+    finally:
+        snapshot_store.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,233 @@
+import gzip
+import hashlib
+import threading
+from collections import OrderedDict
+
+import flask
+import plotly.io as pio
+
+
+# responses of these types are compressed, everything else (e.g. images) is sent as it is
+COMPRESSIBLE_MIMETYPES = ("application/json", "application/geo+json", "application/javascript", "text/javascript",
+                          "text/css", "text/html", "text/plain")
+
+JSON_ENGINES = ("orjson", "json")
+
+CALLBACK_ROUTE = "/_dash-update-component"
+
+
+def load_brotli():
+    # optional, without the brotli package responses are only gzip compressed
+    try:
+        import brotli
+
+    except ImportError:
+        return None
+
+    return brotli
+
+
+# Compression, ETags and a cache of the encoded bodies for the Dash Flask server. A callback response only depends on
+# the request body (outputs, inputs, state and the triggering input) and the data version, so its strong ETag is a
+# hash of both: a repeated request gets the cached compressed body without running the callback, serializing or
+# compressing again. A request with a matching If-None-Match gets a 304, which only helps non-browser clients
+# (scripts, load tests, monitoring): browsers never send If-None-Match with the dash-renderer's POSTs, and the
+# dash-renderer treats any status but 200 and 204 as a failed callback.
+class ResponsePipeline:
+
+    def __init__(self, compress=True, min_compress_bytes=1024, gzip_level=1, brotli_quality=4,
+                 cache_bytes=64 * 1024 * 1024, json_engine="orjson"):
+        self.compress = compress
+        self.min_compress_bytes = min_compress_bytes
+        self.gzip_level = gzip_level
+        self.brotli_quality = brotli_quality
+        self.cache_bytes = cache_bytes
+        self.json_engine = json_engine
+
+        self.brotli = load_brotli() if compress else None
+
+        self.data_version = None
+
+        self.hits = 0
+        self.misses = 0
+        self.not_modified = 0
+
+        self._entries = OrderedDict()
+        self._entry_bytes = 0
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_config(cls, config):
+        response_config = config["responses"]
+
+        return cls(compress=response_config.getboolean("compress", True),
+                   min_compress_bytes=response_config.getint("min_compress_bytes", 1024),
+                   gzip_level=response_config.getint("gzip_level", 1),
+                   brotli_quality=response_config.getint("brotli_quality", 4),
+                   cache_bytes=int(response_config.getfloat("cache_megabytes", 64) * 1024 * 1024),
+                   json_engine=response_config.get("json_engine", "orjson"))
+
+    def install(self, server, current_data_version):
+        # current_data_version returns the version of the served snapshot, None while it is loading
+        if self.json_engine not in JSON_ENGINES:
+            raise ValueError(f"Unknown json_engine '{self.json_engine}', expected one of {', '.join(JSON_ENGINES)}")
+
+        # Dash serializes every callback response with plotly's encoder, orjson is several times faster than json
+        json_engine = self.json_engine
+
+        if json_engine == "orjson":
+            try:
+                import orjson
+
+            except ImportError:
+                print("orjson is not available, serializing the callback responses with json")
+                json_engine = "json"
+
+        pio.json.config.default_engine = json_engine
+
+        @server.before_request
+        def answer_from_cache():
+            return self._answer_from_cache(current_data_version())
+
+        @server.after_request
+        def encode_response(response):
+            return self._encode_response(response)
+
+    def _answer_from_cache(self, data_version):
+        request = flask.request
+
+        if not (request.method == "POST" and request.path.endswith(CALLBACK_ROUTE)) or data_version is None:
+            return None
+
+        callback_hash = hashlib.sha256(data_version.encode("utf-8"))
+        callback_hash.update(request.get_data(cache=True))
+
+        encoding = self._negotiate_encoding()
+        etag = self._representation_etag(callback_hash.hexdigest()[:32], encoding)
+        flask.g.callback_etag = etag
+
+        # only for non-browser clients that keep the ETag of their previous response, see the class comment
+        if etag in request.if_none_match:
+            with self._lock:
+                self.not_modified += 1
+
+            response = flask.Response(status=304)
+            response.set_etag(etag)
+
+            return response
+
+        with self._lock:
+            # the bodies of the previous data version are never requested again
+            if data_version != self.data_version:
+                self._entries.clear()
+                self._entry_bytes = 0
+                self.data_version = data_version
+
+            cached_entry = self._entries.get(etag)
+
+            if cached_entry is None:
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(etag)
+            self.hits += 1
+
+        cached_body, cached_encoding = cached_entry
+
+        response = flask.Response(cached_body, mimetype="application/json")
+        response.vary.add("Accept-Encoding")
+        response.set_etag(etag)
+
+        if cached_encoding is not None:
+            response.headers["Content-Encoding"] = cached_encoding
+
+        flask.g.cached_response = True
+
+        return response
+
+    def _encode_response(self, response):
+        if flask.g.get("cached_response") or response.status_code != 200:
+            return response
+
+        if response.mimetype not in COMPRESSIBLE_MIMETYPES:
+            return response
+
+        response.vary.add("Accept-Encoding")
+        callback_etag = flask.g.get("callback_etag")
+        encoding = self._negotiate_encoding()
+
+        if (encoding is None or response.direct_passthrough or response.is_streamed or
+                "Content-Encoding" in response.headers or len(response.get_data()) < self.min_compress_bytes):
+            # too small to be worth compressing (or streamed from a file), sent as it is
+            encoding = None
+
+        else:
+            response.set_data(self._compressed(response.get_data(), encoding))
+            response.headers["Content-Encoding"] = encoding
+
+            # the ETags of the other routes name the uncompressed body, the compressed one is only equivalent
+            etag = response.get_etag()[0]
+
+            if etag is not None and callback_etag is None:
+                response.set_etag(etag, weak=True)
+
+        if callback_etag is not None:
+            response.set_etag(callback_etag)
+            self._store(callback_etag, response.get_data(), encoding)
+
+        return response
+
+    def _negotiate_encoding(self):
+        if not self.compress:
+            return None
+
+        accept_encodings = flask.request.accept_encodings
+
+        if self.brotli is not None and accept_encodings.quality("br") > 0:
+            return "br"
+
+        if accept_encodings.quality("gzip") > 0:
+            return "gzip"
+
+        return None
+
+    def _compressed(self, body, encoding):
+        if encoding == "br":
+            return self.brotli.compress(body, quality=self.brotli_quality)
+
+        # mtime=0 keeps the output (and so the cached bytes) the same for the same body
+        return gzip.compress(body, compresslevel=self.gzip_level, mtime=0)
+
+    @staticmethod
+    def _representation_etag(etag, encoding):
+        return etag if encoding is None else f"{etag}-{encoding}"
+
+    def _store(self, etag, body, encoding):
+        # least recently used bodies are dropped first once they take up more than cache_bytes
+        if len(body) > self.cache_bytes:
+            return
+
+        with self._lock:
+            if etag in self._entries:
+                return
+
+            self._entries[etag] = (body, encoding)
+            self._entry_bytes += len(body)
+
+            while self._entry_bytes > self.cache_bytes:
+                evicted_body, _ = self._entries.popitem(last=False)[1]
+                self._entry_bytes -= len(evicted_body)
+
+    def stats(self):
+
+        with self._lock:
+            lookups = self.hits + self.misses
+
+            return {"entries": len(self._entries),
+                    "bytes": self._entry_bytes,
+                    "max_bytes": self.cache_bytes,
+                    "hits": self.hits,
+                    "misses": self.misses,
+                    "not_modified": self.not_modified,
+                    "hit_rate": self.hits / lookups if lookups else 0.0,
+                    "brotli": self.brotli is not None}
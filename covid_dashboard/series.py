@@ -0,0 +1,164 @@
+import io
+import json
+import hashlib
+import threading
+
+import numpy as np
+import pandas as pd
+
+from covid_dashboard.dates import ISO_DATE_FORMAT, date_range_positions, format_dates
+
+
+SERIES_FORMATS = ("json", "arrow")
+
+ARROW_MIMETYPE = "application/vnd.apache.arrow.stream"
+
+
+# Every (country x date) series of a snapshot behind one country -> row map and the shared sorted calendar, so a
+# query is a dict lookup per country and a binary search per date bound. The arrays are views of the snapshot
+# where the row order already matches.
+class SeriesStore:
+
+    def __init__(self, snapshot):
+        self.data_version = snapshot.data_version
+        metric_cube = snapshot.metric_cube
+
+        self.dates = metric_cube.dates
+        self.countries = [str(country) for country in metric_cube.countries]
+        self.country_rows = {country: row for row, country in enumerate(self.countries)}
+
+        # the metric cube is (date x country x metric), its metrics are transposed views
+        self.metrics = {metric_name: metric_cube.values[:, :, position].T
+                        for position, metric_name in enumerate(metric_cube.metric_names)}
+
+        frames = {f"infections_{display_mode}": mode_data
+                  for display_mode, mode_data in snapshot.infection_modes.items()}
+        frames.update({"recoveries": snapshot.recovery_data,
+                       "partial_vaccinations": snapshot.partial_vaccination_data,
+                       "full_vaccinations": snapshot.full_vaccination_data})
+
+        for metric_name, frame in frames.items():
+            if [str(country) for country in frame.index] != self.countries:
+                frame = frame.reindex(metric_cube.countries)
+
+            self.metrics[metric_name] = frame.to_numpy()
+
+    def query(self, metric_name, countries=None, start_date=None, end_date=None):
+        # (dates, countries, country x date values) of the dates from start_date up to and including end_date
+        if metric_name not in self.metrics:
+            raise KeyError(f"Unknown metric '{metric_name}'")
+
+        countries = self.countries if not countries else countries
+        unknown_countries = [country for country in countries if country not in self.country_rows]
+
+        if unknown_countries:
+            raise KeyError(f"Unknown countries: {', '.join(unknown_countries)}")
+
+        start_position, end_position = date_range_positions(self.dates, start_date, end_date)
+        rows = [self.country_rows[country] for country in countries]
+
+        values = self.metrics[metric_name][rows, start_position:end_position]
+
+        return self.dates[start_position:end_position], countries, values
+
+    def describe(self):
+        return {"data_version": self.data_version,
+                "metrics": sorted(self.metrics),
+                "countries": self.countries,
+                "first_date": self.dates[0].strftime(ISO_DATE_FORMAT),
+                "last_date": self.dates[-1].strftime(ISO_DATE_FORMAT)}
+
+
+_store_lock = threading.Lock()
+_current_store = None
+
+
+def series_store(snapshot):
+    # one store per data version, built on the first query after a refresh
+    global _current_store
+
+    with _store_lock:
+        if _current_store is None or _current_store.data_version != snapshot.data_version:
+            _current_store = SeriesStore(snapshot)
+
+        return _current_store
+
+
+def _json_values(values):
+    # compact (float32) series would be sent as e.g. 12.340000152587891 instead of 12.34, missing values as null
+    if not np.issubdtype(values.dtype, np.floating):
+        return values.tolist()
+
+    if values.dtype != np.float64:
+        values = np.round(values.astype(np.float64), 2)
+
+    if not np.isnan(values).any():
+        return values.tolist()
+
+    return [[None if np.isnan(value) else value for value in row] for row in values.tolist()]
+
+
+def parse_series_query(arguments):
+    # the query string of /api/series, normalized so that equal queries get equal ETags. Raises ValueError
+    metric_name = arguments.get("metric")
+
+    if not metric_name:
+        raise ValueError("The 'metric' parameter is required")
+
+    output_format = arguments.get("format", "json")
+
+    if output_format not in SERIES_FORMATS:
+        raise ValueError(f"Unknown format '{output_format}', expected one of {', '.join(SERIES_FORMATS)}")
+
+    date_bounds = []
+
+    for parameter in ("from", "to"):
+        try:
+            date_bounds.append(pd.Timestamp(arguments[parameter]).strftime(ISO_DATE_FORMAT)
+                               if arguments.get(parameter) else None)
+
+        except ValueError:
+            raise ValueError(f"'{parameter}' is not a date: '{arguments[parameter]}'") from None
+
+    # a country named twice is returned once, in the order of its first mention
+    countries = list(dict.fromkeys(country.strip() for country in arguments.get("countries", "").split(",")
+                                   if country.strip()))
+
+    return {"metric_name": metric_name,
+            "countries": countries,
+            "start_date": date_bounds[0],
+            "end_date": date_bounds[1],
+            "output_format": output_format}
+
+
+def series_json(metric_name, dates, countries, values):
+    # columnar: the dates once, then one array of values per country
+    return json.dumps({"metric": metric_name,
+                       "dates": format_dates(dates, ISO_DATE_FORMAT).tolist(),
+                       "countries": countries,
+                       "values": dict(zip(countries, _json_values(values)))},
+                      separators=(",", ":"))
+
+
+def series_arrow(metric_name, dates, countries, values):
+    # one record batch with a date column and a column per country, in the Arrow IPC stream format
+    import pyarrow
+
+    table = pyarrow.table({"date": pyarrow.array(dates.to_numpy(dtype="datetime64[D]")),
+                           **{country: pyarrow.array(country_values)
+                              for country, country_values in zip(countries, values)}},
+                          metadata={"metric": metric_name})
+
+    sink = io.BytesIO()
+
+    with pyarrow.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+
+    return sink.getvalue()
+
+
+def series_etag(data_version, query):
+    # known before the response is built, so a matching If-None-Match is answered without touching the data
+    etag_source = json.dumps([data_version, query], sort_keys=True)
+
+    return hashlib.sha256(etag_source.encode("utf-8")).hexdigest()[:32]
@@ -0,0 +1,187 @@
+import os
+import json
+import time
+import shutil
+
+import numpy as np
+
+from covid_dashboard.cache import frame_to_arrays, arrays_to_frame
+from covid_dashboard.dates import to_day_ordinals, from_day_ordinals
+from covid_dashboard.metrics import MetricCube
+from covid_dashboard.provinces import ProvinceTable
+from covid_dashboard.snapshot import DataSnapshot, SnapshotStore, SOURCE_FIELDS
+from covid_dashboard.utils import resolve_path
+
+
+POINTER_FILE_NAME = "current"
+
+FRAME_FIELDS = tuple(field_name for field_names in SOURCE_FIELDS.values() for field_name in field_names)
+
+
+# A snapshot is published as one directory of .npy files per data version plus a small index.json. Workers map
+# the arrays read-only (np.load with mmap_mode), so N workers share one copy in the page cache instead of each
+# holding its own frames. The "current" file names the latest complete version and is replaced atomically.
+def publish_snapshot(snapshot, shared_directory):
+    version_directory = os.path.join(shared_directory, snapshot.data_version)
+    staging_directory = version_directory + ".staging"
+
+    if os.path.exists(os.path.join(version_directory, "index.json")):
+        _write_pointer(shared_directory, snapshot.data_version)
+        return version_directory
+
+    shutil.rmtree(staging_directory, ignore_errors=True)
+    os.makedirs(staging_directory)
+
+    arrays = {}
+    frame_metadata = {}
+
+    frames = {field_name: getattr(snapshot, field_name) for field_name in FRAME_FIELDS}
+    frames.update({f"infection_modes.{display_mode}": mode_data
+                   for display_mode, mode_data in snapshot.infection_modes.items()})
+    frames.update({f"provinces.{field_name}": province_table.frame
+                   for field_name, province_table in snapshot.province_tables.items()})
+    frames.update({f"province_infection_modes.{display_mode}": mode_data
+                   for display_mode, mode_data in snapshot.province_infection_modes.items()})
+
+    for frame_name, frame in frames.items():
+        frame_arrays, frame_metadata[frame_name] = frame_to_arrays(frame, f"{frame_name}.")
+        arrays.update(frame_arrays)
+
+    arrays["metric_cube.values"] = snapshot.metric_cube.values
+    arrays["metric_cube.day_ordinals"] = to_day_ordinals(snapshot.metric_cube.dates)
+
+    for array_name, array in arrays.items():
+        np.save(os.path.join(staging_directory, f"{array_name}.npy"), np.ascontiguousarray(array))
+
+    index = {"data_version": snapshot.data_version,
+             "created_at": snapshot.created_at,
+             "load_timings": snapshot.load_timings,
+             "missing_sources": snapshot.missing_sources,
+             "frames": frame_metadata,
+             "infection_modes": list(snapshot.infection_modes),
+             "province_fields": list(snapshot.province_tables),
+             "province_infection_modes": list(snapshot.province_infection_modes),
+             "metric_cube": {"countries": list(snapshot.metric_cube.countries),
+                             "metric_names": list(snapshot.metric_cube.metric_names)}}
+
+    with open(os.path.join(staging_directory, "index.json"), "w") as index_file:
+        json.dump(index, index_file)
+
+    shutil.rmtree(version_directory, ignore_errors=True)
+    os.replace(staging_directory, version_directory)
+    previous_version = read_pointer(shared_directory)
+    _write_pointer(shared_directory, snapshot.data_version)
+
+    # workers may still be mapping the previous version, anything older is no longer referenced
+    for entry in os.listdir(shared_directory):
+        entry_path = os.path.join(shared_directory, entry)
+
+        if os.path.isdir(entry_path) and entry not in (snapshot.data_version, previous_version):
+            shutil.rmtree(entry_path, ignore_errors=True)
+
+    return version_directory
+
+
+def read_pointer(shared_directory):
+    pointer_path = os.path.join(shared_directory, POINTER_FILE_NAME)
+
+    if not os.path.exists(pointer_path):
+        return None
+
+    with open(pointer_path, "r") as pointer_file:
+        return pointer_file.read().strip() or None
+
+
+def _write_pointer(shared_directory, data_version):
+    pointer_path = os.path.join(shared_directory, POINTER_FILE_NAME)
+
+    with open(pointer_path + ".tmp", "w") as pointer_file:
+        pointer_file.write(data_version)
+
+    os.replace(pointer_path + ".tmp", pointer_path)
+
+
+def attach_snapshot(shared_directory, data_version=None):
+    data_version = data_version or read_pointer(shared_directory)
+
+    if data_version is None:
+        raise FileNotFoundError(f"No snapshot has been published to '{shared_directory}'")
+
+    version_directory = os.path.join(shared_directory, data_version)
+
+    with open(os.path.join(version_directory, "index.json"), "r") as index_file:
+        index = json.load(index_file)
+
+    arrays = {file_name[:-len(".npy")]: np.load(os.path.join(version_directory, file_name), mmap_mode="r")
+              for file_name in os.listdir(version_directory) if file_name.endswith(".npy")}
+
+    frames = {frame_name: arrays_to_frame(arrays, f"{frame_name}.", frame_metadata)
+              for frame_name, frame_metadata in index["frames"].items()}
+
+    metric_cube = MetricCube(arrays["metric_cube.values"],
+                             from_day_ordinals(arrays["metric_cube.day_ordinals"]),
+                             index["metric_cube"]["countries"],
+                             tuple(index["metric_cube"]["metric_names"]))
+
+    snapshot = DataSnapshot(metric_cube=metric_cube,
+                            infection_modes={display_mode: frames[f"infection_modes.{display_mode}"]
+                                             for display_mode in index["infection_modes"]},
+                            data_version=index["data_version"],
+                            load_timings=index["load_timings"],
+                            missing_sources=index.get("missing_sources", {}),
+                            province_tables={field_name: ProvinceTable(frames[f"provinces.{field_name}"])
+                                             for field_name in index.get("province_fields", [])},
+                            province_infection_modes={display_mode: frames[f"province_infection_modes.{display_mode}"]
+                                                      for display_mode in index.get("province_infection_modes", [])},
+                            **{field_name: frames[field_name] for field_name in FRAME_FIELDS})
+    snapshot.created_at = index["created_at"]
+
+    return snapshot
+
+
+class SharedSnapshotStore(SnapshotStore):
+    # worker side: attaches to the published snapshot and only polls for newer versions, the publisher does all
+    # of the loading and computing
+
+    def __init__(self, config, shared_directory, attach_timeout=300, lazy=False):
+        self.shared_directory = shared_directory
+        self.refresh_interval = config["shared_snapshot"].getfloat("poll_interval", 30)
+        # lazy workers look for the first published snapshot every second
+        self.retry_interval = 1
+
+        self._init_refresh_thread()
+
+        if lazy:
+            self.current = None
+            return
+
+        deadline = time.time() + attach_timeout
+
+        # workers can come up before the publisher is done with the first snapshot
+        while read_pointer(shared_directory) is None:
+            if time.time() > deadline:
+                raise TimeoutError(f"No snapshot was published to '{shared_directory}' in time")
+
+            time.sleep(1)
+
+        self.current = attach_snapshot(shared_directory)
+
+    def _load_first_snapshot(self):
+        return attach_snapshot(self.shared_directory)
+
+    def stop(self):
+        self._stop_event.set()
+
+    def refresh(self):
+        data_version = read_pointer(self.shared_directory)
+
+        if data_version is None or data_version == self.current.data_version:
+            return False
+
+        self.current = attach_snapshot(self.shared_directory, data_version)
+
+        return True
+
+
+def shared_directory_from_config(config):
+    return resolve_path(config["shared_snapshot"].get("directory", "shared"))
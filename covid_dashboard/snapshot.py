@@ -0,0 +1,363 @@
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from covid_dashboard.data import source_loader_options
+from covid_dashboard.dates import shared_calendar, align_to_calendar, date_range_positions
+from covid_dashboard.instrumentation import instrumentation
+from covid_dashboard.memory import COMPACT_FLOAT_DTYPE, compact_counts, compact_sources
+from covid_dashboard.metrics import LOOKBACK_DAYS, build_metric_cube, build_infection_modes
+from covid_dashboard.metrics import extend_metric_cube, extend_infection_modes
+from covid_dashboard.provinces import ProvinceTable
+
+
+# Everything the callbacks read, built once and never modified afterwards. A refresh builds a new snapshot and
+# swaps it in, so a callback that grabbed a snapshot keeps seeing consistent data until it returns.
+class DataSnapshot:
+
+    def __init__(self, population_data, infection_data, recovery_data, partial_vaccination_data,
+                 full_vaccination_data, metric_cube, infection_modes, data_version, load_timings=None,
+                 province_tables=None, province_infection_modes=None, missing_sources=None):
+        self.population_data = population_data
+        self.infection_data = infection_data
+        self.recovery_data = recovery_data
+        self.partial_vaccination_data = partial_vaccination_data
+        self.full_vaccination_data = full_vaccination_data
+        self.metric_cube = metric_cube
+        self.infection_modes = infection_modes
+        # ProvinceTable of every source loaded with provinces = yes by field name, the frames above hold their
+        # country totals. The province infection modes have the rows of province_tables["infection_data"]
+        self.province_tables = province_tables or {}
+        self.province_infection_modes = province_infection_modes or {}
+        # source name -> error of the sources that could not be loaded yet, see missing_source_frames
+        self.missing_sources = missing_sources or {}
+        self.data_version = data_version
+        self.load_timings = load_timings or {}
+        self.created_at = time.time()
+
+
+# snapshot attributes filled by each source, the vaccination source yields two frames
+SOURCE_FIELDS = {"population": ("population_data",),
+                 "infections": ("infection_data",),
+                 "recoveries": ("recovery_data",),
+                 "vaccinations": ("partial_vaccination_data", "full_vaccination_data")}
+
+
+def load_source(config, source_cache, supported_countries, source_name, force_revalidate=False, cache_name=None):
+    # any section of dashboard.cfg with a data_url and a format can be loaded, cache_name keeps loads for other
+    # countries (e.g. the analysis) from replacing the dashboard's cached frames
+    loader, loader_options = source_loader_options(config, source_name)
+
+    return source_cache.load(cache_name or source_name, config[source_name]["data_url"], loader,
+                             supported_countries, force_revalidate=force_revalidate, **loader_options)
+
+
+def _timed_load_source(*load_arguments, **load_options):
+    start_time = time.perf_counter()
+    frames = load_source(*load_arguments, **load_options)
+
+    return frames, time.perf_counter() - start_time
+
+
+def missing_source_frames(source_name, sources, supported_countries):
+    # stand-ins for a source that could not be loaded and has no previous frames: counts of zero on the dates of
+    # the sources that did load, and no population
+    country_index = pd.Index(supported_countries, name="Country/Region")
+
+    if source_name == "population":
+        return (pd.DataFrame(np.nan, index=country_index.rename("Location"),
+                             columns=["PopMale", "PopFemale", "PopTotal"]),)
+
+    dated_frames = [frame for field_name, frame in sources.items() if field_name in DATED_FIELDS]
+
+    if not dated_frames:
+        raise RuntimeError(f"Could not load '{source_name}' and no other source has dates to serve instead")
+
+    calendar = shared_calendar(dated_frames)
+
+    return tuple(pd.DataFrame(0, index=country_index, columns=calendar, dtype=np.int64)
+                 for _ in SOURCE_FIELDS[source_name])
+
+
+def load_sources(config, source_cache, supported_countries, force_revalidate=False, previous_snapshot=None):
+    # all sources are fetched (and parsed, see parse_processes) at the same time, so loading takes about as long
+    # as the slowest source. A source that fails keeps the frames of the previous snapshot. Without one it is
+    # served as missing (see missing_source_frames) or, with serve_missing_sources = no, the failure is raised once
+    # the other sources are done. Returns (sources, load timings, missing sources)
+    parallel_downloads = config["loading"].getboolean("parallel_downloads", True)
+    serve_missing_sources = config["loading"].getboolean("serve_missing_sources", True)
+
+    with ThreadPoolExecutor(max_workers=len(SOURCE_FIELDS) if parallel_downloads else 1,
+                            thread_name_prefix="source-loader") as executor:
+        source_futures = {source_name: executor.submit(_timed_load_source, config, source_cache,
+                                                       supported_countries, source_name,
+                                                       force_revalidate=force_revalidate)
+                          for source_name in SOURCE_FIELDS}
+
+    sources = {}
+    load_timings = {}
+    failed_sources = {}
+    missing_sources = {}
+
+    for source_name, source_future in source_futures.items():
+        field_names = SOURCE_FIELDS[source_name]
+
+        try:
+            frames, load_timings[source_name] = source_future.result()
+
+            if len(field_names) == 1:
+                frames = (frames,)
+
+        except Exception as error:
+            if previous_snapshot is None:
+                failed_sources[source_name] = error
+                continue
+
+            print(f"Loading '{source_name}' failed ({error!r}), keeping the previous data")
+            frames = tuple(previous_snapshot.province_tables[field_name].frame
+                           if field_name in previous_snapshot.province_tables
+                           else getattr(previous_snapshot, field_name) for field_name in field_names)
+
+            # stand-ins stay missing until the source loads
+            if source_name in previous_snapshot.missing_sources:
+                missing_sources[source_name] = repr(error)
+
+        sources.update(zip(field_names, frames))
+
+    if failed_sources and (not serve_missing_sources or len(failed_sources) == len(SOURCE_FIELDS)):
+        failure_summary = ", ".join(f"{source_name} ({error!r})" for source_name, error in failed_sources.items())
+        raise RuntimeError(f"Could not load {failure_summary}") from next(iter(failed_sources.values()))
+
+    for source_name, error in failed_sources.items():
+        print(f"Loading '{source_name}' failed ({error!r}), serving it as missing until it loads")
+        sources.update(zip(SOURCE_FIELDS[source_name], missing_source_frames(source_name, sources,
+                                                                             supported_countries)))
+        missing_sources[source_name] = repr(error)
+
+    print("Loaded " + ", ".join(f"{source_name} in {timing:.2f}s" for source_name, timing in load_timings.items()))
+
+    return sources, load_timings, missing_sources
+
+
+# the frames that have dates as columns, population_data has one row per country
+DATED_FIELDS = ("infection_data", "recovery_data", "partial_vaccination_data", "full_vaccination_data")
+
+
+def align_sources(sources):
+    # every dated frame on one shared daily calendar, so a date range is the same column slice in all of them
+    calendar = shared_calendar([sources[field_name] for field_name in DATED_FIELDS])
+
+    return {field_name: align_to_calendar(frame, calendar) if field_name in DATED_FIELDS else frame
+            for field_name, frame in sources.items()}
+
+
+def split_provinces(sources):
+    # sources loaded with their province rows are replaced by the country totals, the province rows are kept in
+    # a ProvinceTable per field
+    province_tables = {field_name: ProvinceTable(frame) for field_name, frame in sources.items()
+                       if isinstance(frame.index, pd.MultiIndex)}
+
+    sources = {**sources, **{field_name: province_table.country_totals()
+                             for field_name, province_table in province_tables.items()}}
+
+    return sources, province_tables
+
+
+def first_appended_date(previous_snapshot, sources, province_tables):
+    # position of the first new date if the update only appended dates, None if anything else changed
+    previous_dates = previous_snapshot.infection_data.columns
+    dates = sources["infection_data"].columns
+
+    previous_date_count = len(previous_dates)
+
+    if len(dates) <= previous_date_count or previous_date_count < LOOKBACK_DAYS or dates[0] != previous_dates[0]:
+        return None
+
+    # both calendars are gap free, the old dates end where the previous calendar ended
+    if date_range_positions(dates, end_date=previous_dates[-1])[1] != previous_date_count:
+        return None
+
+    if not sources["population_data"].equals(previous_snapshot.population_data):
+        return None
+
+    for field_name in ("infection_data", "partial_vaccination_data", "full_vaccination_data"):
+        previous_frame = getattr(previous_snapshot, field_name)
+        frame = sources[field_name]
+
+        if not frame.index.equals(previous_frame.index):
+            return None
+
+        if not frame.iloc[:, :previous_date_count].equals(previous_frame):
+            return None
+
+    # the province modes are extended as well, the provinces can change without changing the country totals
+    if set(province_tables) != set(previous_snapshot.province_tables):
+        return None
+
+    for field_name, province_table in province_tables.items():
+        previous_frame = previous_snapshot.province_tables[field_name].frame
+
+        if not province_table.frame.index.equals(previous_frame.index):
+            return None
+
+        if not province_table.frame.iloc[:, :previous_date_count].equals(previous_frame):
+            return None
+
+    return previous_date_count
+
+
+def build_snapshot(sources, data_version, previous_snapshot=None, load_timings=None, compact=False,
+                   missing_sources=None):
+    # compact stores the counts as int32/uint32, the derived metrics as float32 and the countries as categoricals
+
+    # the totals are summed before compacting, they may not fit the dtype that the province counts fit
+    sources, province_tables = split_provinces(align_sources(sources))
+    derived_dtype = None
+
+    if compact:
+        sources = compact_sources(sources)
+        province_tables = {field_name: ProvinceTable(compact_counts(province_table.frame))
+                           for field_name, province_table in province_tables.items()}
+        derived_dtype = COMPACT_FLOAT_DTYPE
+
+    first_new_position = None
+
+    if previous_snapshot is not None:
+        first_new_position = first_appended_date(previous_snapshot, sources, province_tables)
+
+    infection_provinces = province_tables.get("infection_data")
+    province_infection_modes = {}
+
+    if first_new_position is None:
+        # every metric of the home map for every date, the map callback only slices it
+        with instrumentation.timer("build_seconds", step="metric_cube"):
+            metric_cube = build_metric_cube(sources["infection_data"], sources["partial_vaccination_data"],
+                                            sources["full_vaccination_data"], sources["population_data"],
+                                            dtype=derived_dtype or np.float64)
+
+        # all display modes of the infections page, the infections callback only indexes rows
+        with instrumentation.timer("build_seconds", step="infection_modes"):
+            infection_modes = build_infection_modes(sources["infection_data"], dtype=derived_dtype)
+
+            # the province views of the infections page only slice the rows of a country
+            if infection_provinces is not None:
+                province_infection_modes = build_infection_modes(infection_provinces.frame, dtype=derived_dtype)
+
+    else:
+        with instrumentation.timer("build_seconds", step="extend_metric_cube"):
+            metric_cube = extend_metric_cube(previous_snapshot.metric_cube, sources["infection_data"],
+                                             sources["partial_vaccination_data"], sources["full_vaccination_data"],
+                                             sources["population_data"], first_new_position)
+
+        with instrumentation.timer("build_seconds", step="extend_infection_modes"):
+            infection_modes = extend_infection_modes(previous_snapshot.infection_modes, sources["infection_data"],
+                                                     first_new_position)
+
+            if infection_provinces is not None:
+                province_infection_modes = extend_infection_modes(previous_snapshot.province_infection_modes,
+                                                                  infection_provinces.frame, first_new_position)
+
+    return DataSnapshot(metric_cube=metric_cube,
+                        infection_modes=infection_modes,
+                        data_version=data_version,
+                        load_timings=load_timings,
+                        province_tables=province_tables,
+                        province_infection_modes=province_infection_modes,
+                        missing_sources=missing_sources,
+                        **sources)
+
+
+class SnapshotStore:
+
+    def __init__(self, config, source_cache, supported_countries, lazy=False):
+        self.config = config
+        self.source_cache = source_cache
+        self.supported_countries = supported_countries
+        self.refresh_interval = config["refresh"].getfloat("interval", 0)
+        self.compact = config["memory"].getboolean("compact", False)
+        # seconds between attempts at loading the first snapshot in lazy mode
+        self.retry_interval = config["startup"].getfloat("retry_interval", 30)
+
+        self._init_refresh_thread()
+
+        # lazy: the first snapshot is loaded by the refresh thread (see start), current stays None until then
+        self.current = None if lazy else self._load_first_snapshot()
+
+    def _init_refresh_thread(self):
+        self._refresh_lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._refresh_thread = None
+        self.last_error = None
+
+    @property
+    def ready(self):
+        return self.current is not None
+
+    def _load_first_snapshot(self):
+        sources, load_timings, missing_sources = load_sources(self.config, self.source_cache,
+                                                              self.supported_countries)
+
+        return build_snapshot(sources, self.source_cache.data_version(), load_timings=load_timings,
+                              compact=self.compact, missing_sources=missing_sources)
+
+    def refresh(self):
+        # revalidates every source (304s and unchanged local files cost no parsing) and swaps in a new snapshot
+        # if anything changed, returns whether it did
+        with self._refresh_lock:
+            sources, load_timings, missing_sources = load_sources(self.config, self.source_cache,
+                                                                  self.supported_countries, force_revalidate=True,
+                                                                  previous_snapshot=self.current)
+            data_version = self.source_cache.data_version()
+
+            if data_version == self.current.data_version:
+                return False
+
+            self.current = build_snapshot(sources, data_version, previous_snapshot=self.current,
+                                          load_timings=load_timings, compact=self.compact,
+                                          missing_sources=missing_sources)
+
+            return True
+
+    def start(self):
+        if self._refresh_thread is not None or (self.ready and self._next_refresh_interval() <= 0):
+            return
+
+        self._refresh_thread = threading.Thread(target=self._refresh_loop, name="data-refresh", daemon=True)
+        self._refresh_thread.start()
+
+    def stop(self):
+        self._stop_event.set()
+        self.source_cache.close()
+
+    def _next_refresh_interval(self):
+        # a snapshot with missing sources is refreshed every retry_interval until they load
+        return self.retry_interval if self.current.missing_sources else self.refresh_interval
+
+    def _refresh_loop(self):
+        while not self.ready:
+            try:
+                self.current = self._load_first_snapshot()
+                self.last_error = None
+                print(f"Data loaded, serving version {self.current.data_version}")
+
+            except Exception as error:
+                # e.g. a source that is down, the readiness endpoint reports it until a retry succeeds
+                if repr(error) != repr(self.last_error):
+                    print(f"Loading the data failed ({error!r}), retrying every {self.retry_interval:g}s")
+
+                self.last_error = error
+
+                if self._stop_event.wait(self.retry_interval):
+                    return
+
+        while self._next_refresh_interval() > 0 and not self._stop_event.wait(self._next_refresh_interval()):
+            try:
+                if self.refresh():
+                    print(f"Data refreshed, now at version {self.current.data_version}")
+
+            except Exception as error:
+                # keep serving the current snapshot, the next interval tries again
+                print(f"Data refresh failed: {error!r}")
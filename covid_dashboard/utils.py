@@ -1,17 +1,28 @@
+import os
+import json
+import configparser
 
-def format_date_string(date_string, string_delimiter="-"):
-    year, month, day = date_string.split(string_delimiter)
-    reformatted_date = f"{day.zfill(2)}/{month.zfill(2)}/{year[-2:]}"
 
-    return reformatted_date
+CONFIG_DIRECTORY = os.path.join(os.path.dirname(__file__), "config")
 
 
-def change_date_format_to_dmy(date_string, string_delimiter="/"):
-    month, day, year = date_string.split(string_delimiter)
-    reformatted_date = f"{day.zfill(2)}/{month.zfill(2)}/{year[-2:]}"
+def load_config():
+    config = configparser.ConfigParser()
+    config.read(os.path.join(CONFIG_DIRECTORY, "dashboard.cfg"))
 
-    return reformatted_date
+    return config
 
 
+def resolve_path(path):
+    # relative paths in the config are relative to the package directory
+    if not path:
+        return None
 
+    return os.path.join(os.path.dirname(__file__), os.path.expanduser(path))
 
+
+
+def load_country_aliases():
+    # upstream country name -> the name used throughout the dashboard, shared by all source loaders
+    with open(os.path.join(CONFIG_DIRECTORY, "country_aliases.json"), "r") as alias_file:
+        return json.load(alias_file)["aliases"]
@@ -0,0 +1,45 @@
+import os
+import sys
+import subprocess
+import configparser
+
+bind = "0.0.0.0:8050"
+workers = 4
+
+publisher_process = None
+
+
+def read_dashboard_config():
+    # read without importing covid_dashboard, the master process never needs pandas or dash
+    config = configparser.ConfigParser()
+    config.read(os.path.join(os.path.dirname(__file__), "covid_dashboard", "config", "dashboard.cfg"))
+
+    return config
+
+
+def on_starting(server):
+    global publisher_process
+
+    config = read_dashboard_config()
+
+    if config["startup"].getboolean("lazy", False):
+        # the workers start serving right away and attach to the first snapshot once the publisher has it
+        publish_arguments = ["--watch"] if config["refresh"].getfloat("interval", 0) > 0 else []
+        publisher_process = subprocess.Popen([sys.executable, "-m", "covid_dashboard.publish", *publish_arguments])
+        return
+
+    # load and publish the data once before any worker starts, the workers only map the published arrays
+    subprocess.run([sys.executable, "-m", "covid_dashboard.publish"], check=True)
+
+
+def when_ready(server):
+    global publisher_process
+
+    # keep one publisher refreshing the data in the background, the workers pick up new versions on their own
+    if publisher_process is None and read_dashboard_config()["refresh"].getfloat("interval", 0) > 0:
+        publisher_process = subprocess.Popen([sys.executable, "-m", "covid_dashboard.publish", "--watch"])
+
+
+def on_exit(server):
+    if publisher_process is not None:
+        publisher_process.terminate()
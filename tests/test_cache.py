@@ -0,0 +1,31 @@
+import warnings
+
+from benchmarks.bench_dashboard import benchmark_config
+from benchmarks.synthetic import generate_dataset
+from covid_dashboard.cache import SourceCache
+from covid_dashboard.snapshot import load_sources
+
+
+def test_sources_parsed_in_processes_are_cached_without_warnings(tmp_path):
+    country_names = generate_dataset(str(tmp_path / "data"), country_count=8, day_count=60)
+    config = benchmark_config(str(tmp_path / "data"), str(tmp_path / "cache"), 0)
+    config["loading"]["parse_processes"] = "2"
+
+    source_cache = SourceCache.from_config(config)
+
+    try:
+        with warnings.catch_warnings():
+            warnings.simplefilter("error")
+            sources, _, missing_sources = load_sources(config, source_cache, country_names)
+
+    finally:
+        source_cache.close()
+
+    assert not missing_sources
+    assert source_cache.parse_executor is None
+
+    cached_source_cache = SourceCache.from_config(config)
+    cached_source_cache.max_age = float("inf")
+    cached_sources, _, _ = load_sources(config, cached_source_cache, country_names)
+
+    assert all(cached_sources[field_name].equals(frame) for field_name, frame in sources.items())
@@ -0,0 +1,15 @@
+import pandas as pd
+
+from covid_dashboard.dates import align_to_calendar, shared_calendar
+
+
+def test_calendar_ends_at_the_last_date_every_frame_reports():
+    infections = pd.DataFrame([[1, 3, 6]], index=["A"], columns=pd.date_range("2021-01-01", periods=3))
+    vaccinations = pd.DataFrame([[0, 2, 4, 8, 16]], index=["A"], columns=pd.date_range("2021-01-02", periods=5))
+
+    calendar = shared_calendar([infections, vaccinations])
+
+    assert calendar[0] == pd.Timestamp("2021-01-01")
+    assert calendar[-1] == pd.Timestamp("2021-01-03")
+    assert align_to_calendar(infections, calendar).iloc[0].tolist() == [1, 3, 6]
+    assert align_to_calendar(vaccinations, calendar).iloc[0].tolist() == [0, 0, 2]
@@ -0,0 +1,50 @@
+import numpy as np
+import pandas as pd
+
+from benchmarks.bench_dashboard import benchmark_config
+from benchmarks.synthetic import generate_dataset
+from covid_dashboard.cache import SourceCache
+from covid_dashboard.figures import (INFECTION_DISPLAY_MODES, build_infections_figure, build_vaccine_figure,
+                                     infection_series, vaccine_series)
+from covid_dashboard.metrics import INFECTION_MODE_WINDOWS
+from covid_dashboard.snapshot import SnapshotStore
+
+
+def offset_dates(first_date, offsets):
+    return list((pd.Timestamp(first_date) + pd.to_timedelta(offsets, unit="D")).strftime("%Y-%m-%d"))
+
+
+def test_long_ranges_are_downsampled_on_the_server(tmp_path):
+    country_names = generate_dataset(str(tmp_path / "data"), country_count=8, day_count=200)
+    config = benchmark_config(str(tmp_path / "data"), str(tmp_path / "cache"), 0)
+    snapshot = SnapshotStore(config, SourceCache.from_config(config), country_names).current
+    selected_countries = country_names[:3]
+    max_points = 10
+
+    series = infection_series(snapshot.infection_modes, selected_countries, max_points=max_points)
+
+    for display_mode in INFECTION_DISPLAY_MODES:
+        figure = build_infections_figure(snapshot.infection_modes, selected_countries, display_mode,
+                                         max_points=max_points)
+
+        for trace, figure_trace in zip(series["data"], figure["data"]):
+            offsets, values = trace["modes"][display_mode]
+
+            assert len(offsets) <= max_points
+            assert offset_dates(series["first_date"], offsets) == list(figure_trace["x"])
+            assert np.allclose(np.asarray(values) / INFECTION_MODE_WINDOWS.get(display_mode, 1), figure_trace["y"])
+
+    series = vaccine_series(snapshot.partial_vaccination_data, snapshot.full_vaccination_data,
+                            snapshot.population_data, selected_countries, max_points=max_points)
+
+    for field_name in ("partial", "full"):
+        figure = build_vaccine_figure(snapshot.partial_vaccination_data, snapshot.full_vaccination_data,
+                                      snapshot.population_data, selected_countries, field_name,
+                                      max_points=max_points)
+
+        for trace, figure_trace in zip(series["data"], figure["data"]):
+            offsets, values = trace["modes"][field_name]
+
+            assert len(offsets) <= max_points
+            assert offset_dates(series["first_date"], offsets) == list(figure_trace["x"])
+            assert np.allclose(values, figure_trace["y"])
@@ -0,0 +1,19 @@
+import numpy as np
+import pandas as pd
+
+from covid_dashboard.metrics import LOOKBACK_DAYS, build_infection_modes, extend_infection_modes
+
+
+def test_extended_totals_share_the_infection_data():
+    dates = pd.date_range("2021-01-01", periods=LOOKBACK_DAYS + 20)
+    infection_data = pd.DataFrame(np.cumsum(np.arange(2 * len(dates)).reshape(2, -1), axis=1),
+                                  index=["Austria", "Germany"], columns=dates)
+    first_new_position = len(dates) - 5
+
+    infection_modes = extend_infection_modes(build_infection_modes(infection_data.iloc[:, :first_new_position]),
+                                             infection_data, first_new_position)
+
+    assert infection_modes["total"] is infection_data
+
+    for display_mode, mode_data in build_infection_modes(infection_data).items():
+        assert np.allclose(infection_modes[display_mode].to_numpy(), mode_data.to_numpy())
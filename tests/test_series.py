@@ -0,0 +1,7 @@
+from covid_dashboard.series import parse_series_query
+
+
+def test_repeated_countries_are_queried_once():
+    query = parse_series_query({"metric": "seven_day_avg_infections", "countries": "Austria, Germany,Austria"})
+
+    assert query["countries"] == ["Austria", "Germany"]
@@ -0,0 +1,78 @@
+import pandas as pd
+import pytest
+
+from benchmarks.bench_dashboard import benchmark_config
+from benchmarks.synthetic import generate_dataset
+from covid_dashboard.cache import SourceCache
+from covid_dashboard.snapshot import SnapshotStore, build_snapshot, load_sources
+
+
+class FailingSourceCache(SourceCache):
+    # loads every source like SourceCache except the ones in failing_sources
+    failing_sources = ()
+
+    def load(self, name, *args, **kwargs):
+        if name in self.failing_sources:
+            raise OSError(f"{name} is down")
+
+        return super().load(name, *args, **kwargs)
+
+
+@pytest.fixture
+def dashboard_data(tmp_path):
+    country_names = generate_dataset(str(tmp_path / "data"), country_count=8, day_count=60)
+    config = benchmark_config(str(tmp_path / "data"), str(tmp_path / "cache"), 0)
+
+    return config, country_names
+
+
+@pytest.mark.parametrize("failing_source", ["infections", "vaccinations", "population"])
+def test_refresh_keeps_the_previous_frames_of_a_failing_source(dashboard_data, failing_source):
+    config, country_names = dashboard_data
+    snapshot_store = SnapshotStore(config, SourceCache.from_config(config), country_names)
+    previous_snapshot = snapshot_store.current
+
+    source_cache = FailingSourceCache.from_config(config)
+    source_cache.failing_sources = {failing_source}
+    sources, load_timings, missing_sources = load_sources(config, source_cache, country_names, force_revalidate=True,
+                                         previous_snapshot=previous_snapshot)
+
+    assert failing_source not in load_timings
+    assert not missing_sources
+    assert all(isinstance(frame, pd.DataFrame) for frame in sources.values())
+
+    snapshot = build_snapshot(sources, "refreshed", previous_snapshot=previous_snapshot,
+                              compact=snapshot_store.compact)
+
+    assert snapshot.infection_data.equals(previous_snapshot.infection_data)
+    assert snapshot.full_vaccination_data.equals(previous_snapshot.full_vaccination_data)
+    assert snapshot.population_data.equals(previous_snapshot.population_data)
+
+
+@pytest.mark.parametrize("failing_source", ["infections", "vaccinations", "population"])
+def test_first_load_serves_a_failing_source_as_missing(dashboard_data, failing_source):
+    config, country_names = dashboard_data
+
+    source_cache = FailingSourceCache.from_config(config)
+    source_cache.failing_sources = {failing_source}
+    snapshot_store = SnapshotStore(config, source_cache, country_names)
+
+    assert list(snapshot_store.current.missing_sources) == [failing_source]
+    assert snapshot_store.current.metric_cube.values.shape[1] == len(country_names)
+
+    # the next refresh loads the source and drops the stand-ins
+    source_cache.failing_sources = ()
+
+    assert snapshot_store.refresh()
+    assert not snapshot_store.current.missing_sources
+
+
+def test_first_load_fails_without_serve_missing_sources(dashboard_data):
+    config, country_names = dashboard_data
+    config["loading"]["serve_missing_sources"] = "no"
+
+    source_cache = FailingSourceCache.from_config(config)
+    source_cache.failing_sources = {"recoveries"}
+
+    with pytest.raises(RuntimeError, match="recoveries"):
+        SnapshotStore(config, source_cache, country_names)
@@ -0,0 +1,7 @@
+from covid_dashboard import create_app
+
+# Production entry point, e.g. `gunicorn -c gunicorn.conf.py wsgi:server`. The gunicorn hooks publish the data
+# snapshot once and every worker maps it instead of downloading and parsing its own copy.
+dashboard_app = create_app(attach_shared_snapshot=True)
+
+server = dashboard_app.server